@@ -0,0 +1,208 @@
+"""
+Admission control for LLM- and voice-backed endpoints.
+
+Every chat, greeting, voice and TTS turn passes two gates before it may call the
+upstreams:
+    - token buckets per client address and per session: session ids are chosen by the
+      client, so the per-address bucket is what a client cannot reset by switching ids
+      (behind a reverse proxy, run uvicorn with --proxy-headers so the address is the client's)
+    - a global cap on concurrently running turns, with a bounded FIFO wait queue
+      whose entries give up after a deadline
+
+Rejections are raised as AdmissionRejected; the API turns them into 429 (rate
+limited) or 503 (overloaded) responses with Retry-After, and into websocket close
+codes. Limits are per worker process. Admitted turns run their blocking upstream
+calls on the API's thread pool (API_WORKER_THREADS, default ADMISSION_MAX_CONCURRENT + 16),
+so the cap is what bounds concurrent upstream work.
+
+Environment:
+    ADMISSION_MAX_CONCURRENT   turns running at once (default 8, 0 = unlimited)
+    ADMISSION_MAX_QUEUE        turns allowed to wait for a slot (default 16)
+    ADMISSION_QUEUE_TIMEOUT    seconds a turn may wait before it is shed (default 10)
+    ADMISSION_USER_RATE        turns per second refilled per session (default 0.5, 0 = off)
+    ADMISSION_USER_BURST       bucket size per session (default 5)
+    ADMISSION_CLIENT_RATE      turns per second refilled per client address (default 2, 0 = off)
+    ADMISSION_CLIENT_BURST     bucket size per client address (default 20)
+    ADMISSION_MAX_USERS        buckets kept before the least recently used are dropped (default 10000)
+"""
+
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+import asyncio
+import math
+import os
+import threading
+import time
+
+from metrics import ADMISSION_ACTIVE, ADMISSION_DECISIONS, ADMISSION_QUEUED, ADMISSION_WAIT
+
+# Websocket close codes: 1013 "Try Again Later" (RFC 6455 registry) and 1008 "Policy Violation"
+WS_CLOSE_OVERLOADED = 1013
+WS_CLOSE_RATE_LIMITED = 1008
+
+
+class AdmissionRejected(Exception):
+    """A turn was refused; `status_code` and `retry_after` describe how to answer."""
+
+    status_code = 503
+    ws_close_code = WS_CLOSE_OVERLOADED
+    reason = "overloaded"
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"detail": str(self), "reason": self.reason, "retry_after": self.retry_after}
+
+
+class RateLimited(AdmissionRejected):
+    status_code = 429
+    ws_close_code = WS_CLOSE_RATE_LIMITED
+    reason = "rate_limited"
+
+
+class Overloaded(AdmissionRejected):
+    pass
+
+
+class TokenBuckets:
+    """Per-key token buckets refilled continuously; idle keys are evicted LRU."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str) -> float:
+        """Take one token; returns 0 on success or the seconds until a token is available."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.pop(key, None) or [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            if tokens >= 1:
+                bucket[:] = [tokens - 1, now]
+                wait = 0.0
+            else:
+                bucket[:] = [tokens, now]
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class AdmissionController:
+    """Token buckets per session and client plus a global concurrency cap with a bounded, deadline-aware queue."""
+
+    def __init__(self, max_concurrent: int = 8, max_queue: int = 16, queue_timeout: float = 10.0,
+                 user_rate: float = 0.5, user_burst: float = 5, max_users: int = 10000,
+                 client_rate: float = 2.0, client_burst: float = 20):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.buckets = TokenBuckets(user_rate, user_burst, max_users) if user_rate > 0 else None
+        self.client_buckets = TokenBuckets(client_rate, client_burst, max_users) if client_rate > 0 else None
+        self.active = 0
+        self._waiters: deque = deque()
+
+    def check_rate(self, user: str, kind: str, client: Optional[str] = None):
+        """Take a token from the client's bucket, then from the user's (session's)."""
+        for buckets, key, scope in ((self.client_buckets, client, "client"), (self.buckets, user, "session")):
+            if buckets is None or not key:
+                continue
+            wait = buckets.take(key)
+            if wait:
+                ADMISSION_DECISIONS.labels(kind, 'rate_limited').inc()
+                raise RateLimited(f"Too many requests for this {scope}, retry in {wait:.1f}s", retry_after=wait)
+
+    async def acquire(self, kind: str):
+        """Take a concurrency slot, waiting in the bounded queue up to queue_timeout."""
+        if not self.max_concurrent or (self.active < self.max_concurrent and not self._waiters):
+            self.active += 1
+            ADMISSION_ACTIVE.inc()
+            return
+        if len(self._waiters) >= self.max_queue:
+            ADMISSION_DECISIONS.labels(kind, 'overloaded').inc()
+            raise Overloaded("Server is at capacity, please retry shortly", retry_after=self._retry_hint())
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        ADMISSION_QUEUED.inc()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                ADMISSION_DECISIONS.labels(kind, 'timeout').inc()
+                raise Overloaded("Timed out waiting for capacity, please retry shortly",
+                                 retry_after=self._retry_hint()) from None
+            raise
+        finally:
+            ADMISSION_QUEUED.dec()
+            ADMISSION_WAIT.labels(kind).observe(time.perf_counter() - started)
+
+    def release(self):
+        """Hand the slot to the oldest live waiter, or free it."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+        ADMISSION_ACTIVE.dec()
+
+    def _retry_hint(self) -> float:
+        return float(max(1, math.ceil(self.queue_timeout / 2)))
+
+    async def enter(self, user: str, kind: str, client: Optional[str] = None):
+        """Rate-limit `client` and `user`, then take a concurrency slot; pair with release()."""
+        self.check_rate(user, kind, client)
+        await self.acquire(kind)
+        ADMISSION_DECISIONS.labels(kind, 'admitted').inc()
+
+    @asynccontextmanager
+    async def admit(self, user: str, kind: str, client: Optional[str] = None):
+        """Hold an admission slot for the block."""
+        await self.enter(user, kind, client)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "user_rate": self.buckets.rate if self.buckets else None,
+            "user_burst": self.buckets.burst if self.buckets else None,
+            "tracked_users": len(self.buckets) if self.buckets else 0,
+            "client_rate": self.client_buckets.rate if self.client_buckets else None,
+            "client_burst": self.client_buckets.burst if self.client_buckets else None,
+            "tracked_clients": len(self.client_buckets) if self.client_buckets else 0,
+        }
+
+
+admission = AdmissionController(
+    max_concurrent=int(os.getenv('ADMISSION_MAX_CONCURRENT', '8')),
+    max_queue=int(os.getenv('ADMISSION_MAX_QUEUE', '16')),
+    queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '10')),
+    user_rate=float(os.getenv('ADMISSION_USER_RATE', '0.5')),
+    user_burst=float(os.getenv('ADMISSION_USER_BURST', '5')),
+    max_users=int(os.getenv('ADMISSION_MAX_USERS', '10000')),
+    client_rate=float(os.getenv('ADMISSION_CLIENT_RATE', '2')),
+    client_burst=float(os.getenv('ADMISSION_CLIENT_BURST', '20')),
+)
@@ -4,6 +4,7 @@ A psychotherapist/companion agent designed to improve elderly wellbeing through
 meaningful conversation and personality understanding.
 """
 
+import copy
 import os
 import json
 from typing import Dict, Any, Optional, List
@@ -16,9 +17,12 @@ import asyncio
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from dotenv import load_dotenv
+from repository.session_store import SessionStore, SessionState, create_session_store
+from repository.personality_store import diff_personality, field_name, format_personality_summary, merge_personality
+from metrics import time_stage, ERRORS
+from scheduler import LLMScheduler, Priority, llm_scheduler
 
 # Load environment variables
 load_dotenv()
@@ -71,13 +75,10 @@ class CVManager:
             return False
 
         # Merge new info; only write if changed
-        has_new_info = False
-        for key, value in new_info.items():
-            if key not in current_personality or current_personality.get(key) != value:
-                has_new_info = True
-                current_personality[key] = value
+        changes = diff_personality(current_personality, new_info)
+        merge_personality(current_personality, changes)
 
-        if has_new_info:
+        if changes:
             self._personality_cache = current_personality
             with open(self.cv_path, 'w') as f:
                 json.dump({"personality": current_personality}, f, indent=2)
@@ -85,20 +86,11 @@ class CVManager:
 
         return False
     
-    def get_personality_summary(self) -> str:
+    def get_personality_summary(self, personality: Optional[Dict[str, Any]] = None) -> str:
         """Get a formatted summary of known personality traits."""
-        personality = self.load_personality()
-        if not personality:
-            return "No personality information recorded yet."
-        
-        summary_parts = []
-        for key, value in personality.items():
-            if isinstance(value, list):
-                summary_parts.append(f"- {key}: {', '.join(value)}")
-            else:
-                summary_parts.append(f"- {key}: {value}")
-        
-        return "\n".join(summary_parts)
+        if personality is None:
+            personality = self.load_personality()
+        return format_personality_summary(personality)
 
 
 class NarrioAgent:
@@ -107,13 +99,23 @@ class NarrioAgent:
     to improve their wellbeing through active listening and therapeutic dialogue.
     """
     
-    def __init__(self, api_key: Optional[str] = None, cv_path: str = "CV.json"):
+    DEFAULT_SESSION = "default"
+    
+    def __init__(self, api_key: Optional[str] = None, cv_path: str = "CV.json",
+                 session_store: Optional[SessionStore] = None, repo=None, llm=None,
+                 scheduler: Optional[LLMScheduler] = None):
         """
         Initialize the Narrio Agent.
         
         Args:
             api_key: Google API key for Gemini. If None, uses GOOGLE_API_KEY env var.
             cv_path: Path to the CV.json file.
+            session_store: Store for conversation history and personality. If None,
+                one is created from the SESSION_STORE env var.
+            repo: MongoRepository whose connection the Mongo session store reuses.
+            llm: Chat model to use instead of Gemini (e.g. a local stand-in for benchmarks).
+            scheduler: Scheduler granting LLM call slots by priority. Defaults to the
+                process-wide scheduler shared by all agents.
         """
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
         if not self.api_key:
@@ -123,7 +125,7 @@ class NarrioAgent:
         self.cv_manager = CVManager(cv_path)
         
         # Initialize the Gemini model
-        self.llm = ChatGoogleGenerativeAI(
+        self.llm = llm or ChatGoogleGenerativeAI(
             model="gemini-2.0-flash",
             google_api_key=self.api_key,
             temperature=0.7,
@@ -131,15 +133,14 @@ class NarrioAgent:
             streaming=True,
         )
         
-        # Initialize conversation memory using ChatMessageHistory
-        self.message_history = ChatMessageHistory()
-        
-        # System prompt for the agent
-        self.system_prompt = self._create_system_prompt()
+        # Conversation history and personality live in the session store so any
+        # worker process can serve any session
+        self.session_store = session_store or create_session_store(cv_manager=self.cv_manager, repo=repo)
+        self.scheduler = scheduler or llm_scheduler
     
-    def _create_system_prompt(self) -> str:
+    def _create_system_prompt(self, personality: Optional[Dict[str, Any]] = None) -> str:
         """Create the system prompt for the agent."""
-        personality_summary = self.cv_manager.get_personality_summary()
+        personality_summary = self.cv_manager.get_personality_summary(personality)
         
         return f"""You are a warm, empathetic companion and psychotherapist dedicated to improving the wellbeing of elderly individuals. Your role is to:
 
@@ -174,19 +175,30 @@ Remember: Your goal is to make them feel comfortable, valued, and engaged in mea
     # NOTE: Removed separate extraction LLM call to reduce latency. Extraction is
     # performed in the same model response as the agent reply (see `chat`).
     
-    def chat(self, user_message: str) -> str:
+    @staticmethod
+    def _to_messages(history: List[Dict[str, str]]) -> List[Any]:
+        """Convert stored history entries into LangChain messages."""
+        return [
+            HumanMessage(content=entry["content"]) if entry["role"] == "human" else AIMessage(content=entry["content"])
+            for entry in history
+        ]
+    
+    def chat(self, user_message: str, session_id: str = DEFAULT_SESSION, priority: Priority = Priority.TEXT) -> str:
         """
         Process a user message and return the agent's response.
         
         Args:
             user_message: The user's message.
+            session_id: The conversation session to read and update.
+            priority: Scheduling class of the LLM call (live voice or live text).
             
         Returns:
             The agent's response.
         """
+        session = self.session_store.load(session_id)
+        
         # Get conversation history and trim to recent messages to reduce tokens
-        chat_history: List[Any] = self.message_history.messages or []
-        recent_history = chat_history[-12:]
+        recent_history = self._to_messages(session.history[-12:])
 
         # We instruct the model to return the natural reply followed by a JSON
         # object (between markers) that contains ONLY NEW personality info.
@@ -203,12 +215,14 @@ Remember: Your goal is to make them feel comfortable, valued, and engaged in mea
             "Do not include any extra text inside the markers — only a valid JSON object."
         )
 
-        messages: List[Any] = [SystemMessage(content=self.system_prompt + instruction_for_extraction)]
+        system_prompt = self._create_system_prompt(session.personality)
+        messages: List[Any] = [SystemMessage(content=system_prompt + instruction_for_extraction)]
         messages.extend(recent_history)
         messages.append(HumanMessage(content=user_message))
 
         # Single LLM call: returns both human-friendly reply and JSON extraction
-        response = self.llm.invoke(messages)
+        with self.scheduler.slot(priority), time_stage('llm'):
+            response = self.llm.invoke(messages)
         full_response = response.content
         
         # response = await self.llm.agenerate([messages])
@@ -217,51 +231,62 @@ Remember: Your goal is to make them feel comfortable, valued, and engaged in mea
 
         # Try to extract the JSON section between the markers
         personality_insights: Dict[str, Any] = {}
-        try:
-            start_idx = full_response.find(PERSONA_START)
-            end_idx = full_response.find(PERSONA_END)
-            if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                json_text = full_response[start_idx + len(PERSONA_START):end_idx].strip()
-                # Remove any code fences
-                json_text = re.sub(r"^```json\\n|```$", "", json_text).strip()
-                if json_text:
-                    personality_insights = json.loads(json_text)
-
-                # The visible reply should exclude the JSON markers and content
-                visible_reply = (full_response[:start_idx] + full_response[end_idx + len(PERSONA_END):]).strip()
-            else:
-                # No markers found: treat entire content as visible reply
+        with time_stage('personality_parse'):
+            try:
+                start_idx = full_response.find(PERSONA_START)
+                end_idx = full_response.find(PERSONA_END)
+                if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
+                    json_text = full_response[start_idx + len(PERSONA_START):end_idx].strip()
+                    # Remove any code fences
+                    json_text = re.sub(r"^```json\\n|```$", "", json_text).strip()
+                    if json_text:
+                        personality_insights = json.loads(json_text)
+
+                    # The visible reply should exclude the JSON markers and content
+                    visible_reply = (full_response[:start_idx] + full_response[end_idx + len(PERSONA_END):]).strip()
+                else:
+                    # No markers found: treat entire content as visible reply
+                    visible_reply = full_response.strip()
+            except Exception as e:
+                ERRORS.labels('personality_parse').inc()
+                print(f"[WARN] Failed to parse personality JSON: {e}")
                 visible_reply = full_response.strip()
-        except Exception as e:
-            print(f"[WARN] Failed to parse personality JSON: {e}")
-            visible_reply = full_response.strip()
-
-        # Update message history with the user message and visible assistant reply
-        self.message_history.add_user_message(user_message)
-        self.message_history.add_ai_message(visible_reply)
 
-        # If new personality info was found, update CV and refresh system prompt
-        if personality_insights:
-            updated = self.cv_manager.update_personality(personality_insights)
-            if updated:
-                print(f"[DEBUG] Updated CV with new personality insights: {list(personality_insights.keys())}")
-                self.system_prompt = self._create_system_prompt()
+        # Record the exchange and any new personality info in one versioned update;
+        # on a concurrent write the session is reloaded and the changes re-applied
+        learned: List[str] = []
+
+        def apply_turn(state: SessionState):
+            state.add_turn(user_message, visible_reply, limit=self.session_store.history_limit)
+            learned.clear()
+            if isinstance(personality_insights, dict) and personality_insights:
+                # Only insights that change the merged profile are written
+                names = {key: field_name(key) for key in personality_insights}
+                merged = {name: copy.deepcopy(state.personality[name]) for name in names.values() if name in state.personality}
+                merge_personality(merged, personality_insights)
+                learned.extend(key for key, name in names.items() if merged.get(name) != state.personality.get(name))
+                if learned:
+                    state.learn({key: personality_insights[key] for key in learned})
+
+        with time_stage('cv_persist'):
+            self.session_store.update(session_id, apply_turn)
+        if learned:
+            print(f"[DEBUG] Updated CV with new personality insights: {learned}")
 
         return visible_reply
     
-    def get_personality_profile(self) -> Dict[str, Any]:
+    def get_personality_profile(self, session_id: str = DEFAULT_SESSION) -> Dict[str, Any]:
         """Get the current personality profile."""
-        return self.cv_manager.load_personality()
+        return self.session_store.load(session_id).personality
     
-    def reset_conversation(self):
+    def reset_conversation(self, session_id: str = DEFAULT_SESSION):
         """Reset the conversation history (but keep personality data)."""
-        self.message_history.clear()
+        self.session_store.reset(session_id)
         print("[INFO] Conversation history cleared.")
     
-    def reset_all(self):
+    def reset_all(self, session_id: str = DEFAULT_SESSION):
         """Reset both conversation and personality data."""
-        self.message_history.clear()
-        self.cv_manager.update_personality({})
+        self.session_store.reset(session_id, clear_personality=True)
         print("[INFO] All data cleared.")
 
 
@@ -0,0 +1,399 @@
+"""
+Incremental columnar export for offline engagement analytics.
+
+Streams circle messages, users, groups, agent conversation turns and voice turn
+traces into Hive-partitioned Parquet files, so turn counts, message volumes per
+circle and session lengths can be queried with pyarrow/pandas/DuckDB without
+touching the serving database:
+
+    <out>/group_messages/date=YYYY-MM-DD/part-<run>.parquet   one row per circle message
+    <out>/session_turns/date=YYYY-MM-DD/part-<run>.parquet    one row per agent conversation message
+    <out>/turn_traces/date=YYYY-MM-DD/part-<run>.parquet      one row per traced turn (TRACE_EXPORT_FILE)
+    <out>/users/snapshot=YYYY-MM-DD/part-<run>.parquet        daily snapshot
+    <out>/groups/snapshot=YYYY-MM-DD/part-<run>.parquet       daily snapshot
+
+A partition whose file had to be closed to bound the number of open writers
+continues in part-<run>-<n>.parquet.
+
+Each run only exports what is new since the previous one, tracked in
+<out>/_export_state.json: per-group message offsets (chats are append-only), the
+conversation time up to which turns were exported and the byte offset into the
+trace log.
+Files are written under temporary names and renamed, and the state is saved
+last, so an interrupted run exports nothing and the next run starts over from
+the same point. Message texts are left out unless --include-text is given.
+
+Requires pyarrow (not needed by the API itself).
+
+Usage (from backend/agent):
+    python analytics_export.py --out /data/narrio-analytics
+    python analytics_export.py --out exports/ --datasets group_messages,session_turns --include-text
+"""
+
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import argparse
+import json
+import os
+import time
+import uuid
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency, only needed by this job
+    pa = pq = None
+
+from repository.mongo_repository import MongoRepository
+
+DATASETS = ("group_messages", "session_turns", "turn_traces", "users", "groups")
+STATE_FILE = "_export_state.json"
+SESSION_TURN_MARGIN = 60.0
+
+
+def _day(timestamp: Any) -> str:
+    """Partition day of an ISO timestamp string, datetime or epoch seconds."""
+    if isinstance(timestamp, datetime):
+        return timestamp.strftime("%Y-%m-%d")
+    if isinstance(timestamp, (int, float)):
+        return datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d")
+    if isinstance(timestamp, str) and len(timestamp) >= 10:
+        return timestamp[:10]
+    return "unknown"
+
+
+def _text_length(value: Any) -> Optional[int]:
+    return len(value) if isinstance(value, str) else None
+
+
+class PartitionedWriter:
+    """
+    Buffers up to `batch_rows` rows across all partitions; when the buffer is full
+    the largest partitions are appended to their Parquet files as row groups. At
+    most `max_open_writers` files are open at a time: the least recently written
+    one is closed, and its partition continues in a new part file if more rows
+    arrive. Memory is bounded by the row buffer plus the open writers.
+    """
+
+    def __init__(self, root: str, dataset: str, schema, partition_key: str, run_id: str, batch_rows: int = 50000,
+                 max_open_writers: int = 64):
+        self.root = root
+        self.dataset = dataset
+        self.schema = schema
+        self.partition_key = partition_key
+        self.run_id = run_id
+        self.batch_rows = batch_rows
+        self.max_open_writers = max(max_open_writers, 1)
+        self.rows = 0
+        self._buffered = 0
+        self._buffers: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._writers: "OrderedDict[str, Any]" = OrderedDict()
+        self._parts: Dict[str, int] = defaultdict(int)
+        self._temp_paths: List[str] = []
+
+    def _path(self, partition: str, part: int = 0) -> str:
+        suffix = f"-{part}" if part else ""
+        return os.path.join(self.root, self.dataset, f"{self.partition_key}={partition}",
+                            f"part-{self.run_id}{suffix}.parquet")
+
+    def add(self, partition: str, row: Dict[str, Any]):
+        self._buffers[partition].append(row)
+        self.rows += 1
+        self._buffered += 1
+        if self._buffered >= self.batch_rows:
+            # Write the largest buffers until at most half of the limit is still held
+            while self._buffered > self.batch_rows // 2:
+                self._flush(max(self._buffers, key=lambda key: len(self._buffers[key])))
+
+    def _flush(self, partition: str):
+        buffer = self._buffers.pop(partition, None)
+        if not buffer:
+            return
+        self._buffered -= len(buffer)
+        writer = self._writers.pop(partition, None)
+        if writer is None:
+            while len(self._writers) >= self.max_open_writers:
+                self._writers.popitem(last=False)[1].close()
+            path = self._path(partition, self._parts[partition]) + ".tmp"
+            self._parts[partition] += 1
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+            self._temp_paths.append(path)
+        self._writers[partition] = writer
+        writer.write_table(pa.Table.from_pylist(buffer, schema=self.schema))
+
+    def close(self) -> List[str]:
+        """Flush every partition, closing each file after its last row group; returns the temporary paths to commit."""
+        for partition in list(self._buffers):
+            self._flush(partition)
+            writer = self._writers.pop(partition, None)
+            if writer is not None:
+                writer.close()
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+        return list(self._temp_paths)
+
+    def abort(self):
+        for writer in self._writers.values():
+            writer.close()
+        for path in self._temp_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        self._writers.clear()
+        self._buffers.clear()
+        self._temp_paths.clear()
+
+
+def _schemas() -> Dict[str, Any]:
+    return {
+        "group_messages": pa.schema([
+            ("group_id", pa.int64()), ("message_id", pa.int64()), ("sender", pa.int64()),
+            ("timestamp", pa.string()), ("text_length", pa.int32()), ("text", pa.string()),
+        ]),
+        "session_turns": pa.schema([
+            ("session_id", pa.string()), ("role", pa.string()), ("at", pa.string()),
+            ("text_length", pa.int32()), ("text", pa.string()),
+        ]),
+        "turn_traces": pa.schema([
+            ("turn_id", pa.string()), ("kind", pa.string()), ("session_id", pa.string()),
+            ("started_at", pa.timestamp("ms")), ("duration", pa.float64()), ("status", pa.string()),
+            ("time_to_first_audio", pa.float64()), ("spans", pa.int32()),
+        ]),
+        "users": pa.schema([
+            ("user_id", pa.int64()), ("name", pa.string()), ("age", pa.int32()),
+            ("sport_preference", pa.string()), ("food_preference", pa.string()),
+            ("groups", pa.list_(pa.int64())), ("personality_keys", pa.int32()),
+        ]),
+        "groups": pa.schema([
+            ("group_id", pa.int64()), ("name", pa.string()), ("category", pa.string()),
+            ("tags", pa.list_(pa.string())), ("membersCount", pa.int32()),
+            ("messageCount", pa.int64()), ("lastActivity", pa.string()),
+        ]),
+    }
+
+
+class AnalyticsExporter:
+    """Runs one incremental export of the selected datasets into `root`."""
+
+    def __init__(self, repo: MongoRepository, root: str, include_text: bool = False,
+                 batch_size: int = 1000, batch_rows: int = 50000, trace_file: Optional[str] = None,
+                 max_open_writers: int = 64):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for the analytics export: pip install -r requirements-optional.txt")
+        self.repo = repo
+        self.root = root
+        self.include_text = include_text
+        self.batch_size = batch_size
+        self.batch_rows = batch_rows
+        self.max_open_writers = max_open_writers
+        self.trace_file = trace_file
+        self.run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        self.schemas = _schemas()
+        self.state = self._load_state()
+
+    def _load_state(self) -> Dict[str, Any]:
+        path = os.path.join(self.root, STATE_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        return {}
+
+    def _save_state(self):
+        path = os.path.join(self.root, STATE_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def _writer(self, dataset: str, partition_key: str = "date") -> PartitionedWriter:
+        return PartitionedWriter(self.root, dataset, self.schemas[dataset], partition_key, self.run_id, self.batch_rows,
+                                 self.max_open_writers)
+
+    # ---- datasets: each fills its writer and returns the state to keep on success ----
+
+    def export_group_messages(self, writer: PartitionedWriter) -> Dict[str, Any]:
+        offsets: Dict[str, int] = dict(self.state.get("group_messages", {}))
+        sizes = self.repo.group_chats.aggregate([
+            {"$project": {"count": {"$size": {"$ifNull": ["$messages", []]}}}}
+        ])
+        for chat in sizes:
+            key = str(chat["_id"])
+            start = offsets.get(key, 0)
+            if chat["count"] < start:
+                # The chat was rewritten (e.g. re-seeded): export it again
+                start = 0
+            if chat["count"] == start:
+                continue
+            document = self.repo.group_chats.find_one(
+                {"_id": chat["_id"]}, {"messages": {"$slice": [start, chat["count"] - start]}}
+            ) or {}
+            for message in document.get("messages", []):
+                writer.add(_day(message.get("timestamp")), {
+                    "group_id": chat["_id"],
+                    "message_id": message.get("id"),
+                    "sender": message.get("sender"),
+                    "timestamp": message.get("timestamp"),
+                    "text_length": _text_length(message.get("text")),
+                    "text": message.get("text") if self.include_text else None,
+                })
+            offsets[key] = start + len(document.get("messages", []))
+        return offsets
+
+    def export_session_turns(self, writer: PartitionedWriter) -> Dict[str, Any]:
+        # Turns are stamped just before their session is saved, so the window closes a
+        # margin before now; later turns are picked up by the next run
+        previous = self.state.get("session_turns", {}).get("cutoff")
+        cutoff = datetime.utcfromtimestamp(time.time() - SESSION_TURN_MARGIN)
+        cutoff_at = cutoff.isoformat(timespec='milliseconds') + 'Z'
+        criteria = {"updated_at": {"$gt": datetime.fromisoformat(previous.rstrip('Z'))}} if previous else {}
+        for session in self.repo.db["agent_sessions"].find(criteria, {"history": 1}).batch_size(self.batch_size):
+            for entry in session.get("history", []):
+                at = entry.get("at")
+                if at is None:
+                    # Entries from before turns were timestamped are exported on the first run only
+                    if previous:
+                        continue
+                elif at > cutoff_at or (previous and at <= previous):
+                    continue
+                writer.add(_day(at), {
+                    "session_id": str(session["_id"]),
+                    "role": entry.get("role"),
+                    "at": at,
+                    "text_length": _text_length(entry.get("content")),
+                    "text": entry.get("content") if self.include_text else None,
+                })
+        return {"cutoff": cutoff_at}
+
+    def export_turn_traces(self, writer: PartitionedWriter) -> Dict[str, Any]:
+        previous = self.state.get("turn_traces", {})
+        if not self.trace_file or not os.path.exists(self.trace_file):
+            return previous
+        offset = previous.get("offset", 0)
+        if os.path.getsize(self.trace_file) < offset:
+            # Log was rotated or truncated
+            offset = 0
+        with open(self.trace_file, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Partially written last line: pick it up next run
+                    break
+                offset += len(line)
+                try:
+                    trace = json.loads(line)
+                except ValueError:
+                    continue
+                started_at = trace.get("started_at")
+                writer.add(_day(started_at), {
+                    "turn_id": trace.get("turn_id"),
+                    "kind": trace.get("kind"),
+                    "session_id": trace.get("session_id"),
+                    "started_at": datetime.utcfromtimestamp(started_at) if started_at else None,
+                    "duration": trace.get("duration"),
+                    "status": trace.get("status"),
+                    "time_to_first_audio": trace.get("time_to_first_audio"),
+                    "spans": len(trace.get("spans") or []),
+                })
+        return {"offset": offset}
+
+    def export_users(self, writer: PartitionedWriter) -> Dict[str, Any]:
+        snapshot = datetime.utcnow().strftime("%Y-%m-%d")
+        projection = {"name": 1, "age": 1, "sport_preference": 1, "food_preference": 1, "groups": 1, "personality": 1}
+        for user in self.repo.iter_documents("users", projection=projection, batch_size=self.batch_size):
+            writer.add(snapshot, {
+                "user_id": user["_id"],
+                "name": user.get("name"),
+                "age": user.get("age"),
+                "sport_preference": user.get("sport_preference"),
+                "food_preference": user.get("food_preference"),
+                "groups": user.get("groups") or [],
+                "personality_keys": len(user.get("personality") or {}),
+            })
+        return {"snapshot": snapshot}
+
+    def export_groups(self, writer: PartitionedWriter) -> Dict[str, Any]:
+        snapshot = datetime.utcnow().strftime("%Y-%m-%d")
+        stats = {
+            chat["_id"]: chat for chat in
+            self.repo.group_chats.find({}, {"messageCount": 1, "lastActivity": 1}).batch_size(self.batch_size)
+        }
+        projection = {"name": 1, "category": 1, "tags": 1, "membersCount": 1}
+        for group in self.repo.iter_documents("groups", projection=projection, batch_size=self.batch_size):
+            chat = stats.get(group["_id"], {})
+            writer.add(snapshot, {
+                "group_id": group["_id"],
+                "name": group.get("name"),
+                "category": group.get("category"),
+                "tags": group.get("tags") or [],
+                "membersCount": group.get("membersCount"),
+                "messageCount": chat.get("messageCount"),
+                "lastActivity": chat.get("lastActivity"),
+            })
+        return {"snapshot": snapshot}
+
+    def run(self, datasets: Iterable[str] = DATASETS) -> Dict[str, int]:
+        """Export the datasets; files and state are committed only if all of them succeed."""
+        exporters: Dict[str, Callable[[PartitionedWriter], Dict[str, Any]]] = {
+            "group_messages": self.export_group_messages,
+            "session_turns": self.export_session_turns,
+            "turn_traces": self.export_turn_traces,
+            "users": self.export_users,
+            "groups": self.export_groups,
+        }
+        os.makedirs(self.root, exist_ok=True)
+        started = time.perf_counter()
+        writers: Dict[str, PartitionedWriter] = {}
+        new_state = dict(self.state)
+        try:
+            for dataset in datasets:
+                if dataset not in exporters:
+                    raise ValueError(f"Unknown dataset: {dataset}")
+                partition_key = "snapshot" if dataset in ("users", "groups") else "date"
+                writers[dataset] = self._writer(dataset, partition_key)
+                new_state[dataset] = exporters[dataset](writers[dataset])
+            pending = [path for writer in writers.values() for path in writer.close()]
+        except BaseException:
+            for writer in writers.values():
+                writer.abort()
+            raise
+        for path in pending:
+            final = path[:-len(".tmp")]
+            if os.path.basename(os.path.dirname(final)).startswith("snapshot="):
+                # One snapshot per day: a later run the same day replaces it
+                for name in os.listdir(os.path.dirname(final)):
+                    if name.endswith(".parquet") and not name.startswith(f"part-{self.run_id}"):
+                        os.remove(os.path.join(os.path.dirname(final), name))
+            os.replace(path, final)
+        new_state["last_run"] = {"run_id": self.run_id, "finished_at": datetime.utcnow().isoformat()}
+        self.state = new_state
+        self._save_state()
+
+        counts = {dataset: writer.rows for dataset, writer in writers.items()}
+        print(f"[INFO] Analytics export {self.run_id} wrote {counts} in {time.perf_counter() - started:.2f}s")
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally export Narrio data to partitioned Parquet")
+    parser.add_argument('--out', default=os.getenv('ANALYTICS_EXPORT_DIR', 'analytics'), help="Output directory (default: ANALYTICS_EXPORT_DIR or ./analytics)")
+    parser.add_argument('--datasets', default=','.join(DATASETS), help="Comma-separated datasets to export")
+    parser.add_argument('--include-text', action='store_true', help="Include message and conversation texts")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Documents per cursor round trip")
+    parser.add_argument('--batch-rows', type=int, default=50000, help="Rows buffered before writing; row groups are at most this size")
+    parser.add_argument('--max-open-writers', type=int, default=64, help="Parquet files kept open per dataset")
+    parser.add_argument('--trace-file', default=os.getenv('TRACE_EXPORT_FILE'), help="Turn trace JSONL log (default: TRACE_EXPORT_FILE)")
+    args = parser.parse_args()
+
+    repo = MongoRepository()
+    try:
+        exporter = AnalyticsExporter(repo, args.out, include_text=args.include_text, batch_size=args.batch_size,
+                                     batch_rows=args.batch_rows, trace_file=args.trace_file,
+                                     max_open_writers=args.max_open_writers)
+        exporter.run([dataset.strip() for dataset in args.datasets.split(',') if dataset.strip()])
+    finally:
+        repo.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,36 +3,70 @@ API wrapper for Narrio Agent.
 Provides a simple interface for frontend integration with voice support.
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, UploadFile, File, WebSocket, WebSocketDisconnect, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response, StreamingResponse
-from pydantic import BaseModel
-from typing import Dict, Any, Optional
-from agent import NarrioAgent
+from fastapi.responses import Response, StreamingResponse, JSONResponse
+from starlette.concurrency import iterate_in_threadpool
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field
+from typing import Annotated, Dict, Any, List, Optional, Tuple, Union
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import asyncio
+import hmac
 import os
 from dotenv import load_dotenv
-from elevenlabs import ElevenLabs
-from elevenlabs.client import ElevenLabs as ElevenLabsClient
-from repository.mongo_repository import MongoRepository
-from services.user_service import get_user_name_by_id, get_user_groups, get_group_chats_with_names, add_message_to_group
+from services.user_service import mongo_repo
+from repository.json_stream import iter_ndjson_chunks, parse_document_id
+from services.user_service import get_user_name_by_id, get_user_groups, get_group_chats_with_names, add_message_to_group, get_group_chats_since, get_group_chats_etag, get_cache_stats
+from services.user_service import search_group_messages, search_user_circles, get_recommended_groups
+from services.user_service import get_user_feed, mark_feed_read, get_group_stats, get_user_wellbeing
+from services.recommendation_service import compute_recommendations, run_recommendation_job, RecommendationJobBusy
 from services.voice_service import voice_service
+from services.realtime_service import sio_app
+from services.bootstrap_service import bootstrap_database, startup_state
+from tracing import tracer
+from session_recorder import recorder
+from profiling import profiler
+from memory_tracker import memory_tracker
+from admission import admission, AdmissionRejected
+from scheduler import Priority, llm_scheduler
+from compression import CompressionMiddleware, compression_options
+from metrics import time_stage, track_in_flight, render_metrics, register_cache_collector, HTTP_DURATION, STAGE_DURATION, ERRORS, IN_FLIGHT
+import math
+import time
 import traceback
 # Load environment variables
 load_dotenv()
 
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..')
+# Blocking upstream calls (STT, LLM, TTS) run on the default executor; every admitted turn
+# holds a thread while it waits, so the pool has to outgrow the admission cap
+WORKER_THREADS = int(os.getenv('API_WORKER_THREADS', str(admission.max_concurrent + 16)))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Seed the database in the background so the server starts accepting requests immediately."""
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix='api-worker'))
+    bootstrap_task = asyncio.create_task(bootstrap_database(
+        mongo_repo,
+        users_file=os.path.join(DATA_DIR, 'users_data.json'),
+        groups_file=os.path.join(DATA_DIR, 'groups_data.json'),
+        chats_file=os.path.join(DATA_DIR, 'chats_data.json')
+    ))
+    recommendation_task = asyncio.create_task(run_recommendation_job(mongo_repo))
+    yield
+    recommendation_task.cancel()
+    bootstrap_task.cancel()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Narrio Companion Agent API",
     description="AI companion/psychotherapist for elderly wellbeing",
-    version="1.0.0"
-)
-
-# Initialize database
-mongo_repo = MongoRepository()
-mongo_repo.initialize_from_files(
-    users_file=os.path.join(os.path.dirname(__file__), '..', 'users_data.json'),
-    groups_file=os.path.join(os.path.dirname(__file__), '..', 'groups_data.json'),
-    chats_file=os.path.join(os.path.dirname(__file__), '..', 'chats_data.json')
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Enable CORS for frontend integration
@@ -44,16 +78,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(CompressionMiddleware, **compression_options())
+
+register_cache_collector(mongo_repo)
+memory_tracker.register_counter('websockets', lambda: len(voice_service.active_connections))
+memory_tracker.register_counter('caches', lambda: {name: stats['size'] for name, stats in mongo_repo.cache_stats().items()})
+memory_tracker.register_counter('trace_window', lambda: tracer.window_count())
+memory_tracker.register_counter('recorder_queue', lambda: recorder.pending())
+memory_tracker.register_counter('sessions', lambda: agent.session_store.session_count() if agent else 0)
+memory_tracker.register_footprint('sessions', lambda: agent.session_store.memory_footprint() if agent else {})
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Track in-flight HTTP requests and their latency per route."""
+    started = time.perf_counter()
+    status = 500
+    with track_in_flight('http'):
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get('route')
+            route_path = route.path if route is not None else 'unmatched'
+            HTTP_DURATION.labels(request.method, route_path, str(status)).observe(time.perf_counter() - started)
+            if status >= 500:
+                ERRORS.labels('http').inc()
+
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Stack-sample selected requests into flamegraph files (off unless configured)."""
+    if not profiler.active:
+        return await call_next(request)
+    return await profiler.profile_request(request, call_next)
+
+
 # Initialize agent (singleton pattern)
 agent = None
 elevenlabs_client = None
 
 
 def get_agent():
-    """Get or create the agent instance."""
+    """Get or create the agent instance (LangChain is imported on first use)."""
     global agent
     if agent is None:
-        agent = NarrioAgent()
+        from agent import NarrioAgent
+        agent = NarrioAgent(repo=mongo_repo)
     return agent
 
 
@@ -64,14 +136,59 @@ def get_elevenlabs_client():
         api_key = os.getenv('ELEVENLABS_API_KEY')
         if not api_key:
             raise ValueError("ELEVENLABS_API_KEY not found in environment variables")
+        from elevenlabs.client import ElevenLabs as ElevenLabsClient
         elevenlabs_client = ElevenLabsClient(api_key=api_key)
         print("[DEBUG] ElevenLabs client initialized")
     return elevenlabs_client
 
 
+def require_token(request: Request, token: Optional[str], header: str, feature: str, setting: str):
+    """Guard an admin endpoint: 404 while `token` is not configured, 403 unless the request sends it in `header`."""
+    if not token:
+        raise HTTPException(status_code=404, detail=f'{feature} is disabled (set {setting})')
+    if not hmac.compare_digest(request.headers.get(header, ''), token):
+        raise HTTPException(status_code=403, detail=f'Invalid {header} header')
+
+
+async def admission_keys(request) -> Tuple[str, str]:
+    """
+    Rate-limit keys (session, client). The session id is client-chosen, so the client
+    address is always limited as well; without a session id both keys are the address.
+    """
+    client = f"client:{request.client.host if request.client else 'unknown'}"
+    session_id = request.query_params.get('session_id')
+    if session_id is None and request.headers.get('content-type', '').startswith('application/json'):
+        try:
+            session_id = (await request.json()).get('session_id')
+        except Exception:
+            session_id = None
+    if session_id and session_id != 'default':
+        return f"session:{session_id}", client
+    return client, client
+
+
+def admitted(kind: str):
+    """Dependency holding an admission slot while an LLM/voice handler runs."""
+    async def dependency(request: Request):
+        user_key, client_key = await admission_keys(request)
+        async with admission.admit(user_key, kind, client_key):
+            yield
+    return dependency
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content=exc.to_dict(),
+        headers={'Retry-After': str(math.ceil(exc.retry_after))}
+    )
+
+
 # Pydantic models for request/response validation
 class ChatRequest(BaseModel):
     message: str
+    session_id: str = "default"
 
 
 class ChatResponse(BaseModel):
@@ -111,15 +228,125 @@ class UserNameResponse(BaseModel):
     success: bool
 
 
+# Mongo _id is an int for seeded documents and an ObjectId for ones created at runtime
+MongoId = Annotated[Union[int, str], BeforeValidator(lambda value: value if isinstance(value, (int, str)) else str(value))]
+
+
+class Group(BaseModel):
+    model_config = ConfigDict(populate_by_name=True, extra='allow')
+    
+    mongo_id: Optional[MongoId] = Field(default=None, alias='_id')
+    id: Optional[int] = None
+    name: str = ''
+    description: str = ''
+    tags: List[str] = []
+    membersCount: int = 0
+    category: Optional[str] = None
+    matchReason: Optional[str] = None
+    memberIds: List[int] = []
+
+
+class ChatMessage(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+    
+    id: int
+    sender: int
+    senderName: Optional[str] = None
+    text: str
+    timestamp: str
+
+
+class GroupChat(BaseModel):
+    model_config = ConfigDict(populate_by_name=True, extra='ignore')
+    
+    mongo_id: Optional[MongoId] = Field(default=None, alias='_id')
+    id: int
+    messages: List[ChatMessage] = []
+
+
 class UserGroupsResponse(BaseModel):
     user_id: int
-    groups: list
+    groups: List[Group]
     success: bool
 
 
 class GroupChatsResponse(BaseModel):
     group_id: int
-    chats: list
+    chats: List[GroupChat]
+    success: bool
+
+
+class SearchHit(ChatMessage):
+    group_id: int
+    score: float
+
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchHit]
+    page: int
+    page_size: int
+    has_more: bool
+    success: bool
+
+
+class RecommendedGroup(Group):
+    score: float
+    matched: List[str] = []
+
+
+class RecommendedGroupsResponse(BaseModel):
+    user_id: int
+    groups: List[RecommendedGroup]
+    computed_at: Optional[datetime] = None
+    success: bool
+
+
+class FeedItem(ChatMessage):
+    group_id: int
+    group_name: str = ''
+
+
+class UserFeedResponse(BaseModel):
+    user_id: int
+    items: List[FeedItem]
+    unread: Dict[int, int]
+    unread_total: int
+    updated_at: Optional[datetime] = None
+    success: bool
+
+
+class GroupStatsResponse(BaseModel):
+    group_id: int
+    membersCount: int
+    messageCount: int
+    messagesPerDay: Dict[str, int]
+    lastActivity: Optional[str] = None
+    success: bool
+
+
+class WellbeingDay(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+    
+    day: str
+    messages: int
+    tokens: int
+    scores: Dict[str, float]
+    mood: Optional[float] = None
+
+
+class WellbeingSummary(BaseModel):
+    days: int
+    messages: int
+    mood: Optional[float] = None
+    scores: Dict[str, float]
+
+
+class WellbeingResponse(BaseModel):
+    user_id: int
+    since: str
+    daily: List[WellbeingDay]
+    summary: WellbeingSummary
     success: bool
 
 
@@ -139,7 +366,7 @@ class AddMessageResponse(BaseModel):
 @app.get('/user/{user_id}/name', response_model=UserNameResponse)
 async def get_user_name(user_id: int):
     """Get user name by ID."""
-    name = get_user_name_by_id(user_id)
+    name = await asyncio.to_thread(get_user_name_by_id, user_id)
     return {
         'user_id': user_id,
         'name': name,
@@ -150,18 +377,100 @@ async def get_user_name(user_id: int):
 @app.get('/user/{user_id}/groups', response_model=UserGroupsResponse)
 async def get_user_groups_endpoint(user_id: int):
     """Get all groups for a user."""
-    groups = get_user_groups(user_id)
+    groups = await asyncio.to_thread(get_user_groups, user_id)
+    return {
+        'user_id': user_id,
+        'groups': groups,
+        'success': True
+    }
+
+
+@app.get('/user/{user_id}/feed', response_model=UserFeedResponse)
+async def get_user_feed_endpoint(user_id: int, limit: int = 50):
+    """Get the newest messages across all of a user's circles, with unread counts per group."""
+    feed = await asyncio.to_thread(get_user_feed, user_id, min(max(limit, 1), 500))
+    return {
+        'user_id': user_id,
+        **feed,
+        'success': True
+    }
+
+
+@app.post('/user/{user_id}/feed/read')
+async def mark_feed_read_endpoint(user_id: int, group_id: Optional[int] = None):
+    """Mark one group (or, without group_id, every group) as read in the user's feed."""
+    await asyncio.to_thread(mark_feed_read, user_id, group_id)
+    return {
+        'user_id': user_id,
+        'group_id': group_id,
+        'success': True
+    }
+
+
+@app.get('/user/{user_id}/wellbeing', response_model=WellbeingResponse)
+async def get_user_wellbeing_endpoint(user_id: int, days: int = 30):
+    """Get a user's daily wellbeing scores (computed offline by score_wellbeing.py) for the last `days` days."""
+    wellbeing = await asyncio.to_thread(get_user_wellbeing, user_id, min(max(days, 1), 366))
+    return {
+        'user_id': user_id,
+        **wellbeing,
+        'success': True
+    }
+
+
+@app.get('/user/{user_id}/recommended-groups', response_model=RecommendedGroupsResponse)
+async def get_recommended_groups_endpoint(user_id: int, limit: int = 5):
+    """Get circles recommended for a user, from the table precomputed by the recommendation job."""
+    groups, computed_at = await asyncio.to_thread(get_recommended_groups, user_id, max(limit, 1))
     return {
         'user_id': user_id,
         'groups': groups,
+        'computed_at': computed_at,
+        'success': True
+    }
+
+
+RECOMMENDATION_REFRESH_TOKEN = os.getenv('RECOMMENDATION_REFRESH_TOKEN')
+
+
+@app.post('/recommendations/refresh')
+async def refresh_recommendations(request: Request):
+    """Recompute group recommendations for all users now (admin; send RECOMMENDATION_REFRESH_TOKEN as X-Admin-Token)."""
+    require_token(request, RECOMMENDATION_REFRESH_TOKEN, 'x-admin-token', 'Recommendation refresh', 'RECOMMENDATION_REFRESH_TOKEN')
+    if not startup_state.ready:
+        raise HTTPException(status_code=503, detail='Database is not ready yet')
+    try:
+        users = await asyncio.to_thread(compute_recommendations, mongo_repo)
+    except RecommendationJobBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        'users': users,
         'success': True
     }
 
 
 @app.get('/group/{group_id}/chats', response_model=GroupChatsResponse)
-async def get_group_chats_endpoint(group_id: int):
-    """Get all chats for a group with user names."""
-    chats = get_group_chats_with_names(group_id)
+async def get_group_chats_endpoint(group_id: int, request: Request, response: Response,
+                                   since_id: Optional[int] = None, since: Optional[str] = None):
+    """
+    Get chats for a group with user names.
+    
+    Pass `since_id` (last seen message id) or `since` (last seen timestamp) to receive
+    only newer messages. Responses carry an ETag; send it back in If-None-Match to get
+    304 Not Modified when nothing changed.
+    """
+    etag = await asyncio.to_thread(get_group_chats_etag, group_id, since_id, since)
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]):
+        return Response(status_code=304, headers={'ETag': etag})
+    
+    if since_id is not None or since:
+        chats = await asyncio.to_thread(get_group_chats_since, group_id, since_id, since)
+    else:
+        chats = await asyncio.to_thread(get_group_chats_with_names, group_id)
+    response.headers['ETag'] = etag
     return {
         'group_id': group_id,
         'chats': chats,
@@ -169,6 +478,19 @@ async def get_group_chats_endpoint(group_id: int):
     }
 
 
+@app.get('/group/{group_id}/stats', response_model=GroupStatsResponse)
+async def get_group_stats_endpoint(group_id: int, days: int = 30):
+    """Get a group's member count, message totals per day and last activity from its maintained counters."""
+    stats = await asyncio.to_thread(get_group_stats, group_id, days)
+    if stats is None:
+        raise HTTPException(status_code=404, detail='Group not found')
+    return {
+        'group_id': group_id,
+        **stats,
+        'success': True
+    }
+
+
 @app.post('/group/{group_id}/message', response_model=AddMessageResponse)
 async def add_message_endpoint(group_id: int, request: AddMessageRequest):
     """Add a new message to a group chat."""
@@ -179,34 +501,210 @@ async def add_message_endpoint(group_id: int, request: AddMessageRequest):
         'text': request.text,
         'timestamp': request.timestamp
     }
-    success = add_message_to_group(group_id, message)
+    success = await add_message_to_group(group_id, message)
     return {
         'success': success,
         'message': 'Message added successfully' if success else 'Failed to add message'
     }
 
 
+@app.get('/group/{group_id}/search', response_model=SearchResponse)
+async def search_group_endpoint(group_id: int, q: str, page: int = 1, page_size: int = 20):
+    """Search a group's messages; results are ranked by relevance, newest first on ties."""
+    q, page, page_size = q.strip(), max(page, 1), min(max(page_size, 1), 100)
+    if not q:
+        raise HTTPException(status_code=400, detail='Query cannot be empty')
+    results, has_more = await asyncio.to_thread(search_group_messages, group_id, q, page, page_size)
+    return {
+        'query': q,
+        'results': results,
+        'page': page,
+        'page_size': page_size,
+        'has_more': has_more,
+        'success': True
+    }
+
+
+@app.get('/user/{user_id}/search', response_model=SearchResponse)
+async def search_user_circles_endpoint(user_id: int, q: str, page: int = 1, page_size: int = 20):
+    """Search messages across all circles (groups) the user belongs to."""
+    q, page, page_size = q.strip(), max(page, 1), min(max(page_size, 1), 100)
+    if not q:
+        raise HTTPException(status_code=400, detail='Query cannot be empty')
+    results, has_more = await asyncio.to_thread(search_user_circles, user_id, q, page, page_size)
+    return {
+        'query': q,
+        'results': results,
+        'page': page,
+        'page_size': page_size,
+        'has_more': has_more,
+        'success': True
+    }
+
+
+EXPORT_TOKEN = os.getenv('EXPORT_TOKEN')
+
+
+@app.get('/export/{collection}')
+async def export_collection(collection: str, request: Request, after: Optional[str] = None,
+                            before: Optional[str] = None, fields: Optional[str] = None,
+                            batch_size: int = 500, limit: int = 0):
+    """
+    Stream a collection as NDJSON in _id order, in constant memory.
+    
+    `fields` is a comma-separated projection. To resume an interrupted export, pass the
+    `_id` of the last line received as `after`; `before` bounds the range from above.
+    Disabled unless EXPORT_TOKEN is set; send it in the X-Export-Token header.
+    """
+    require_token(request, EXPORT_TOKEN, 'x-export-token', 'Export', 'EXPORT_TOKEN')
+    if collection not in mongo_repo.EXPORT_COLLECTIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown collection, expected one of {', '.join(mongo_repo.EXPORT_COLLECTIONS)}")
+    batch_size = min(max(batch_size, 1), 10000)
+    projection = {field.strip(): 1 for field in fields.split(',') if field.strip()} if fields else None
+    documents = mongo_repo.iter_documents(
+        collection,
+        projection=projection,
+        batch_size=batch_size,
+        after=parse_document_id(after) if after else None,
+        before=parse_document_id(before) if before else None,
+        limit=max(limit, 0)
+    )
+    # A sync iterator: Starlette reads the cursor in its threadpool, off the event loop
+    return StreamingResponse(iter_ndjson_chunks(documents, batch_size), media_type='application/x-ndjson')
+
+
 @app.websocket("/ws/voice")
 async def voice_websocket(websocket: WebSocket):
     """WebSocket endpoint for real-time voice communication (STT-LLM-TTS)."""
     client_id = f"client_{id(websocket)}"
     await voice_service.connect(websocket, client_id)
-    try:
-        await voice_service.handle_audio_stream(websocket, client_id)
-    except WebSocketDisconnect:
-        voice_service.disconnect(client_id)
+    with track_in_flight('websocket'):
+        try:
+            await voice_service.handle_audio_stream(websocket, client_id)
+        except WebSocketDisconnect:
+            voice_service.disconnect(client_id)
+
+
+@app.get('/cache/stats')
+async def cache_stats():
+    """Hit/miss metrics for the repository's user and group caches."""
+    return {
+        'caches': get_cache_stats(),
+        'success': True
+    }
 
 
 @app.get('/health', response_model=HealthResponse)
 async def health_check():
-    """Health check endpoint."""
+    """Liveness check: the process is up and serving requests."""
     return {
         'status': 'healthy',
         'service': 'Narrio Companion Agent'
     }
 
 
-@app.post('/chat', response_model=ChatResponse)
+@app.get('/metrics')
+async def metrics():
+    """Prometheus metrics."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get('/traces/voice/summary')
+async def voice_trace_summary():
+    """p50/p95/p99 time from the user's audio arriving to the first audio chunk sent back."""
+    return {
+        **tracer.summary(),
+        'success': True
+    }
+
+
+@app.get('/profiling')
+async def profiling_status():
+    """Profiler configuration and the most recent profiles written."""
+    return {
+        **profiler.status(),
+        'success': True
+    }
+
+
+@app.post('/profiling')
+async def configure_profiling(request: Request, requests: int = 0, sample_rate: Optional[float] = None):
+    """Arm the profiler for the next N requests and/or change the sampling rate."""
+    profiler.require_admin(request.headers)
+    if requests:
+        profiler.arm(requests)
+    profiler.configure(sample_rate)
+    return {
+        **profiler.status(),
+        'success': True
+    }
+
+
+@app.post('/profiling/capture')
+async def capture_profile(request: Request, seconds: float = 10.0):
+    """Profile all threads for a few seconds, e.g. while voice websockets are busy."""
+    profiler.require_admin(request.headers)
+    entry = await profiler.capture(min(max(seconds, 0.1), 300.0))
+    if entry is None:
+        raise HTTPException(status_code=409, detail='A profile is already being captured')
+    return {
+        'profile': entry,
+        'success': True
+    }
+
+
+@app.get('/memory')
+async def memory_report(top_sessions: int = 20):
+    """Live sessions, websockets, buffers and caches, plus tracemalloc growth when tracing."""
+    return {
+        **memory_tracker.report(top_sessions),
+        'success': True
+    }
+
+
+@app.post('/memory/snapshot')
+async def memory_snapshot(request: Request):
+    """
+    Take a tracemalloc snapshot (starting tracing on first use) and diff it by module.
+    Tracing slows every allocation, so this needs the profiling token.
+    """
+    profiler.require_admin(request.headers)
+    snapshot = await asyncio.to_thread(memory_tracker.snapshot)
+    return {
+        **snapshot,
+        'success': True
+    }
+
+
+@app.delete('/memory/snapshot')
+async def stop_memory_tracing(request: Request):
+    """Stop tracemalloc and drop the snapshot baseline."""
+    profiler.require_admin(request.headers)
+    memory_tracker.stop()
+    return {'tracing': False, 'success': True}
+
+
+@app.get('/admission')
+async def admission_stats():
+    """Current admission limits, running and queued turns, and LLM scheduler slots."""
+    return {
+        **admission.stats(),
+        'llm_scheduler': llm_scheduler.stats(),
+        'success': True
+    }
+
+
+@app.get('/ready')
+async def readiness_check():
+    """Readiness check: the database bootstrap has completed."""
+    state = startup_state.to_dict()
+    if not startup_state.ready:
+        return JSONResponse(status_code=503, content={'status': 'starting', **state})
+    return {'status': 'ready', **state}
+
+
+@app.post('/chat', response_model=ChatResponse, dependencies=[Depends(admitted('chat'))])
 async def chat(request: ChatRequest):
     """
     Chat endpoint.
@@ -219,8 +717,11 @@ async def chat(request: ChatRequest):
             raise HTTPException(status_code=400, detail='Message cannot be empty')
         
         # Get agent response
+        started_at, started = time.time(), time.perf_counter()
         agent_instance = get_agent()
-        response = agent_instance.chat(request.message)
+        response = await asyncio.to_thread(agent_instance.chat, request.message, request.session_id)
+        recorder.record('chat', request.session_id, started_at, time.perf_counter() - started,
+                        text=request.message, response_chars=len(response))
         
         return {
             'response': response,
@@ -232,7 +733,7 @@ async def chat(request: ChatRequest):
 
 
 @app.get('/personality', response_model=PersonalityResponse)
-async def get_personality():
+async def get_personality(session_id: str = "default"):
     """
     Get the current personality profile.
     
@@ -240,7 +741,7 @@ async def get_personality():
     """
     try:
         agent_instance = get_agent()
-        personality = agent_instance.get_personality_profile()
+        personality = agent_instance.get_personality_profile(session_id)
         
         return {
             'personality': personality,
@@ -252,7 +753,7 @@ async def get_personality():
 
 
 @app.post('/reset', response_model=MessageResponse)
-async def reset_conversation():
+async def reset_conversation(session_id: str = "default"):
     """
     Reset conversation history (keeps personality data).
     
@@ -260,7 +761,7 @@ async def reset_conversation():
     """
     try:
         agent_instance = get_agent()
-        agent_instance.reset_conversation()
+        agent_instance.reset_conversation(session_id)
         
         return {
             'message': 'Conversation history reset',
@@ -272,7 +773,7 @@ async def reset_conversation():
 
 
 @app.post('/reset-all', response_model=MessageResponse)
-async def reset_all():
+async def reset_all(session_id: str = "default"):
     """
     Reset both conversation and personality data.
     
@@ -280,7 +781,7 @@ async def reset_all():
     """
     try:
         agent_instance = get_agent()
-        agent_instance.reset_all()
+        agent_instance.reset_all(session_id)
         
         return {
             'message': 'All data reset',
@@ -291,17 +792,19 @@ async def reset_all():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get('/greeting', response_model=GreetingResponse)
-async def get_greeting():
+@app.get('/greeting', response_model=GreetingResponse, dependencies=[Depends(admitted('greeting'))])
+async def get_greeting(session_id: str = "default"):
     """
     Get an initial greeting from the agent.
     
     Returns a warm, contextual greeting to start the conversation.
     """
     try:
+        started_at, started = time.time(), time.perf_counter()
         agent_instance = get_agent()
         # Generate a contextual greeting
-        greeting = agent_instance.chat("Hello")
+        greeting = await asyncio.to_thread(agent_instance.chat, "Hello", session_id)
+        recorder.record('greeting', session_id, started_at, time.perf_counter() - started, response_chars=len(greeting))
         
         return {
             'greeting': greeting,
@@ -312,17 +815,20 @@ async def get_greeting():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post('/voice-chat', response_model=VoiceChatResponse)
-async def voice_chat(audio: UploadFile = File(...)):
+@app.post('/voice-chat', response_model=VoiceChatResponse, dependencies=[Depends(admitted('voice_chat'))])
+async def voice_chat(audio: UploadFile = File(...), session_id: str = "default"):
     """
     Voice chat endpoint.
     
     Upload an audio file, get transcription and agent's text response.
     Use /voice-chat-audio for the audio response.
     """
+    buffer = memory_tracker.open_buffer('voice_chat_upload')
     try:
+        started_at, started = time.time(), time.perf_counter()
         # Read audio file
         audio_bytes = await audio.read()
+        buffer.resize(len(audio_bytes))
         print(f"[DEBUG] /voice-chat received audio bytes length: {len(audio_bytes)}")
         if not audio_bytes:
             raise HTTPException(status_code=400, detail="Uploaded audio file is empty. Check client recording settings and mime type.")
@@ -331,10 +837,12 @@ async def voice_chat(audio: UploadFile = File(...)):
         client = get_elevenlabs_client()
         
         # Use the correct parameter name: 'file' not 'audio'
-        result = client.speech_to_text.convert(
-            file=audio_bytes,
-            model_id="scribe_v1"
-        )
+        with time_stage('stt'):
+            result = await asyncio.to_thread(
+                client.speech_to_text.convert,
+                file=audio_bytes,
+                model_id="scribe_v1"
+            )
         
         # Extract text from result
         user_message = result.text if hasattr(result, 'text') else str(result)
@@ -344,7 +852,9 @@ async def voice_chat(audio: UploadFile = File(...)):
         
         # Get agent response
         agent_instance = get_agent()
-        response = agent_instance.chat(user_message)
+        response = await asyncio.to_thread(agent_instance.chat, user_message, session_id, Priority.VOICE)
+        recorder.record('voice_chat', session_id, started_at, time.perf_counter() - started,
+                        text=user_message, audio_bytes=len(audio_bytes), response_chars=len(response))
         
         return {
             'response': response,
@@ -355,6 +865,8 @@ async def voice_chat(audio: UploadFile = File(...)):
         print("[ERROR] Exception in /voice-chat:")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Voice chat error: {str(e)}")
+    finally:
+        buffer.close()
 
 
 @app.websocket("/ws/voice-chat-with-audio")
@@ -364,43 +876,76 @@ async def voice_chat_with_audio_ws(websocket: WebSocket):
     
     Handles continuous conversation - keeps connection open until client disconnects.
     """
-    await websocket.accept()
+    client_id = f"voice_chat_{id(websocket)}"
+    await voice_service.connect(websocket, client_id)
+    session_id = websocket.query_params.get('session_id', 'default')
+    IN_FLIGHT.labels('websocket').inc()
+    buffer = memory_tracker.open_buffer('ws_audio')
+    user_key, client_key = await admission_keys(websocket)
     
+    turn = None
+    holding_slot = False
     try:
         while True:
             # Receive audio bytes from client
             audio_bytes = await websocket.receive_bytes()
+            buffer.resize(len(audio_bytes))
             print(f"[DEBUG] WebSocket received audio bytes length: {len(audio_bytes)}")
             
             if not audio_bytes:
                 await websocket.send_json({"type": "error", "message": "No audio data received"})
                 continue
             
+            # The turn starts when the user's audio has arrived, so queueing for a slot counts towards it
+            turn = tracer.start_turn('voice_ws', session_id, audio_bytes=len(audio_bytes))
+            turn.mark('receive', bytes=len(audio_bytes))
+            
+            try:
+                with turn.span('admission'):
+                    await admission.enter(user_key, 'ws_voice', client_key)
+            except AdmissionRejected as e:
+                turn.status = "rejected"
+                tracer.finish(turn)
+                turn = None
+                await websocket.send_json({"type": "error", "message": str(e), "reason": e.reason, "retry_after": e.retry_after})
+                await websocket.close(code=e.ws_close_code, reason=e.reason)
+                return
+            holding_slot = True
+            
             # Transcribe audio using ElevenLabs
             client = get_elevenlabs_client()
             
-            result = client.speech_to_text.convert(
-                file=audio_bytes,
-                model_id='scribe_v1',
-                file_format='other'  # Let ElevenLabs auto-detect the format
-            )
+            with turn.span('transcribe'), time_stage('stt'):
+                result = await asyncio.to_thread(
+                    client.speech_to_text.convert,
+                    file=audio_bytes,
+                    model_id='scribe_v1',
+                    file_format='other'  # Let ElevenLabs auto-detect the format
+                )
             
             # Extract text from result
             user_message = result.text if hasattr(result, 'text') else str(result)
             
             if not user_message.strip():
-                await websocket.send_json({"type": "error", "message": "Could not transcribe audio"})
+                await websocket.send_json({"type": "error", "message": "Could not transcribe audio", "turn_id": turn.turn_id})
+                turn.status = "empty_transcription"
+                tracer.finish(turn)
+                turn = None
+                admission.release()
+                holding_slot = False
                 continue
             
             # Send transcription to client
-            await websocket.send_json({"type": "transcription", "text": user_message})
+            with turn.span('send_transcription'):
+                await websocket.send_json({"type": "transcription", "text": user_message, "turn_id": turn.turn_id})
             
             # Get agent response
             agent_instance = get_agent()
-            response_text = agent_instance.chat(user_message)
+            with turn.span('llm'):
+                response_text = await asyncio.to_thread(agent_instance.chat, user_message, session_id, Priority.VOICE)
             
             # Send text response to client
-            await websocket.send_json({"type": "response", "text": response_text})
+            await websocket.send_json({"type": "response", "text": response_text, "turn_id": turn.turn_id})
             
             # Remove stage directions (text in parentheses) for TTS
             import re
@@ -408,39 +953,72 @@ async def voice_chat_with_audio_ws(websocket: WebSocket):
             tts_text = re.sub(r'\s+', ' ', tts_text)  # Clean up extra spaces
             
             # Convert response to speech with style interpretation
-            audio_response = client.text_to_speech.convert(
-                voice_id="21m00Tcm4TlvDq8ikWAM",
-                text=tts_text,
-                model_id="eleven_turbo_v2_5",
-                voice_settings={
-                    "stability": 0.5,
-                    "similarity_boost": 0.75,
-                    "style": 0.5,
-                    "use_speaker_boost": True
-                },
-                # text_format = "ssml"
-            )
-            
-            # Stream audio response to client
-            for chunk in audio_response:
-                if chunk:
-                    await websocket.send_bytes(chunk)
+            tts_started = time.perf_counter()
+            with turn.span('tts'):
+                audio_response = await asyncio.to_thread(
+                    client.text_to_speech.convert,
+                    voice_id="21m00Tcm4TlvDq8ikWAM",
+                    text=tts_text,
+                    model_id="eleven_turbo_v2_5",
+                    voice_settings={
+                        "stability": 0.5,
+                        "similarity_boost": 0.75,
+                        "style": 0.5,
+                        "use_speaker_boost": True
+                    },
+                    # text_format = "ssml"
+                )
+                
+                # Stream audio response to client; the SDK reads the HTTP body lazily
+                first_chunk = True
+                audio_bytes_sent = 0
+                async for chunk in iterate_in_threadpool(audio_response):
+                    if chunk:
+                        if first_chunk:
+                            STAGE_DURATION.labels('tts_first_chunk').observe(time.perf_counter() - tts_started)
+                            turn.mark('tts_first_chunk')
+                            first_chunk = False
+                        await websocket.send_bytes(chunk)
+                        audio_bytes_sent += len(chunk)
+                turn.mark('tts_last_chunk', bytes=audio_bytes_sent)
+            STAGE_DURATION.labels('tts_total').observe(time.perf_counter() - tts_started)
             
             # Send completion signal (but don't close connection)
-            await websocket.send_json({"type": "complete"})
+            await websocket.send_json({"type": "complete", "turn_id": turn.turn_id})
+            turn.mark('complete')
+            tracer.finish(turn)
+            recorder.record('ws_voice', session_id, turn.started_at, turn.elapsed(), text=user_message,
+                            audio_bytes=len(audio_bytes), response_chars=len(response_text),
+                            time_to_first_audio=turn.time_to_first_audio, response_audio_bytes=audio_bytes_sent)
+            turn = None
+            admission.release()
+            holding_slot = False
         
     except WebSocketDisconnect:
         print("[DEBUG] WebSocket disconnected by client")
     except Exception as e:
+        ERRORS.labels('voice_ws').inc()
+        if turn is not None:
+            turn.status = "error"
         print("[ERROR] Exception in WebSocket voice-chat-with-audio:")
         traceback.print_exc()
         try:
             await websocket.send_json({"type": "error", "message": str(e)})
         except:
             pass
+    finally:
+        IN_FLIGHT.labels('websocket').dec()
+        voice_service.disconnect(client_id)
+        buffer.close()
+        if holding_slot:
+            admission.release()
+        if turn is not None:
+            if turn.status == "ok":
+                turn.status = "disconnected"
+            tracer.finish(turn)
 
 
-@app.post('/text-to-speech')
+@app.post('/text-to-speech', dependencies=[Depends(admitted('tts'))])
 async def text_to_speech(request: ChatRequest, voice_id: Optional[str] = "21m00Tcm4TlvDq8ikWAM"):
     """
     Convert text to speech.
@@ -454,7 +1032,9 @@ async def text_to_speech(request: ChatRequest, voice_id: Optional[str] = "21m00T
         client = get_elevenlabs_client()
         
         # Convert text to speech
-        audio_response = client.text_to_speech.convert(
+        tts_started = time.perf_counter()
+        audio_response = await asyncio.to_thread(
+            client.text_to_speech.convert,
             voice_id=voice_id,
             text=request.message,
             model_id="eleven_multilingual_v2"
@@ -462,8 +1042,13 @@ async def text_to_speech(request: ChatRequest, voice_id: Optional[str] = "21m00T
         
         # Stream audio response
         def audio_stream():
+            first_chunk = True
             for chunk in audio_response:
+                if first_chunk:
+                    STAGE_DURATION.labels('tts_first_chunk').observe(time.perf_counter() - tts_started)
+                    first_chunk = False
                 yield chunk
+            STAGE_DURATION.labels('tts_total').observe(time.perf_counter() - tts_started)
         
         return StreamingResponse(
             audio_stream(),
@@ -484,7 +1069,7 @@ async def get_voices():
     """
     try:
         client = get_elevenlabs_client()
-        voices = client.voices.get_all()
+        voices = await asyncio.to_thread(client.voices.get_all)
         
         voice_list = [
             {
@@ -517,6 +1102,10 @@ async def get_voices():
         }
 
 
+# Mount Socket.IO app for real-time group chat (must stay after all routes)
+app.mount("/", sio_app)
+
+
 if __name__ == '__main__':
     import uvicorn
     
@@ -530,7 +1119,8 @@ if __name__ == '__main__':
     print("Starting Narrio Agent API Server (FastAPI)...")
     print("Server running on http://localhost:8000")
     print("\nAvailable endpoints:")
-    print("  GET  /health - Health check")
+    print("  GET  /health - Liveness check")
+    print("  GET  /ready - Readiness check")
     print("  POST /chat - Send a message (text)")
     print("  POST /voice-chat - Send audio, get text response")
     print("  POST /voice-chat-with-audio - Send audio, get audio response")
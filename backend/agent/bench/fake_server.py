@@ -0,0 +1,92 @@
+"""
+Boot agent/api.py or backend/main.py against local stand-ins.
+
+Gemini and ElevenLabs are replaced by bench.fakes; MongoDB is either an
+in-memory mongomock instance or a local mongod given by --mongo.
+
+Usage (from backend/agent):
+    python -m bench.fake_server --app agent --port 8100 --llm-latency 0.8
+    python -m bench.fake_server --app backend --port 8101 --mongo mongodb://localhost:27017/
+"""
+
+import argparse
+import os
+import sys
+
+from bench.fakes import FakeElevenLabs, FakeLLM
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.dirname(AGENT_DIR)
+
+
+def use_mongo(target: str):
+    """Point the repositories at an in-memory Mongo ('memory') or a MongoDB URI."""
+    if target == 'memory':
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    else:
+        os.environ['MONGODB_URI'] = target
+
+
+def build_agent_app(args, elevenlabs: FakeElevenLabs):
+    import api
+    from agent import NarrioAgent
+    import services.voice_service as voice_service
+    
+    llm = FakeLLM(latency=args.llm_latency, tokens_per_second=args.llm_tokens_per_second,
+                  reply_tokens=args.llm_reply_tokens, insight_every=args.insight_every)
+    api.agent = NarrioAgent(api_key='fake', repo=api.mongo_repo, llm=llm)
+    api.elevenlabs_client = elevenlabs
+    voice_service.elevenlabs = elevenlabs
+    return api.app
+
+
+def build_backend_app(elevenlabs: FakeElevenLabs):
+    # backend/ has its own `repository` package, so it must come first on the path
+    sys.path.insert(0, BACKEND_DIR)
+    import main
+    import endpoints.voice_endpoint as voice_endpoint
+    voice_endpoint.client = elevenlabs
+    return main.app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a Narrio app against local fake upstreams")
+    parser.add_argument('--app', choices=['agent', 'backend'], default='agent')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--mongo', default='memory', help="'memory' (mongomock) or a MongoDB URI")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="Fixed LLM latency in seconds")
+    parser.add_argument('--llm-tokens-per-second', type=float, default=0.0, help="Simulated generation rate (0 = instant)")
+    parser.add_argument('--llm-reply-tokens', type=int, default=40)
+    parser.add_argument('--insight-every', type=int, default=5, help="Return a personality insight every N calls (0 = never)")
+    parser.add_argument('--stt-latency', type=float, default=0.3)
+    parser.add_argument('--tts-first-chunk-latency', type=float, default=0.2)
+    parser.add_argument('--tts-chunk-interval', type=float, default=0.02)
+    parser.add_argument('--tts-chunks', type=int, default=20)
+    args = parser.parse_args()
+    
+    os.environ.setdefault('GOOGLE_API_KEY', 'fake')
+    os.environ.setdefault('ELEVENLABS_API_KEY', 'fake')
+    # Keep benchmark sessions out of CV.json
+    os.environ.setdefault('SESSION_STORE', 'mongo')
+    # Benchmarks reuse a few sessions at high rates; measure capacity, not the per-user limit
+    os.environ.setdefault('ADMISSION_USER_RATE', '0')
+    os.environ.setdefault('ADMISSION_CLIENT_RATE', '0')
+    use_mongo(args.mongo)
+    
+    elevenlabs = FakeElevenLabs(
+        stt_latency=args.stt_latency,
+        tts_first_chunk_latency=args.tts_first_chunk_latency,
+        tts_chunk_interval=args.tts_chunk_interval,
+        tts_chunks=args.tts_chunks
+    )
+    app = build_agent_app(args, elevenlabs) if args.app == 'agent' else build_backend_app(elevenlabs)
+    
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Deterministic local stand-ins for Gemini and ElevenLabs used by the benchmarks.
+They mimic the parts of the SDK surface the API calls, with configurable latency.
+"""
+
+from types import SimpleNamespace
+from typing import Any, Iterator, List
+import hashlib
+import json
+import time
+
+PERSONA_START = "<<<PERSONALITY_JSON_START>>>"
+PERSONA_END = "<<<PERSONALITY_JSON_END>>>"
+
+_WORDS = (
+    "that sounds lovely tell me more about your garden and the people you shared "
+    "those mornings with did it remind you of home what made you smile today"
+).split()
+
+
+class FakeLLM:
+    """
+    Chat model stand-in with `invoke(messages)`.
+    Latency is a fixed delay plus reply_tokens / tokens_per_second of "generation".
+    Every `insight_every`-th call returns a small personality insight.
+    """
+    
+    def __init__(self, latency: float = 0.5, tokens_per_second: float = 0.0,
+                 reply_tokens: int = 40, insight_every: int = 0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.insight_every = insight_every
+        self.calls = 0
+    
+    def _reply(self, prompt: str) -> str:
+        digest = hashlib.sha1(prompt.encode('utf-8')).digest()
+        return " ".join(_WORDS[(digest[i % len(digest)] + i) % len(_WORDS)] for i in range(self.reply_tokens)).capitalize() + "."
+    
+    def invoke(self, messages: List[Any]) -> SimpleNamespace:
+        self.calls += 1
+        prompt = getattr(messages[-1], 'content', str(messages[-1]))
+        delay = self.latency
+        if self.tokens_per_second > 0:
+            delay += self.reply_tokens / self.tokens_per_second
+        time.sleep(delay)
+        
+        insight = {}
+        if self.insight_every and self.calls % self.insight_every == 0:
+            insight = {"benchmark_topics": [prompt[:40]]}
+        return SimpleNamespace(content=f"{self._reply(prompt)}\n{PERSONA_START}\n{json.dumps(insight)}\n{PERSONA_END}")
+
+
+class FakeSpeechToText:
+    def __init__(self, latency: float = 0.3, transcript: str = "I went for a walk by the lake this morning"):
+        self.latency = latency
+        self.transcript = transcript
+    
+    def convert(self, file: Any = None, **kwargs) -> SimpleNamespace:
+        time.sleep(self.latency)
+        return SimpleNamespace(text=self.transcript)
+
+
+class FakeTextToSpeech:
+    def __init__(self, first_chunk_latency: float = 0.2, chunk_interval: float = 0.02,
+                 chunks: int = 20, chunk_size: int = 4096):
+        self.first_chunk_latency = first_chunk_latency
+        self.chunk_interval = chunk_interval
+        self.chunks = chunks
+        self.chunk = b"\xff\xf3" + b"\x00" * (chunk_size - 2)
+    
+    def convert(self, text: Any = None, **kwargs) -> Iterator[bytes]:
+        time.sleep(self.first_chunk_latency)
+        for idx in range(self.chunks):
+            if idx:
+                time.sleep(self.chunk_interval)
+            yield self.chunk
+    
+    stream = convert
+
+
+class FakeVoices:
+    def get_all(self) -> SimpleNamespace:
+        return SimpleNamespace(voices=[
+            SimpleNamespace(voice_id="21m00Tcm4TlvDq8ikWAM", name="Rachel", category="premade", description="Calm, balanced")
+        ])
+
+
+class FakeElevenLabs:
+    """ElevenLabs client stand-in returning canned transcripts and audio."""
+    
+    def __init__(self, stt_latency: float = 0.3, tts_first_chunk_latency: float = 0.2,
+                 tts_chunk_interval: float = 0.02, tts_chunks: int = 20):
+        self.speech_to_text = FakeSpeechToText(latency=stt_latency)
+        self.text_to_speech = FakeTextToSpeech(
+            first_chunk_latency=tts_first_chunk_latency, chunk_interval=tts_chunk_interval, chunks=tts_chunks
+        )
+        self.voices = FakeVoices()
+
+
+def canned_audio(size: int = 32000) -> bytes:
+    """A deterministic blob standing in for a recorded utterance."""
+    return (b"RIFF" + b"\x00" * (size - 4))[:size]
@@ -0,0 +1,268 @@
+"""
+Replay recorded sessions against the fake upstreams.
+
+Reads the JSONL files written by session_recorder (SESSION_RECORDING_DIR), groups
+turns by session and re-drives every session concurrently, keeping each turn's
+original offset from the start of the recording (scaled by --speed). A turn never
+starts before the previous turn of the same session finished, like a real client.
+Recorded texts (or filler text of the recorded length) and audio sizes are sent
+as-is, so the latency distributions reflect real conversation shapes and can be
+compared between builds.
+
+Usage (from backend/agent):
+    python -m bench.replay recordings/ --output replay.json
+    python -m bench.replay recordings/recordings-20261018.jsonl --speed 4 --compare baseline.json
+    python -m bench.replay recordings/ --url http://127.0.0.1:8100   # already running server
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import signal
+import subprocess
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from bench.fakes import canned_audio
+from bench.run import FAKE_SERVER_OPTIONS, start_server, summarize, wait_until_ready
+from tracing import percentile
+
+REPLAYABLE = ['chat', 'greeting', 'voice_chat', 'ws_voice']
+FALLBACK_TEXT = "I had a nice day today"
+
+
+def load_recordings(paths: List[str]) -> List[Dict[str, Any]]:
+    files: List[str] = []
+    for path in paths:
+        files += sorted(glob.glob(os.path.join(path, 'recordings-*.jsonl'))) if os.path.isdir(path) else [path]
+    events = []
+    for file in files:
+        with open(file) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    event = json.loads(line)
+                    if event.get('endpoint') in REPLAYABLE:
+                        events.append(event)
+    return sorted(events, key=lambda event: event['t'])
+
+
+def turn_text(turn: Dict[str, Any]) -> str:
+    """The recorded text, or filler text of the recorded length when only the length was kept."""
+    if turn.get('text'):
+        return turn['text']
+    chars = turn.get('text_chars') or len(FALLBACK_TEXT)
+    return (FALLBACK_TEXT + ' ') * (chars // (len(FALLBACK_TEXT) + 1)) + FALLBACK_TEXT[:chars % (len(FALLBACK_TEXT) + 1)]
+
+
+def group_sessions(events: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    sessions: Dict[str, List[Dict[str, Any]]] = {}
+    for event in events:
+        sessions.setdefault(event['session'], []).append(event)
+    return sessions
+
+
+def summarize_ms(values: List[float]) -> Dict[str, Optional[float]]:
+    result = summarize(values)
+    ordered = sorted(values)
+    result['p90_ms'] = percentile(ordered, 90) * 1000 if ordered else None
+    return result
+
+
+class Replayer:
+    """Re-drives recorded sessions and collects per-endpoint latencies."""
+
+    def __init__(self, base_url: str, speed: float = 1.0, timeout: float = 60.0):
+        self.base_url = base_url
+        self.speed = speed
+        self.timeout = timeout
+        self.latencies: Dict[str, List[float]] = {}
+        self.recorded: Dict[str, List[float]] = {}
+        self.first_audio: List[float] = []
+        self.errors: Dict[str, int] = {}
+        self.lag: List[float] = []
+
+    async def run(self, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+        origin = events[0]['t']
+        started = time.perf_counter()
+        sessions = group_sessions(events)
+        await asyncio.gather(*(self._replay_session(f"replay-{idx}", turns, origin, started)
+                               for idx, turns in enumerate(sessions.values())))
+        elapsed = time.perf_counter() - started
+
+        endpoints = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            values = self.latencies.get(endpoint, [])
+            endpoints[endpoint] = {
+                'requests': len(values),
+                'errors': self.errors.get(endpoint, 0),
+                'latency': summarize_ms(values),
+                'recorded_latency': summarize_ms(self.recorded.get(endpoint, [])),
+            }
+        report = {
+            'sessions': len(sessions),
+            'turns': len(events),
+            'speed': self.speed,
+            'elapsed_s': elapsed,
+            'schedule_lag': summarize_ms(self.lag),
+            'endpoints': endpoints,
+        }
+        if self.first_audio:
+            report['time_to_first_audio'] = summarize_ms(self.first_audio)
+        return report
+
+    async def _replay_session(self, session_id: str, turns: List[Dict[str, Any]], origin: float, started: float):
+        ws = None
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout) as client:
+            try:
+                for turn in turns:
+                    due = started + (turn['t'] - origin) / self.speed
+                    delay = due - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    else:
+                        self.lag.append(-delay)
+                    endpoint = turn['endpoint']
+                    turn_started = time.perf_counter()
+                    try:
+                        if endpoint == 'ws_voice':
+                            ws = ws or await self._connect_ws(session_id)
+                            await self._ws_turn(ws, turn_started, turn)
+                        else:
+                            await self._http_turn(client, session_id, turn)
+                    except Exception as e:
+                        print(f"[WARN] Replay of {endpoint} failed: {type(e).__name__}: {e}")
+                        self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+                        if ws is not None and endpoint == 'ws_voice':
+                            await ws.close()
+                            ws = None
+                        continue
+                    self.latencies.setdefault(endpoint, []).append(time.perf_counter() - turn_started)
+                    self.recorded.setdefault(endpoint, []).append(turn['latency'])
+            finally:
+                if ws is not None:
+                    await ws.close()
+
+    async def _http_turn(self, client: httpx.AsyncClient, session_id: str, turn: Dict[str, Any]):
+        endpoint = turn['endpoint']
+        if endpoint == 'chat':
+            response = await client.post('/chat', json={'message': turn_text(turn), 'session_id': session_id})
+        elif endpoint == 'greeting':
+            response = await client.get('/greeting', params={'session_id': session_id})
+        else:
+            audio = canned_audio(turn.get('audio_bytes', 32000))
+            response = await client.post('/voice-chat', params={'session_id': session_id},
+                                         files={'audio': ('utterance.wav', audio, 'audio/wav')})
+        response.raise_for_status()
+
+    async def _connect_ws(self, session_id: str):
+        import websockets
+        url = self.base_url.replace('http', 'ws', 1).rstrip('/')
+        return await websockets.connect(f"{url}/ws/voice-chat-with-audio?session_id={session_id}", max_size=None)
+
+    async def _ws_turn(self, ws, started: float, turn: Dict[str, Any]):
+        await ws.send(canned_audio(turn.get('audio_bytes', 32000)))
+        first_audio = None
+        while True:
+            message = await ws.recv()
+            if isinstance(message, bytes):
+                if first_audio is None:
+                    first_audio = time.perf_counter() - started
+                continue
+            payload = json.loads(message)
+            if payload.get('type') == 'complete':
+                break
+            if payload.get('type') == 'error':
+                raise RuntimeError(payload.get('message'))
+        if first_audio is not None:
+            self.first_audio.append(first_audio)
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print p50/p99 deltas per endpoint against a previous replay report."""
+    print("\nComparison with baseline:")
+    for endpoint, current in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(endpoint)
+        if not previous:
+            print(f"  {endpoint:<12} (not in baseline)")
+            continue
+        deltas = []
+        for key in ('p50_ms', 'p90_ms', 'p99_ms'):
+            now, before = current['latency'].get(key), previous['latency'].get(key)
+            if now is not None and before:
+                deltas.append(f"{key[:-3]} {before:.1f}->{now:.1f}ms ({(now - before) / before * 100:+.1f}%)")
+        print(f"  {endpoint:<12} " + "  ".join(deltas))
+
+
+def print_report(report: Dict[str, Any]):
+    fmt = lambda value: f"{value:8.1f}" if value is not None else "       -"
+    print(f"Replayed {report['turns']} turns from {report['sessions']} sessions in {report['elapsed_s']:.1f}s "
+          f"(speed x{report['speed']:g}, p99 schedule lag {fmt(report['schedule_lag']['p99_ms'])}ms)")
+    for endpoint, result in report['endpoints'].items():
+        latency, recorded = result['latency'], result['recorded_latency']
+        print(f"{endpoint:<12} req={result['requests']:<6} err={result['errors']:<4} "
+              f"p50={fmt(latency['p50_ms'])}ms p90={fmt(latency['p90_ms'])}ms p99={fmt(latency['p99_ms'])}ms "
+              f"(recorded p50={fmt(recorded['p50_ms'])}ms)")
+    if 'time_to_first_audio' in report:
+        ttfa = report['time_to_first_audio']
+        print(f"{'ttfa':<12} p50={fmt(ttfa['p50_ms'])}ms p90={fmt(ttfa['p90_ms'])}ms p99={fmt(ttfa['p99_ms'])}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded sessions against local fake upstreams")
+    parser.add_argument('recordings', nargs='+', help="Recording files or directories with recordings-*.jsonl")
+    parser.add_argument('--speed', type=float, default=1.0, help="Time compression factor (2 = twice as fast)")
+    parser.add_argument('--limit', type=int, help="Replay only the first N turns")
+    parser.add_argument('--url', help="Replay against an already running server instead of booting one")
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--timeout', type=float, default=60.0, help="Per-request timeout")
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    parser.add_argument('--compare', help="Previous replay report to compare against")
+    parser.add_argument('--mongo', default='memory', help="'memory' (mongomock) or a MongoDB URI")
+    parser.add_argument('--llm-latency', type=float, default=0.5)
+    parser.add_argument('--llm-tokens-per-second', type=float, default=0.0)
+    parser.add_argument('--llm-reply-tokens', type=int, default=40)
+    parser.add_argument('--insight-every', type=int, default=5)
+    parser.add_argument('--stt-latency', type=float, default=0.3)
+    parser.add_argument('--tts-first-chunk-latency', type=float, default=0.2)
+    parser.add_argument('--tts-chunk-interval', type=float, default=0.02)
+    parser.add_argument('--tts-chunks', type=int, default=20)
+    args = parser.parse_args()
+    args.app = 'agent'
+
+    events = load_recordings(args.recordings)[:args.limit]
+    if not events:
+        parser.error("No replayable turns found in the given recordings")
+
+    server = None
+    base_url = args.url or f"http://127.0.0.1:{args.port}"
+    try:
+        if not args.url:
+            server = start_server(args)
+        wait_until_ready(base_url, args.app)
+        report = asyncio.run(Replayer(base_url, args.speed, args.timeout).run(events))
+    finally:
+        if server:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    report['fakes'] = {option: getattr(args, option) for option in FAKE_SERVER_OPTIONS}
+    print_report(report)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
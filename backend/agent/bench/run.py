@@ -0,0 +1,311 @@
+"""
+Offline load test for the Narrio APIs.
+
+Boots the app against local fake upstreams (see bench.fake_server), drives each
+scenario at a fixed concurrency for a fixed duration and reports p50/p99 latency,
+throughput, errors and server memory. Results can be saved as JSON and compared
+between builds.
+
+Usage (from backend/agent):
+    python -m bench.run --scenarios chat,ws_voice,group_read --concurrency 8 --duration 20
+    python -m bench.run --app backend --scenarios test_write,test_read_all
+    python -m bench.run --url http://127.0.0.1:8100 --scenarios group_read   # already running server
+    python -m bench.run --output results.json --llm-latency 0.8 --llm-tokens-per-second 60
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from bench.fakes import canned_audio
+from tracing import percentile
+
+AGENT_SCENARIOS = ['chat', 'voice_chat', 'ws_voice', 'group_read', 'group_delta', 'group_write']
+BACKEND_SCENARIOS = ['test_write', 'test_read_all']
+FAKE_SERVER_OPTIONS = [
+    'mongo', 'llm_latency', 'llm_tokens_per_second', 'llm_reply_tokens', 'insight_every',
+    'stt_latency', 'tts_first_chunk_latency', 'tts_chunk_interval', 'tts_chunks'
+]
+
+AUDIO = canned_audio()
+_message_ids = itertools.count(10_000)
+
+
+# ========== SCENARIOS ==========
+# Each scenario runs one request and returns extra measurements (or an empty dict).
+
+async def scenario_chat(client: httpx.AsyncClient, worker: int, state: Dict[str, Any]) -> Dict[str, float]:
+    response = await client.post('/chat', json={'message': 'I went for a walk by the lake', 'session_id': f'bench-{worker}'})
+    response.raise_for_status()
+    return {}
+
+
+async def scenario_voice_chat(client: httpx.AsyncClient, worker: int, state: Dict[str, Any]) -> Dict[str, float]:
+    response = await client.post(
+        '/voice-chat', params={'session_id': f'bench-{worker}'},
+        files={'audio': ('utterance.wav', AUDIO, 'audio/wav')}
+    )
+    response.raise_for_status()
+    return {}
+
+
+async def scenario_ws_voice(client: httpx.AsyncClient, worker: int, state: Dict[str, Any]) -> Dict[str, float]:
+    import websockets
+    
+    if 'ws' not in state:
+        url = str(client.base_url).replace('http', 'ws', 1).rstrip('/')
+        state['ws'] = await websockets.connect(f"{url}/ws/voice-chat-with-audio?session_id=bench-{worker}", max_size=None)
+    ws = state['ws']
+    
+    started = time.perf_counter()
+    await ws.send(AUDIO)
+    first_audio = None
+    while True:
+        message = await ws.recv()
+        if isinstance(message, bytes):
+            if first_audio is None:
+                first_audio = time.perf_counter() - started
+            continue
+        payload = json.loads(message)
+        if payload.get('type') == 'complete':
+            break
+        if payload.get('type') == 'error':
+            raise RuntimeError(payload.get('message'))
+    return {'time_to_first_audio': first_audio} if first_audio is not None else {}
+
+
+async def scenario_group_read(client: httpx.AsyncClient, worker: int, state: Dict[str, Any]) -> Dict[str, float]:
+    response = await client.get(f'/group/{worker % 2 * 2}/chats')
+    response.raise_for_status()
+    return {'bytes': len(response.content)}
+
+
+async def scenario_group_delta(client: httpx.AsyncClient, worker: int, state: Dict[str, Any]) -> Dict[str, float]:
+    headers = {'If-None-Match': state['etag']} if 'etag' in state else {}
+    response = await client.get(f'/group/{worker % 2 * 2}/chats', params={'since_id': state.get('since_id', 0)}, headers=headers)
+    if response.status_code != 304:
+        response.raise_for_status()
+        state['etag'] = response.headers.get('etag', '')
+    return {'bytes': len(response.content), 'not_modified': float(response.status_code == 304)}
+
+
+async def scenario_group_write(client: httpx.AsyncClient, worker: int, state: Dict[str, Any]) -> Dict[str, float]:
+    response = await client.post(f'/group/{worker % 2 * 2}/message', json={
+        'id': next(_message_ids), 'sender': worker % 10, 'senderName': 'Bench',
+        'text': 'Benchmark message', 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+    })
+    response.raise_for_status()
+    return {}
+
+
+async def scenario_test_write(client: httpx.AsyncClient, worker: int, state: Dict[str, Any]) -> Dict[str, float]:
+    response = await client.post('/api/test/write', json={'name': f'bench-{worker}', 'message': 'benchmark'})
+    response.raise_for_status()
+    return {}
+
+
+async def scenario_test_read_all(client: httpx.AsyncClient, worker: int, state: Dict[str, Any]) -> Dict[str, float]:
+    response = await client.get('/api/test/all')
+    response.raise_for_status()
+    return {'bytes': len(response.content)}
+
+
+SCENARIOS: Dict[str, Callable] = {
+    name[len('scenario_'):]: func for name, func in globals().items() if name.startswith('scenario_')
+}
+
+
+# ========== DRIVER ==========
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    ordered = sorted(values)
+    return {
+        'p50_ms': percentile(ordered, 50) * 1000 if ordered else None,
+        'p99_ms': percentile(ordered, 99) * 1000 if ordered else None,
+        'mean_ms': sum(ordered) / len(ordered) * 1000 if ordered else None,
+    }
+
+
+async def run_scenario(base_url: str, name: str, concurrency: int, duration: float, timeout: float) -> Dict[str, Any]:
+    scenario = SCENARIOS[name]
+    latencies: List[float] = []
+    extras: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    deadline = time.perf_counter() + duration
+    
+    async def worker(idx: int):
+        state: Dict[str, Any] = {}
+        async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+            try:
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        measurements = await scenario(client, idx, state)
+                    except Exception as e:
+                        key = type(e).__name__
+                        errors[key] = errors.get(key, 0) + 1
+                        state.pop('ws', None)
+                        continue
+                    latencies.append(time.perf_counter() - started)
+                    for key, value in measurements.items():
+                        extras.setdefault(key, []).append(value)
+            finally:
+                if 'ws' in state:
+                    await state['ws'].close()
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(idx) for idx in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    
+    result = {
+        'scenario': name,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+        'latency': summarize(latencies),
+    }
+    if 'time_to_first_audio' in extras:
+        result['time_to_first_audio'] = summarize(extras['time_to_first_audio'])
+    if 'bytes' in extras:
+        result['mean_response_bytes'] = sum(extras['bytes']) / len(extras['bytes'])
+    return result
+
+
+def read_rss_kb(pid: int) -> Optional[int]:
+    """Resident set size of a process in KB (Linux /proc)."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+async def sample_memory(pid: int, samples: List[int], stop: asyncio.Event, interval: float = 0.5):
+    while not stop.is_set():
+        rss = read_rss_kb(pid)
+        if rss is not None:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_server(args) -> subprocess.Popen:
+    command = [sys.executable, '-m', 'bench.fake_server', '--app', args.app, '--port', str(args.port)]
+    for option in FAKE_SERVER_OPTIONS:
+        command += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def wait_until_ready(base_url: str, app: str, timeout: float = 60.0):
+    path = '/ready' if app == 'agent' else '/health'
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(base_url + path, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not become ready within {timeout:.0f}s")
+
+
+async def run_all(args, base_url: str, server_pid: Optional[int]) -> Dict[str, Any]:
+    results = []
+    for name in args.scenarios:
+        memory: List[int] = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_memory(server_pid, memory, stop)) if server_pid else None
+        result = await run_scenario(base_url, name, args.concurrency, args.duration, args.timeout)
+        stop.set()
+        if sampler:
+            await sampler
+            result['server_rss_mb'] = {'peak': max(memory) / 1024, 'end': memory[-1] / 1024} if memory else None
+        results.append(result)
+        print_result(result)
+    return {
+        'app': args.app,
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'fakes': {option: getattr(args, option) for option in FAKE_SERVER_OPTIONS},
+        'results': results,
+    }
+
+
+def print_result(result: Dict[str, Any]):
+    latency = result['latency']
+    fmt = lambda value: f"{value:8.1f}" if value is not None else "       -"
+    line = (f"{result['scenario']:<14} req={result['requests']:<6} err={sum(result['errors'].values()):<4} "
+            f"rps={result['throughput_rps']:7.1f} p50={fmt(latency['p50_ms'])}ms p99={fmt(latency['p99_ms'])}ms")
+    if 'time_to_first_audio' in result:
+        line += f" ttfa_p50={fmt(result['time_to_first_audio']['p50_ms'])}ms"
+    if result.get('server_rss_mb'):
+        line += f" rss_peak={result['server_rss_mb']['peak']:.0f}MB"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Narrio APIs against local fake upstreams")
+    parser.add_argument('--app', choices=['agent', 'backend'], default='agent')
+    parser.add_argument('--url', help="Benchmark an already running server instead of booting one")
+    parser.add_argument('--pid', type=int, help="Server pid for memory sampling when using --url")
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--scenarios', default=None, help="Comma-separated scenarios (default: all for the app)")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Per-request timeout")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--mongo', default='memory', help="'memory' (mongomock) or a MongoDB URI")
+    parser.add_argument('--llm-latency', type=float, default=0.5)
+    parser.add_argument('--llm-tokens-per-second', type=float, default=0.0)
+    parser.add_argument('--llm-reply-tokens', type=int, default=40)
+    parser.add_argument('--insight-every', type=int, default=5)
+    parser.add_argument('--stt-latency', type=float, default=0.3)
+    parser.add_argument('--tts-first-chunk-latency', type=float, default=0.2)
+    parser.add_argument('--tts-chunk-interval', type=float, default=0.02)
+    parser.add_argument('--tts-chunks', type=int, default=20)
+    args = parser.parse_args()
+    
+    default_scenarios = AGENT_SCENARIOS if args.app == 'agent' else BACKEND_SCENARIOS
+    args.scenarios = args.scenarios.split(',') if args.scenarios else default_scenarios
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+    
+    server = None
+    base_url = args.url or f"http://127.0.0.1:{args.port}"
+    try:
+        if not args.url:
+            server = start_server(args)
+        wait_until_ready(base_url, args.app)
+        report = asyncio.run(run_all(args, base_url, server.pid if server else args.pid))
+    finally:
+        if server:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Serialization and compression cost of group chat payloads, per KB of JSON.
+
+Compares, for growing chat histories:
+    untyped_encoder  `chats: list` through jsonable_encoder + json.dumps (the generic path)
+    untyped_core     `chats: list` through pydantic-core validate + dump_json
+    typed_core       GroupChatsResponse (typed models) through validate + dump_json,
+                     which is what FastAPI does for a typed response_model
+    gzip / br        compressing the typed JSON body as CompressionMiddleware does
+
+Usage (from backend/agent):
+    python -m bench.serialization
+    python -m bench.serialization --messages 10,100,1000,10000 --repeat 20 --output serialization.json
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, TypeAdapter
+
+from api import GroupChatsResponse
+from compression import CompressionMiddleware, brotli
+
+
+class UntypedGroupChatsResponse(BaseModel):
+    group_id: int
+    chats: list
+    success: bool
+
+
+def build_payload(messages: int) -> Dict[str, Any]:
+    return {
+        'group_id': 0,
+        'chats': [{
+            '_id': 0,
+            'id': 0,
+            'messages': [{
+                'id': idx,
+                'sender': idx % 10,
+                'senderName': f'Member {idx % 10}',
+                'text': 'Good morning everyone, I tried a new soup recipe yesterday with barley and vegetables.',
+                'timestamp': f'2025-02-14T{8 + idx // 3600 % 12:02d}:{idx // 60 % 60:02d}:{idx % 60:02d}.000Z',
+            } for idx in range(messages)]
+        }],
+        'success': True,
+    }
+
+
+def best_of(func: Callable[[], Any], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def measure(messages: int, repeat: int) -> Dict[str, Any]:
+    payload = build_payload(messages)
+    untyped = TypeAdapter(UntypedGroupChatsResponse)
+    typed = TypeAdapter(GroupChatsResponse)
+    body = typed.dump_json(typed.validate_python(payload), by_alias=True)
+    kb = len(body) / 1024
+    compressor = CompressionMiddleware(None)
+
+    timings = {
+        'untyped_encoder': best_of(lambda: json.dumps(
+            jsonable_encoder(untyped.validate_python(payload)), ensure_ascii=False, separators=(',', ':')
+        ).encode('utf-8'), repeat),
+        'untyped_core': best_of(lambda: untyped.dump_json(untyped.validate_python(payload)), repeat),
+        'typed_core': best_of(lambda: typed.dump_json(typed.validate_python(payload), by_alias=True), repeat),
+        'gzip': best_of(lambda: compressor.compress(body, 'gzip'), repeat),
+    }
+    sizes = {'json': len(body), 'gzip': len(compressor.compress(body, 'gzip'))}
+    if brotli is not None:
+        timings['br'] = best_of(lambda: compressor.compress(body, 'br'), repeat)
+        sizes['br'] = len(compressor.compress(body, 'br'))
+    return {
+        'messages': messages,
+        'json_kb': kb,
+        'us_per_kb': {name: seconds * 1e6 / kb for name, seconds in timings.items()},
+        'bytes': sizes,
+    }
+
+
+def print_results(results: List[Dict[str, Any]]):
+    columns = list(results[0]['us_per_kb'])
+    print(f"{'messages':>9} {'json_kb':>9} " + ' '.join(f"{name:>16}" for name in columns) + "   (us per KB)  gzip ratio")
+    for result in results:
+        ratio = result['bytes']['gzip'] / result['bytes']['json']
+        print(f"{result['messages']:>9} {result['json_kb']:>9.1f} "
+              + ' '.join(f"{result['us_per_kb'][name]:>16.2f}" for name in columns) + f"   {ratio:>22.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure group chat serialization and compression cost per KB")
+    parser.add_argument('--messages', default='10,100,1000,5000', help="Comma-separated message counts")
+    parser.add_argument('--repeat', type=int, default=10, help="Best of N runs per measurement")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = [measure(int(count), args.repeat) for count in args.messages.split(',')]
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
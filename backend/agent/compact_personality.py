@@ -0,0 +1,122 @@
+"""
+Compact learned personality profiles.
+
+Canonicalizes keys, merges list values with set semantics and drops
+near-duplicate entries, then reports the prompt token savings.
+
+MongoDB profiles are only replaced if they still equal the profile that was
+read; profiles learned into meanwhile are skipped until the next run.
+
+--source cv rewrites CV.json directly: run it only while the API is stopped,
+since a running CVManager keeps the profile cached and writes it back on the
+next insight, discarding the compaction.
+
+Usage:
+    python compact_personality.py --source cv --dry-run
+    python compact_personality.py --source mongo --workers 4
+    python compact_personality.py --source mongo --interval 3600   # run hourly
+"""
+
+import argparse
+import json
+import os
+import time
+
+from services.personality_compaction import DEFAULT_SIMILARITY_THRESHOLD, compact_profiles
+
+
+def compact_cv_file(cv_path: str, threshold: float, dry_run: bool) -> list:
+    """Compact the single-user CV.json profile. The API must not be running (see module docs)."""
+    with open(cv_path, 'r') as f:
+        personality = json.load(f).get("personality", {})
+    
+    results = list(compact_profiles([(cv_path, personality)], workers=1, threshold=threshold))
+    if results[0]["changed"] and not dry_run:
+        with open(cv_path, 'w') as f:
+            json.dump({"personality": results[0]["personality"]}, f, indent=2)
+    return results
+
+
+def compact_mongo_profiles(workers: int, threshold: float, dry_run: bool, batch_size: int = 500) -> list:
+    """Compact personalities stored on users and on agent sessions."""
+    from pymongo import UpdateOne
+    from repository.mongo_repository import MongoRepository
+    
+    repo = MongoRepository()
+    results = []
+    try:
+        for collection in (repo.users, repo.db['agent_sessions']):
+            cursor = collection.find({"personality": {"$exists": True, "$ne": {}}}, {"personality": 1},
+                                     batch_size=batch_size)
+            # Profiles read but not yet compacted; compact_profiles keeps this to a small window
+            originals = {}
+            
+            def read_profiles():
+                for document in cursor:
+                    originals[document["_id"]] = document["personality"]
+                    yield document["_id"], document["personality"]
+            
+            updates = []
+            
+            def flush():
+                # Only replace profiles nobody learned into since they were read
+                matched = collection.bulk_write(updates, ordered=False).matched_count
+                if matched < len(updates):
+                    print(f"[WARN] Skipped {len(updates) - matched} profile(s) in {collection.name} "
+                          f"updated while compacting; they are compacted on the next run")
+                updates.clear()
+            
+            for result in compact_profiles(read_profiles(), workers=workers, threshold=threshold):
+                original = originals.pop(result["owner_id"])
+                if result["changed"] and not dry_run:
+                    updates.append(UpdateOne(
+                        {"_id": result["owner_id"], "personality": original},
+                        {"$set": {"personality": result.pop("personality")}}
+                    ))
+                else:
+                    del result["personality"]
+                # Only the counters are kept for the report
+                results.append(result)
+                if len(updates) >= batch_size:
+                    flush()
+            if updates:
+                flush()
+    finally:
+        repo.close()
+    return results
+
+
+def report(results: list, elapsed: float, dry_run: bool):
+    changed = sum(1 for result in results if result["changed"])
+    before = sum(result["tokens_before"] for result in results)
+    after = sum(result["tokens_after"] for result in results)
+    saved = (1 - after / before) * 100 if before else 0.0
+    print(f"[INFO] Compacted {len(results)} profile(s) in {elapsed:.2f}s, {changed} changed{' (dry run)' if dry_run else ''}")
+    print(f"[INFO] Prompt tokens: {before} -> {after} ({saved:.1f}% smaller)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact and deduplicate personality profiles")
+    parser.add_argument('--source', choices=['cv', 'mongo'], default='cv', help="Where profiles are stored (stop the API before compacting cv)")
+    parser.add_argument('--cv-path', default=os.path.join(os.path.dirname(__file__), 'CV.json'), help="CV.json path for --source cv")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Process pool size")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_SIMILARITY_THRESHOLD, help="Similarity above which entries are duplicates")
+    parser.add_argument('--dry-run', action='store_true', help="Report savings without writing")
+    parser.add_argument('--interval', type=float, default=0, help="Repeat every N seconds (0 runs once)")
+    args = parser.parse_args()
+    
+    while True:
+        started = time.perf_counter()
+        if args.source == 'cv':
+            results = compact_cv_file(args.cv_path, args.threshold, args.dry_run)
+        else:
+            results = compact_mongo_profiles(args.workers, args.threshold, args.dry_run)
+        report(results, time.perf_counter() - started, args.dry_run)
+        
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Negotiated response compression.
+
+ASGI middleware that compresses complete (non-streaming) text and JSON responses
+above a size threshold with brotli when the client accepts it and the `brotli`
+package is installed, otherwise gzip. Streaming responses such as TTS audio pass
+through untouched so the first chunk is never delayed.
+
+Environment:
+    COMPRESSION_MIN_SIZE    smallest body in bytes worth compressing (default 1024)
+    COMPRESSION_GZIP_LEVEL  gzip level (default 6)
+    COMPRESSION_BR_QUALITY  brotli quality (default 4; higher is much slower)
+"""
+
+from typing import List, Optional, Tuple
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESSIBLE_TYPES = (b"application/json", b"text/", b"application/javascript", b"image/svg+xml")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick 'br' or 'gzip' from an Accept-Encoding header (q=0 disables a coding)."""
+    accepted = {}
+    for part in accept_encoding.lower().split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip()] = q
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', accepted.get('*', 0)) > 0:
+        return 'gzip'
+    return None
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept = ''
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode('latin-1')
+                break
+        encoding = choose_encoding(accept) if accept else None
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                return await send(message)
+            body = message.get("body", b"")
+            headers: List[Tuple[bytes, bytes]] = list(start_message.get("headers", []))
+            content_type = next((v for k, v in headers if k == b"content-type"), b"")
+            already_encoded = any(k == b"content-encoding" for k, _ in headers)
+            if (message.get("more_body", False) or already_encoded or len(body) < self.minimum_size
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                # Streaming, small or binary: send as-is
+                passthrough = True
+                await send(start_message)
+                return await send(message)
+            compressed = self.compress(body, encoding)
+            headers = [(k, v) for k, v in headers if k != b"content-length"]
+            headers += [(b"content-encoding", encoding.encode()), (b"content-length", str(len(compressed)).encode())]
+            vary = next((v for k, v in headers if k == b"vary"), None)
+            if vary is None:
+                headers.append((b"vary", b"Accept-Encoding"))
+            elif b"accept-encoding" not in vary.lower():
+                headers = [(k, v + b", Accept-Encoding" if k == b"vary" else v) for k, v in headers]
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def compression_options():
+    """Middleware keyword arguments from the environment."""
+    return {
+        'minimum_size': int(os.getenv('COMPRESSION_MIN_SIZE', '1024')),
+        'gzip_level': int(os.getenv('COMPRESSION_GZIP_LEVEL', '6')),
+        'brotli_quality': int(os.getenv('COMPRESSION_BR_QUALITY', '4')),
+    }
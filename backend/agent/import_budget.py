@@ -0,0 +1,74 @@
+"""
+Measure the import time of the API module against a budget.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter, prints the
+slowest imports and fails if the total exceeds the budget or if a module that
+should be deferred (LangChain, ElevenLabs) is imported eagerly.
+
+Usage:
+    python import_budget.py
+    python import_budget.py --module api --budget-ms 800 --top 20
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+DEFERRED_PACKAGES = ('langchain', 'langchain_core', 'langchain_community', 'langchain_google_genai', 'elevenlabs')
+
+
+def measure_imports(module: str):
+    """Return (total_us, [(cumulative_us, self_us, name)]) for importing a module."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+    
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    
+    total_us = sum(self_us for _, self_us, _ in rows)
+    return total_us, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check API import time against a budget")
+    parser.add_argument('--module', default='api', help="Module to import (default: api)")
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('IMPORT_TIME_BUDGET_MS', '1500')),
+                        help="Maximum allowed import time in milliseconds")
+    parser.add_argument('--top', type=int, default=15, help="Number of slowest imports to print")
+    args = parser.parse_args()
+    
+    total_us, rows = measure_imports(args.module)
+    
+    print(f"Slowest imports for '{args.module}' (cumulative ms):")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f}  {name.strip()}")
+    
+    eager = sorted({name.strip() for _, _, name in rows if name.strip().split('.')[0] in DEFERRED_PACKAGES})
+    total_ms = total_us / 1000
+    print(f"\nTotal import time: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    
+    failed = False
+    if eager:
+        print(f"[FAIL] Deferred packages imported eagerly: {', '.join(eager[:10])}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print("[FAIL] Import time exceeds budget")
+        failed = True
+    if not failed:
+        print("[OK] Within budget")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
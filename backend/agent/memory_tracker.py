@@ -0,0 +1,269 @@
+"""
+Memory growth tracking for leak attribution.
+
+Subsystems register cheap counters (live sessions, websockets, caches) and hold
+audio buffers through `track_buffer`, so a report shows what the process is
+holding right now. tracemalloc snapshots are opt-in because tracing slows
+allocation: the first snapshot starts tracing (or MEMORY_TRACKING=1 starts it at
+import), later snapshots are diffed against the previous one and the baseline,
+grouped by module. With MEMORY_SNAPSHOT_INTERVAL set, snapshots are taken in the
+background and per-module growth rates are reported over the retained window.
+
+Environment:
+    MEMORY_TRACKING            start tracemalloc at startup (default off)
+    MEMORY_TRACE_FRAMES        frames kept per allocation traceback (default 1)
+    MEMORY_SNAPSHOT_INTERVAL   seconds between background snapshots (default 0 = off)
+    MEMORY_SNAPSHOT_HISTORY    number of per-module samples kept (default 48)
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+_IGNORED_FILES = (tracemalloc.__file__, "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>", "<unknown>")
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """Approximate retained size of plain containers (dict/list/tuple/set/str/bytes)."""
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def read_rss_kb() -> Optional[int]:
+    """Resident set size of this process in KB (Linux /proc)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class LiveBuffer:
+    """Handle for a buffer counted by MemoryTracker; resize it as the buffer grows."""
+
+    def __init__(self, tracker: 'MemoryTracker', kind: str, size: int = 0):
+        self.tracker = tracker
+        self.kind = kind
+        self.size = size
+        self.closed = False
+        tracker._adjust_buffer(kind, 1, size)
+
+    def resize(self, size: int):
+        if not self.closed:
+            self.tracker._adjust_buffer(self.kind, 0, size - self.size)
+            self.size = size
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.tracker._adjust_buffer(self.kind, -1, -self.size)
+
+
+class MemoryTracker:
+    """Counters, live buffers and module-grouped tracemalloc diffs."""
+
+    def __init__(self, frames: int = 1, history: int = 48, top: int = 25):
+        self.frames = frames
+        self.top = top
+        self.history: deque = deque(maxlen=history)
+        self._counters: Dict[str, Callable[[], Any]] = {}
+        self._footprints: Dict[str, Callable[[], Dict[str, int]]] = {}
+        self._buffers: Dict[str, List[int]] = {}
+        self._baseline: Optional[Dict[str, int]] = None
+        self._previous: Optional[Dict[str, int]] = None
+        self._module_cache: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    # ========== SUBSYSTEM HOOKS ==========
+
+    def register_counter(self, name: str, func: Callable[[], Any]):
+        """Register a cheap callable returning a count (or dict of counts) for reports."""
+        self._counters[name] = func
+
+    def register_footprint(self, name: str, func: Callable[[], Dict[str, int]]):
+        """Register a callable returning approximate bytes held per key (e.g. per session)."""
+        self._footprints[name] = func
+
+    def open_buffer(self, kind: str, size: int = 0) -> 'LiveBuffer':
+        """Count a live buffer until the returned handle is closed."""
+        return LiveBuffer(self, kind, size)
+
+    @contextmanager
+    def track_buffer(self, kind: str, size: int = 0):
+        """Count a live buffer for the duration of the block."""
+        buffer = self.open_buffer(kind, size)
+        try:
+            yield buffer
+        finally:
+            buffer.close()
+
+    def _adjust_buffer(self, kind: str, count: int, size: int):
+        with self._lock:
+            live = self._buffers.setdefault(kind, [0, 0])
+            live[0] += count
+            live[1] += size
+
+    # ========== TRACEMALLOC ==========
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            print(f"[INFO] tracemalloc started ({self.frames} frame(s) per traceback)")
+
+    def stop(self):
+        """Stop tracing and drop the baseline and history."""
+        tracemalloc.stop()
+        with self._lock:
+            self._baseline = self._previous = None
+            self.history.clear()
+
+    def _module_for(self, filename: str) -> str:
+        module = self._module_cache.get(filename)
+        if module is None:
+            path = os.path.abspath(filename)
+            best = ''
+            for entry in sys.path:
+                entry = os.path.abspath(entry or '.')
+                if path.startswith(entry + os.sep) and len(entry) > len(best):
+                    best = entry
+            relative = path[len(best) + 1:] if best else os.path.basename(path)
+            parts = os.path.splitext(relative)[0].split(os.sep)
+            if parts[-1] == '__init__':
+                parts.pop()
+            module = '.'.join(parts[:2]) or filename
+            self._module_cache[filename] = module
+        return module
+
+    def _group_by_module(self, snapshot) -> Dict[str, int]:
+        totals: Dict[str, int] = {}
+        for stat in snapshot.statistics('filename'):
+            filename = stat.traceback[0].filename
+            if filename in _IGNORED_FILES:
+                continue
+            module = self._module_for(filename)
+            totals[module] = totals.get(module, 0) + stat.size
+        return totals
+
+    def _diff(self, current: Dict[str, int], before: Dict[str, int]) -> List[Dict[str, Any]]:
+        rows = [
+            {'module': module, 'size_kb': current.get(module, 0) / 1024,
+             'delta_kb': (current.get(module, 0) - before.get(module, 0)) / 1024}
+            for module in set(current) | set(before)
+        ]
+        rows.sort(key=lambda row: abs(row['delta_kb']), reverse=True)
+        return rows[:self.top]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Take a snapshot (starting tracemalloc if needed) and diff it by module."""
+        self.start()
+        gc.collect()
+        totals = self._group_by_module(tracemalloc.take_snapshot())
+        traced, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            previous = self._previous
+            if self._baseline is None:
+                self._baseline = totals
+            self._previous = totals
+            self.history.append((time.time(), totals))
+        return {
+            'taken_at': time.time(),
+            'traced_kb': traced / 1024,
+            'peak_kb': peak / 1024,
+            'since_previous': self._diff(totals, previous) if previous is not None else [],
+            'since_baseline': self._diff(totals, self._baseline),
+        }
+
+    def growth(self) -> List[Dict[str, Any]]:
+        """Per-module growth rate between the oldest and newest retained snapshot."""
+        with self._lock:
+            if len(self.history) < 2:
+                return []
+            (first_at, first), (last_at, last) = self.history[0], self.history[-1]
+        hours = max((last_at - first_at) / 3600, 1e-9)
+        rows = [
+            {'module': module, 'size_kb': last.get(module, 0) / 1024,
+             'kb_per_hour': (last.get(module, 0) - first.get(module, 0)) / 1024 / hours}
+            for module in set(first) | set(last)
+        ]
+        rows.sort(key=lambda row: row['kb_per_hour'], reverse=True)
+        return rows[:self.top]
+
+    def start_background_snapshots(self, interval: float):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.snapshot()
+                except Exception as e:
+                    print(f"[WARN] Background memory snapshot failed: {e}")
+        threading.Thread(target=loop, name="memory-snapshots", daemon=True).start()
+
+    # ========== REPORT ==========
+
+    def report(self, sessions: int = 20) -> Dict[str, Any]:
+        """Counters, live buffers, largest footprints and tracemalloc state."""
+        counters = {}
+        for name, func in self._counters.items():
+            try:
+                counters[name] = func()
+            except Exception as e:
+                counters[name] = f"error: {e}"
+        footprints = {}
+        for name, func in self._footprints.items():
+            try:
+                sizes = func()
+            except Exception as e:
+                footprints[name] = {'error': str(e)}
+                continue
+            largest = sorted(sizes.items(), key=lambda item: item[1], reverse=True)[:sessions]
+            footprints[name] = {
+                'count': len(sizes),
+                'total_kb': sum(sizes.values()) / 1024,
+                'largest': [{'key': key, 'size_kb': size / 1024} for key, size in largest],
+            }
+        with self._lock:
+            buffers = {kind: {'count': count, 'bytes': size} for kind, (count, size) in self._buffers.items()}
+        result = {
+            'rss_kb': read_rss_kb(),
+            'gc_objects': len(gc.get_objects()),
+            'counters': counters,
+            'buffers': buffers,
+            'footprints': footprints,
+            'tracing': self.tracing,
+        }
+        if self.tracing:
+            traced, peak = tracemalloc.get_traced_memory()
+            result.update({'traced_kb': traced / 1024, 'peak_kb': peak / 1024,
+                           'snapshots': len(self.history), 'growth': self.growth()})
+        return result
+
+
+memory_tracker = MemoryTracker(
+    frames=int(os.getenv('MEMORY_TRACE_FRAMES', '1')),
+    history=int(os.getenv('MEMORY_SNAPSHOT_HISTORY', '48')),
+)
+if os.getenv('MEMORY_TRACKING', '').lower() in ('1', 'true', 'yes'):
+    memory_tracker.start()
+if float(os.getenv('MEMORY_SNAPSHOT_INTERVAL', '0')) > 0:
+    memory_tracker.start_background_snapshots(float(os.getenv('MEMORY_SNAPSHOT_INTERVAL')))
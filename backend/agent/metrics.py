@@ -0,0 +1,150 @@
+"""
+Prometheus metrics for the agent API and the backend API (backend/main.py).
+
+Stage histograms cover the voice/chat pipeline (STT, LLM, personality parsing and
+persistence, TTS) and the MongoRepository query methods. Recording a sample is a
+perf_counter call and a histogram observe, so instrumentation stays cheap on the
+hot path. Set PROMETHEUS_MULTIPROC_DIR to aggregate across uvicorn workers.
+"""
+
+from contextlib import contextmanager
+from typing import Callable
+import functools
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0, 30.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+STAGE_DURATION = Histogram(
+    'narrio_stage_duration_seconds', 'Duration of voice and chat pipeline stages',
+    ['stage'], buckets=LATENCY_BUCKETS
+)
+MONGO_DURATION = Histogram(
+    'narrio_mongo_operation_duration_seconds', 'Duration of MongoRepository methods',
+    ['method'], buckets=DB_BUCKETS
+)
+HTTP_DURATION = Histogram(
+    'narrio_http_request_duration_seconds', 'Duration of HTTP requests',
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS
+)
+ERRORS = Counter('narrio_errors_total', 'Errors by pipeline stage or component', ['stage'])
+IN_FLIGHT = Gauge(
+    'narrio_in_flight', 'HTTP requests and websocket sessions currently being served',
+    ['kind'], multiprocess_mode='livesum'
+)
+ADMISSION_DECISIONS = Counter(
+    'narrio_admission_decisions_total', 'Admission outcomes for LLM/voice turns',
+    ['kind', 'outcome']
+)
+ADMISSION_ACTIVE = Gauge(
+    'narrio_admission_active', 'Turns holding an upstream concurrency slot', multiprocess_mode='livesum'
+)
+ADMISSION_QUEUED = Gauge(
+    'narrio_admission_queued', 'Turns waiting for an upstream concurrency slot', multiprocess_mode='livesum'
+)
+ADMISSION_WAIT = Histogram(
+    'narrio_admission_wait_seconds', 'Time turns spent queued for a concurrency slot',
+    ['kind'], buckets=LATENCY_BUCKETS
+)
+LLM_ACTIVE = Gauge(
+    'narrio_llm_active', 'LLM calls running per priority class', ['priority'], multiprocess_mode='livesum'
+)
+LLM_QUEUE_WAIT = Histogram(
+    'narrio_llm_queue_wait_seconds', 'Time LLM calls waited for a scheduler slot',
+    ['priority'], buckets=LATENCY_BUCKETS
+)
+
+
+@contextmanager
+def time_stage(stage: str):
+    """Record the duration of a pipeline stage and count it as an error if it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.labels(stage).inc()
+        raise
+    finally:
+        STAGE_DURATION.labels(stage).observe(time.perf_counter() - started)
+
+
+@contextmanager
+def track_in_flight(kind: str):
+    """Count a request or connection as in flight while the block runs."""
+    gauge = IN_FLIGHT.labels(kind)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def _timed_method(name: str, method: Callable) -> Callable:
+    histogram = MONGO_DURATION.labels(name)
+    errors = ERRORS.labels(f"mongo.{name}")
+    
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started)
+    return wrapper
+
+
+def instrument_methods(cls):
+    """
+    Class decorator timing the public query methods into the Mongo operation
+    histogram. Methods named in the class's _UNTIMED_METHODS (cache bookkeeping,
+    methods returning lazy cursors, bulk jobs) are left alone.
+    """
+    untimed = getattr(cls, '_UNTIMED_METHODS', ())
+    for name, attr in list(vars(cls).items()):
+        if name in untimed:
+            continue
+        if callable(attr) and not name.startswith('_') and not isinstance(attr, (staticmethod, classmethod, type)):
+            setattr(cls, name, _timed_method(name, attr))
+    return cls
+
+
+class CacheCollector:
+    """Exports hit/miss counters of a repository's read-through caches."""
+    
+    def __init__(self, repo):
+        self.repo = repo
+    
+    def collect(self):
+        hits = CounterMetricFamily('narrio_cache_hits', 'Repository cache hits', labels=['cache'])
+        misses = CounterMetricFamily('narrio_cache_misses', 'Repository cache misses', labels=['cache'])
+        size = GaugeMetricFamily('narrio_cache_entries', 'Repository cache entries', labels=['cache'])
+        for name, stats in self.repo.cache_stats().items():
+            hits.add_metric([name], stats['hits'])
+            misses.add_metric([name], stats['misses'])
+            size.add_metric([name], stats['size'])
+        yield hits
+        yield misses
+        yield size
+
+
+def register_cache_collector(repo):
+    REGISTRY.register(CacheCollector(repo))
+
+
+def render_metrics() -> tuple:
+    """Return (body, content type) in the Prometheus text format."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,301 @@
+"""
+Sampling request profiler.
+
+A background thread samples the Python stacks of the thread serving a request
+(sys._current_frames) every PROFILE_INTERVAL seconds, together with the busy
+worker threads that blocking calls are offloaded to (asyncio.to_thread and
+Starlette's threadpool), and writes the aggregated
+stacks as collapsed-stack files (flamegraph.pl / speedscope / inferno input) plus
+a self-contained SVG flamegraph into PROFILE_DIR.
+
+A request is profiled when one of these applies:
+    - PROFILE_SAMPLE_RATE > 0 and the request is picked at random
+    - the request carries `X-Profile: <PROFILE_TOKEN>` (header trigger is off without a token)
+    - the next N requests were armed through the admin endpoint
+
+The admin endpoints (arming, sample rate, process captures) need the same token
+and are disabled when PROFILE_TOKEN is unset.
+
+When none of them is configured the middleware costs one attribute check per request.
+Worker threads are shared, so under concurrent load a request's profile also holds
+samples of work done for other requests; stacks are prefixed with the thread name.
+
+Environment:
+    PROFILE_SAMPLE_RATE  fraction of requests to profile (default 0)
+    PROFILE_TOKEN        value of the X-Profile header that triggers a profile and
+                         authorizes admin calls
+    PROFILE_DIR          output directory (default ./profiles, git-ignored)
+    PROFILE_INTERVAL     seconds between stack samples (default 0.005; the sampler also
+                         needs the GIL, so effective resolution is ~sys.getswitchinterval())
+    PROFILE_FORMATS      comma-separated 'folded' and/or 'svg' (default both)
+"""
+
+from collections import Counter, deque
+from html import escape
+from typing import Any, Dict, Iterable, List, Optional
+import asyncio
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from fastapi import HTTPException
+
+PROFILE_HEADER = "x-profile"
+# Threads blocking work runs on: the API's default executor and Starlette's (anyio) threadpool
+WORKER_THREAD_PREFIXES = ("api-worker", "AnyIO worker thread")
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    path = code.co_filename.replace('\\', '/').split('/')
+    return f"{name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame) -> str:
+    """Root-first, semicolon-separated stack of a frame."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame).replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+def _idle(frame) -> bool:
+    """Whether a pool worker is parked waiting for work rather than running some."""
+    code = frame.f_code
+    if code.co_name == "_worker" and code.co_filename.endswith("thread.py"):
+        return True  # concurrent.futures worker blocked in SimpleQueue.get (C code)
+    caller = frame.f_back
+    return (code.co_name == "wait" and code.co_filename.endswith("threading.py")
+            and caller is not None and caller.f_code.co_name == "get" and caller.f_code.co_filename.endswith("queue.py"))
+
+
+class StackSampler:
+    """
+    Samples the stacks of the given threads (or all threads) until stopped. Threads
+    whose name starts with one of `thread_prefixes` are sampled too while busy.
+    """
+
+    def __init__(self, thread_ids: Optional[Iterable[int]] = None, interval: float = 0.005,
+                 thread_prefixes: Iterable[str] = ()):
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.thread_prefixes = tuple(thread_prefixes)
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> 'StackSampler':
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self) -> float:
+        self._stop.set()
+        self._thread.join()
+        return time.perf_counter() - self.started
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        labelled = self.thread_ids is None or bool(self.thread_prefixes)
+        while True:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                if labelled and thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                if self.thread_ids is not None and thread_id not in self.thread_ids:
+                    name = names.get(thread_id, "")
+                    if not (self.thread_prefixes and name.startswith(self.thread_prefixes)) or _idle(frame):
+                        continue
+                if labelled:
+                    self.stacks[f"{names.get(thread_id, thread_id)};{collapse_stack(frame)}"] += 1
+                else:
+                    self.stacks[collapse_stack(frame)] += 1
+            self.samples += 1
+            if self._stop.wait(self.interval):
+                break
+
+
+def render_folded(stacks: Counter) -> str:
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def render_svg(stacks: Counter, title: str, width: int = 1200, row_height: int = 16) -> str:
+    """Minimal flamegraph: one rect per frame, width proportional to samples."""
+    root: Dict[str, Any] = {'children': {}, 'count': 0}
+    for stack, count in stacks.items():
+        node = root
+        node['count'] += count
+        for label in stack.split(';'):
+            node = node['children'].setdefault(label, {'children': {}, 'count': 0})
+            node['count'] += count
+    total = root['count'] or 1
+    frames: List[tuple] = []
+
+    def walk(node, x: float, depth: int):
+        for label, child in sorted(node['children'].items()):
+            w = child['count'] / total * width
+            if w >= 0.5:
+                frames.append((x, w, depth, label, child['count']))
+                walk(child, x, depth + 1)
+            x += w
+
+    walk(root, 0.0, 0)
+    height = (max((f[2] for f in frames), default=0) + 2) * row_height + 24
+    rects = []
+    for x, w, depth, label, count in frames:
+        y = height - (depth + 1) * row_height
+        hue = 20 + sum(map(ord, label.split(' (')[0])) % 40
+        tip = escape(f"{label} - {count} samples ({count / total:.1%})")
+        text = escape(label) if w > 40 else ''
+        rects.append(
+            f'<g><title>{tip}</title><rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" '
+            f'fill="hsl({hue},90%,60%)"/><text x="{x + 3:.1f}" y="{y + row_height - 4}" '
+            f'textLength="{max(w - 6, 0):.0f}" lengthAdjust="spacingAndGlyphs">{text}</text></g>'
+        )
+    body = '\n'.join(rects)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">\n'
+        f'<text x="4" y="16" font-size="13">{escape(title)} ({total} samples)</text>\n{body}\n</svg>\n'
+    )
+
+
+class RequestProfiler:
+    """Decides which requests to profile and writes their profiles to disk."""
+
+    def __init__(self, directory: str = "profiles", sample_rate: float = 0.0, token: Optional[str] = None,
+                 interval: float = 0.005, formats: Iterable[str] = ("folded", "svg"), history: int = 50):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.token = token
+        self.interval = interval
+        self.formats = set(formats)
+        self.recent: deque = deque(maxlen=history)
+        self._armed = 0
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()
+        self._refresh()
+
+    def _refresh(self):
+        self.active = bool(self.sample_rate > 0 or self.token or self._armed)
+
+    def arm(self, requests: int):
+        """Profile the next `requests` requests regardless of sampling."""
+        with self._lock:
+            self._armed += requests
+            self._refresh()
+
+    def configure(self, sample_rate: Optional[float] = None):
+        if sample_rate is not None:
+            self.sample_rate = max(0.0, min(sample_rate, 1.0))
+        self._refresh()
+
+    def should_profile(self, headers) -> Optional[str]:
+        """Reason for profiling this request, or None. Armed requests are only used up by take_armed."""
+        if self.token and headers.get(PROFILE_HEADER) == self.token:
+            return "header"
+        if self._armed:
+            return "armed"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    def take_armed(self):
+        """Count one armed request as profiled."""
+        with self._lock:
+            if self._armed:
+                self._armed -= 1
+                self._refresh()
+
+    def start(self, thread_ids: Optional[Iterable[int]] = None,
+              thread_prefixes: Iterable[str] = ()) -> Optional[StackSampler]:
+        """Start sampling unless another profile is already running (profiles never overlap)."""
+        if not self._busy.acquire(blocking=False):
+            return None
+        return StackSampler(thread_ids, self.interval, thread_prefixes).start()
+
+    def finish(self, sampler: StackSampler, name: str, reason: str, **attributes) -> Dict[str, Any]:
+        try:
+            duration = sampler.stop()
+        finally:
+            self._busy.release()
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_') or 'root'
+        base = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}.{int(time.time() * 1000) % 1000:03d}-{slug}-{duration * 1000:.0f}ms-{reason}")
+        entry = {"name": name, "reason": reason, "duration_ms": duration * 1000,
+                 "samples": sampler.samples, "files": [], **attributes}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if "folded" in self.formats:
+                with open(base + ".folded", 'w') as f:
+                    f.write(render_folded(sampler.stacks))
+                entry["files"].append(base + ".folded")
+            if "svg" in self.formats:
+                with open(base + ".svg", 'w') as f:
+                    f.write(render_svg(sampler.stacks, f"{name} [{reason}] {duration * 1000:.0f}ms"))
+                entry["files"].append(base + ".svg")
+        except OSError as e:
+            print(f"[WARN] Failed to write profile {base}: {e}")
+        self.recent.append(entry)
+        print(f"[INFO] Profiled {name} ({reason}, {duration * 1000:.0f}ms, {sampler.samples} samples)")
+        return entry
+
+    def authorized(self, headers) -> bool:
+        """Admin calls need a configured token, sent in the X-Profile header."""
+        return bool(self.token) and headers.get(PROFILE_HEADER) == self.token
+
+    def require_admin(self, headers):
+        """Reject admin calls: 404 while no PROFILE_TOKEN is configured, 403 without the token."""
+        if not self.token:
+            raise HTTPException(status_code=404, detail='Profiling admin endpoints are disabled (set PROFILE_TOKEN)')
+        if not self.authorized(headers):
+            raise HTTPException(status_code=403, detail='Invalid profiling token')
+
+    async def profile_request(self, request, call_next):
+        """Middleware body: profile the event-loop thread and busy workers while this request is served."""
+        reason = self.should_profile(request.headers)
+        sampler = self.start([threading.get_ident()], WORKER_THREAD_PREFIXES) if reason else None
+        if sampler is None:
+            return await call_next(request)
+        if reason == "armed":
+            self.take_armed()
+        try:
+            return await call_next(request)
+        finally:
+            route = request.scope.get('route')
+            name = f"{request.method} {route.path if route is not None else request.url.path}"
+            await asyncio.to_thread(self.finish, sampler, name, reason)
+
+    async def capture(self, seconds: float) -> Optional[Dict[str, Any]]:
+        """Profile every thread of the process for `seconds` (websockets, background jobs)."""
+        sampler = self.start()
+        if sampler is None:
+            return None
+        await asyncio.sleep(seconds)
+        return await asyncio.to_thread(self.finish, sampler, "process", "capture")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "sample_rate": self.sample_rate,
+            "header_trigger": bool(self.token),
+            "armed": self._armed,
+            "running": self._busy.locked(),
+            "directory": os.path.abspath(self.directory),
+            "interval": self.interval,
+            "recent": list(self.recent),
+        }
+
+
+profiler = RequestProfiler(
+    directory=os.getenv('PROFILE_DIR', 'profiles'),
+    sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+    token=os.getenv('PROFILE_TOKEN') or None,
+    interval=float(os.getenv('PROFILE_INTERVAL', '0.005')),
+    formats=[f.strip() for f in os.getenv('PROFILE_FORMATS', 'folded,svg').split(',') if f.strip()],
+)
@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+import copy
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry time-to-live and a size bound.
+    Values are deep-copied on the way in and out so callers can't mutate cached documents.
+    """
+    
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a cached value, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            value = entry[1]
+        return copy.deepcopy(value)
+    
+    def set(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entries past maxsize."""
+        if self.maxsize <= 0:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, key: Hashable):
+        """Drop a single entry."""
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+    
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,98 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator
+import json
+import os
+import re
+
+_SEPARATORS = re.compile(r'[\s,]*')
+# Longest tail a truncated literal or escape can leave after the error position
+_TRUNCATION_MARGIN = 16
+MAX_DOCUMENT_SIZE = int(os.getenv('JSON_MAX_DOCUMENT_SIZE', str(1 << 28)))
+
+
+def _is_truncated(error: json.JSONDecodeError) -> bool:
+    """Whether a decode error may only mean the document continues past the buffer."""
+    return error.msg.startswith('Unterminated string') or len(error.doc) - error.pos <= _TRUNCATION_MARGIN
+
+
+def iter_json_documents(json_file_path: str, chunk_size: int = 1 << 16,
+                        max_document_size: int = MAX_DOCUMENT_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Stream documents from a JSON array file or a newline-delimited JSON file
+    without loading the whole file into memory.
+
+    Documents are expected to be JSON objects. A document cut off by the end of
+    the buffer is retried only once the buffered text has doubled, so large
+    documents are parsed in linear time; documents larger than
+    max_document_size characters raise ValueError.
+    """
+    decoder = json.JSONDecoder()
+    with open(json_file_path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size)
+        pos = _SEPARATORS.match(buffer, 0).end()
+        while pos >= len(buffer):
+            more = f.read(chunk_size)
+            if not more:
+                return
+            buffer, pos = more, _SEPARATORS.match(more, 0).end()
+        in_array = buffer[pos:pos + 1] == '['
+        if in_array:
+            pos += 1
+        
+        eof = False
+        wanted = 0  # buffered characters needed before the next decode attempt
+        while True:
+            pos = _SEPARATORS.match(buffer, pos).end()
+            if (pos >= len(buffer) or len(buffer) - pos < wanted) and not eof:
+                more = f.read(max(chunk_size, wanted - (len(buffer) - pos)))
+                eof = not more
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            if pos >= len(buffer) or (in_array and buffer[pos] == ']'):
+                return
+            
+            try:
+                document, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if eof or not _is_truncated(e):
+                    raise
+                pending = len(buffer) - pos
+                if pending >= max_document_size:
+                    raise ValueError(f"JSON document in {json_file_path} exceeds {max_document_size} characters")
+                # Document spans the buffer boundary: retry once twice as much is buffered
+                wanted = min(pending * 2, max_document_size)
+                continue
+            
+            wanted = 0
+            yield document
+            pos = end
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # ObjectId and other BSON scalars
+    return str(value)
+
+
+def iter_ndjson_chunks(documents: Iterable[Dict[str, Any]], batch_size: int = 500) -> Iterator[bytes]:
+    """Encode documents as newline-delimited JSON, yielding one chunk per batch_size documents."""
+    lines = []
+    for document in documents:
+        lines.append(json.dumps(document, ensure_ascii=False, separators=(',', ':'), default=_json_default))
+        if len(lines) >= batch_size:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def parse_document_id(value: str) -> Any:
+    """Interpret an _id given as text (e.g. an export cursor): ObjectId hex, integer, or the string itself."""
+    if re.fullmatch(r'[0-9a-fA-F]{24}', value):
+        from bson import ObjectId
+        return ObjectId(value)
+    try:
+        return int(value)
+    except ValueError:
+        return value
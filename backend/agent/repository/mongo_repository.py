@@ -1,22 +1,75 @@
-from pymongo import MongoClient
-from datetime import datetime
-from typing import Optional, Dict, Any, List
+from pymongo import MongoClient, InsertOne, ReplaceOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Optional, Dict, Any, List, Iterable, Callable, Tuple
+import heapq
 import os
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
+from repository.cache import TTLCache
+from repository.json_stream import iter_json_documents
+from metrics import instrument_methods
 
 load_dotenv()
 
+@instrument_methods
 class MongoRepository:
+    # Not timed as queries: no database work, lazy cursors, or long bulk jobs
+    _UNTIMED_METHODS = frozenset({
+        "close", "cache_stats", "invalidate_user", "start_cache_invalidation_listener",
+        "iter_documents", "iter_user_profiles", "initialize_from_files",
+        "load_users_from_json", "load_groups_from_json", "load_group_chats_from_json",
+        "ensure_search_index", "ensure_feed_indexes", "rebuild_group_stats", "rebuild_message_index",
+        "rebuild_user_feeds", "replace_wellbeing_days", "replace_group_recommendations",
+    })
+    
     def __init__(self, connection_string: str = None):
         if connection_string is None:
             connection_string = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
-        self.client = MongoClient(connection_string)
+        self.client = MongoClient(
+            connection_string,
+            serverSelectionTimeoutMS=int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+        )
         self.db = self.client["narrio"]
         self.collection = self.db["test_records"]
         
         self.users = self.db['users']
         self.groups = self.db['groups']
         self.group_chats = self.db['group_chats']
+        # One document per chat message, text-indexed for search (see rebuild_message_index)
+        self.group_messages = self.db['group_messages']
+        # Precomputed top-k circle recommendations per user (see replace_group_recommendations)
+        self.group_recommendations = self.db['group_recommendations']
+        # Per-user "what's new in my circles" feed, maintained on write (see fan_out_to_feeds)
+        self.user_feeds = self.db['user_feeds']
+        self.feed_max_items = int(os.getenv('FEED_MAX_ITEMS', '100'))
+        # Per-user daily wellbeing aggregates written by score_wellbeing.py
+        self.wellbeing_daily = self.db['wellbeing_daily']
+        # Expiring leases so background jobs run on one worker at a time (see acquire_job_lock)
+        self.job_locks = self.db['job_locks']
+        
+        # In-process user id -> name cache, bulk-loaded on first use. Unknown ids are
+        # cached too (as False) so chats from deleted senders don't re-query every fetch.
+        self.name_cache = TTLCache(
+            maxsize=int(os.getenv('USER_NAME_CACHE_SIZE', '10000')),
+            ttl=float(os.getenv('USER_NAME_CACHE_TTL', '600'))
+        )
+        self._user_names_loaded = False
+        # Bumped whenever cached names may have changed; part of the group chat ETags,
+        # whose responses carry resolved sender names
+        self.names_generation = 0
+        
+        # Read-through caches for users and groups, invalidated by this repository's writes
+        cache_size = int(os.getenv('MONGODB_CACHE_SIZE', '1024'))
+        cache_ttl = float(os.getenv('MONGODB_CACHE_TTL', '60'))
+        self.user_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.group_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        
+        if os.getenv('MONGODB_CACHE_CHANGE_STREAMS', '').lower() in ('1', 'true', 'yes'):
+            self.start_cache_invalidation_listener()
     
     # def write_personality(self, data: Dict[str, Any]) -> Optional[str]:
 
@@ -70,7 +123,7 @@ class MongoRepository:
             List of all records
         """
         try:
-            records = list(self.collection.find())
+            records = list(self.iter_documents(self.collection.name))
             for record in records:
                 record["_id"] = str(record["_id"])
             return records
@@ -82,11 +135,101 @@ class MongoRepository:
         """Close the MongoDB connection"""
         self.client.close()
     
+    # ========== EXPORT ==========
+    
+    EXPORT_COLLECTIONS = ("test_records", "users", "groups", "group_chats")
+    
+    def iter_documents(self, collection_name: str, projection: Optional[Dict[str, Any]] = None,
+                       batch_size: Optional[int] = None, after: Any = None, before: Any = None,
+                       limit: int = 0) -> Iterable[Dict[str, Any]]:
+        """
+        Stream a collection in _id order through a server-side cursor, batch_size
+        documents per round trip. `after`/`before` bound the _id range (exclusive),
+        so an interrupted export resumes from the last _id it received.
+        """
+        if batch_size is None:
+            batch_size = int(os.getenv('EXPORT_BATCH_SIZE', '500'))
+        id_range: Dict[str, Any] = {}
+        if after is not None:
+            id_range["$gt"] = after
+        if before is not None:
+            id_range["$lt"] = before
+        cursor = self.db[collection_name].find(
+            {"_id": id_range} if id_range else {}, projection or None
+        ).sort("_id", 1).batch_size(batch_size)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor
+    
+    # ========== CACHE ==========
+    
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hit/miss metrics for the user and group caches."""
+        return {
+            "users": self.user_cache.stats(),
+            "groups": self.group_cache.stats(),
+            "user_names": self.name_cache.stats()
+        }
+    
+    def invalidate_user(self, user_id: Any, name_changed: bool = True):
+        """Drop a user from the caches after it was written outside this repository."""
+        self.user_cache.invalidate(user_id)
+        if name_changed:
+            self.name_cache.invalidate(user_id)
+            self.names_generation += 1
+    
+    def _invalidate_group(self, group_id: Any):
+        self.group_cache.invalidate(group_id)
+        self.group_cache.invalidate(self._ALL_GROUPS_KEY)
+    
+    # CappedPositionLost, ChangeStreamFatalError, ChangeStreamHistoryLost
+    _CHANGE_STREAM_LOST = (136, 280, 286)
+    
+    def start_cache_invalidation_listener(self):
+        """
+        Invalidate caches on writes made by other processes using a change stream.
+        Requires MongoDB to run as a replica set (a single-node local replica set is enough).
+        On errors the stream reconnects with exponential backoff, resuming after the
+        last change seen.
+        """
+        def listen():
+            pipeline = [{"$match": {"ns.coll": {"$in": [self.users.name, self.groups.name]}}}]
+            resume_token = None
+            delay = 1.0
+            while True:
+                try:
+                    with self.db.watch(pipeline, resume_after=resume_token) as stream:
+                        for change in stream:
+                            document_id = change.get("documentKey", {}).get("_id")
+                            if change["ns"]["coll"] == self.users.name:
+                                updated = (change.get("updateDescription") or {}).get("updatedFields")
+                                self.invalidate_user(document_id, name_changed=updated is None or "name" in updated)
+                            else:
+                                self._invalidate_group(document_id)
+                            resume_token = stream.resume_token
+                            delay = 1.0
+                except Exception as e:
+                    if resume_token is None or getattr(e, "code", None) in self._CHANGE_STREAM_LOST:
+                        # Changes made while disconnected can't be replayed: drop everything cached
+                        resume_token = None
+                        self.user_cache.clear()
+                        self.group_cache.clear()
+                        self.name_cache.clear()
+                        self.names_generation += 1
+                    print(f"[WARN] Cache invalidation change stream failed, reconnecting in {delay:.0f}s: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 60.0)
+        
+        thread = threading.Thread(target=listen, name="mongo-cache-invalidation", daemon=True)
+        thread.start()
+        return thread
+    
     # ========== USERS ==========
     
     def add_user(self, user_data: Dict[str, Any]) -> str:
         """Add a new user to the database."""
         result = self.users.insert_one(user_data)
+        self.name_cache.set(result.inserted_id, user_data.get('name', ''))
         return str(result.inserted_id)
     
     def modify_user(self, user_id: int, updates: Dict[str, Any]):
@@ -114,69 +257,142 @@ class MongoRepository:
             update_query["$set"] = set_updates
         
         self.users.update_one({"_id": user_id}, update_query)
+        self.invalidate_user(user_id, name_changed="name" in updates)
     
     def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Get a user by ID."""
-        return self.users.find_one({"_id": user_id})
+        """Get a user by ID (read-through cached)."""
+        user = self.user_cache.get(user_id)
+        if user is None:
+            user = self.users.find_one({"_id": user_id})
+            if user is not None:
+                self.user_cache.set(user_id, user)
+        return user
+    
+    def get_user_names(self, user_ids: List[int]) -> Dict[int, str]:
+        """
+        Resolve user ids to names from the in-process name cache.
+        The cache is bulk-loaded on first use; ids missing from it are fetched
+        together in a single query. Ids without a user are left out of the result.
+        """
+        if not self._user_names_loaded:
+            self.load_user_names()
+        
+        names: Dict[int, Any] = {}
+        missing = []
+        for user_id in set(user_ids):
+            name = self.name_cache.get(user_id)
+            if name is None:
+                missing.append(user_id)
+            else:
+                names[user_id] = name
+        if missing:
+            for user in self.users.find({"_id": {"$in": missing}}, {"name": 1}):
+                names[user["_id"]] = user.get("name", "")
+            for user_id in missing:
+                names.setdefault(user_id, False)
+                self.name_cache.set(user_id, names[user_id])
+        
+        return {user_id: names[user_id] for user_id in user_ids if names.get(user_id) is not False}
+    
+    def load_user_names(self):
+        """Bulk-load user names into the in-process name cache, up to its size bound."""
+        self.name_cache.clear()
+        for user in self.users.find({}, {"name": 1}).limit(self.name_cache.maxsize):
+            self.name_cache.set(user["_id"], user.get("name", ""))
+        self._user_names_loaded = True
+        self.names_generation += 1
     
     def get_all_users(self) -> List[Dict[str, Any]]:
-        """Get all users."""
-        return list(self.users.find())
+        """Get all users (use iter_documents for large exports)."""
+        return list(self.iter_documents(self.users.name))
     
-    def load_users_from_json(self, json_file_path: str):
-        """Load initial users from JSON file if collection is empty."""
-        if self.users.count_documents({}) > 0:
-            return
-        
-        import json
-        with open(json_file_path, 'r') as f:
-            users_data = json.load(f)
+    def load_users_from_json(self, json_file_path: str, batch_size: Optional[int] = None, upsert: bool = False) -> int:
+        """
+        Load initial users from a JSON (array or NDJSON) file.
+        Skipped if the collection is not empty, unless upsert is set.
+        """
+        if not upsert and self.users.count_documents({}) > 0:
+            return 0
         
-        for idx, user in enumerate(users_data):
+        def with_id(idx, user):
             user['_id'] = idx
-            self.users.insert_one(user)
+            return user
+        
+        count = self._bulk_load(self.users, iter_json_documents(json_file_path), with_id, batch_size, upsert)
+        self.user_cache.clear()
+        self._user_names_loaded = False
+        return count
     
     # ========== GROUPS ==========
     
+    _ALL_GROUPS_KEY = "__all__"
+    
     def create_group(self, group_data: Dict[str, Any]) -> str:
         """Create a new group."""
         result = self.groups.insert_one(group_data)
+        self._invalidate_group(result.inserted_id)
         return str(result.inserted_id)
     
-    def add_member_to_group(self, group_id: int, member_id: int):
-        """Add a member to a group."""
-        self.groups.update_one(
-            {"_id": group_id},
-            {"$addToSet": {"members": member_id}}
+    def add_member_to_group(self, group_id: int, member_id: int) -> bool:
+        """
+        Add a member to a group. membersCount is incremented in the same update,
+        which only matches when the member is not in the group yet. The user's
+        `groups` list, which feeds, search and membership checks read, is updated too.
+        """
+        result = self.groups.update_one(
+            {"_id": group_id, "memberIds": {"$ne": member_id}},
+            {"$addToSet": {"memberIds": member_id}, "$inc": {"membersCount": 1}}
         )
+        if result.modified_count:
+            self._invalidate_group(group_id)
+        self.users.update_one({"_id": member_id}, {"$addToSet": {"groups": group_id}})
+        self.user_cache.invalidate(member_id)
+        return result.modified_count > 0
     
-    def remove_member_from_group(self, group_id: int, member_id: int):
-        """Remove a member from a group."""
-        self.groups.update_one(
-            {"_id": group_id},
-            {"$pull": {"members": member_id}}
+    def remove_member_from_group(self, group_id: int, member_id: int) -> bool:
+        """Remove a member from a group (and the group from the user's `groups`), decrementing membersCount only if they were in it."""
+        result = self.groups.update_one(
+            {"_id": group_id, "memberIds": member_id},
+            {"$pull": {"memberIds": member_id}, "$inc": {"membersCount": -1}}
         )
+        if result.modified_count:
+            self._invalidate_group(group_id)
+        self.users.update_one({"_id": member_id}, {"$pull": {"groups": group_id}})
+        self.user_cache.invalidate(member_id)
+        return result.modified_count > 0
     
     def get_group(self, group_id: int) -> Optional[Dict[str, Any]]:
-        """Get a group by ID."""
-        return self.groups.find_one({"_id": group_id})
+        """Get a group by ID (read-through cached)."""
+        group = self.group_cache.get(group_id)
+        if group is None:
+            group = self.groups.find_one({"_id": group_id})
+            if group is not None:
+                self.group_cache.set(group_id, group)
+        return group
     
     def get_all_groups(self) -> List[Dict[str, Any]]:
-        """Get all groups."""
-        return list(self.groups.find())
+        """Get all groups (read-through cached)."""
+        groups = self.group_cache.get(self._ALL_GROUPS_KEY)
+        if groups is None:
+            groups = list(self.iter_documents(self.groups.name))
+            self.group_cache.set(self._ALL_GROUPS_KEY, groups)
+        return groups
     
-    def load_groups_from_json(self, json_file_path: str):
-        """Load initial groups from JSON file if collection is empty."""
-        if self.groups.count_documents({}) > 0:
-            return
-        
-        import json
-        with open(json_file_path, 'r') as f:
-            groups_data = json.load(f)
+    def load_groups_from_json(self, json_file_path: str, batch_size: Optional[int] = None, upsert: bool = False) -> int:
+        """
+        Load initial groups from a JSON (array or NDJSON) file.
+        Skipped if the collection is not empty, unless upsert is set.
+        """
+        if not upsert and self.groups.count_documents({}) > 0:
+            return 0
         
-        for idx, group in enumerate(groups_data):
+        def with_id(idx, group):
             group['_id'] = idx
-            self.groups.insert_one(group)
+            return group
+        
+        count = self._bulk_load(self.groups, iter_json_documents(json_file_path), with_id, batch_size, upsert)
+        self.group_cache.clear()
+        return count
     
     # ========== GROUP CHATS ==========
     
@@ -189,43 +405,496 @@ class MongoRepository:
         """Get all messages for a specific group."""
         return list(self.group_chats.find({"id": group_id}).sort("timestamp", 1))
     
+    def get_group_chat_messages_since(self, group_id: int, since_id: Optional[int] = None,
+                                      since_timestamp: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get a group's chat document containing only messages newer than the cursor.
+        Filtering happens server-side so unchanged history is never transferred.
+        """
+        conditions = []
+        if since_id is not None:
+            conditions.append({"$gt": ["$$message.id", since_id]})
+        if since_timestamp:
+            conditions.append({"$gt": ["$$message.timestamp", since_timestamp]})
+        if not conditions:
+            return self.get_group_chat_messages(group_id)
+        
+        return list(self.group_chats.aggregate([
+            {"$match": {"_id": group_id}},
+            {"$project": {
+                "id": 1,
+                "messages": {"$filter": {
+                    "input": {"$ifNull": ["$messages", []]},
+                    "as": "message",
+                    "cond": {"$and": conditions}
+                }}
+            }}
+        ]))
+    
+    def get_group_chat_version(self, group_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a cheap version marker for a group's chat (message count and last message).
+        Only the marker is projected, not the message payload.
+        """
+        result = list(self.group_chats.aggregate([
+            {"$match": {"_id": group_id}},
+            {"$project": {
+                "count": {"$size": {"$ifNull": ["$messages", []]}},
+                "last_id": {"$arrayElemAt": ["$messages.id", -1]},
+                "last_timestamp": {"$arrayElemAt": ["$messages.timestamp", -1]}
+            }}
+        ]))
+        return result[0] if result else None
+    
     def append_message_to_group(self, group_id: int, message: Dict[str, Any]) -> bool:
-        """Append a message to a group's messages array."""
+        """Append a message to a group's messages array and the search index; see fan_out_to_feeds for feeds."""
         result = self.group_chats.update_one(
             {"_id": group_id},
-            {"$push": {"messages": message}}
+            {
+                "$push": {"messages": message},
+                "$inc": {"messageCount": 1, f"messagesPerDay.{self._message_day(message)}": 1},
+                "$max": {"lastActivity": message.get("timestamp") or self._now_timestamp()}
+            }
         )
+        if result.modified_count > 0:
+            self.index_group_messages(group_id, [message])
         return result.modified_count > 0
     
+    # ========== GROUP STATS ==========
+    
+    @staticmethod
+    def _now_timestamp() -> str:
+        return datetime.utcnow().isoformat(timespec='milliseconds') + 'Z'
+    
+    @classmethod
+    def _message_day(cls, message: Dict[str, Any]) -> str:
+        """UTC day (YYYY-MM-DD) of a message's ISO timestamp."""
+        timestamp = message.get("timestamp")
+        return (timestamp if isinstance(timestamp, str) and len(timestamp) >= 10 else cls._now_timestamp())[:10]
+    
+    def get_group_stats(self, group_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Read a group's maintained counters: membersCount from the (cached) group and
+        message counters from its chat document, projected without the messages.
+        """
+        group = self.get_group(group_id)
+        if group is None:
+            return None
+        counters = self.group_chats.find_one(
+            {"_id": group_id}, {"messageCount": 1, "messagesPerDay": 1, "lastActivity": 1}
+        ) or {}
+        return {
+            "membersCount": group.get("membersCount", 0),
+            "messageCount": counters.get("messageCount", 0),
+            "messagesPerDay": counters.get("messagesPerDay", {}),
+            "lastActivity": counters.get("lastActivity")
+        }
+    
+    def rebuild_group_stats(self) -> int:
+        """Recompute every group's counters from its members and messages (backfill and drift repair)."""
+        started = time.perf_counter()
+        for group in self.groups.find({}, {"memberIds": 1}):
+            self.groups.update_one(
+                {"_id": group["_id"]}, {"$set": {"membersCount": len(set(group.get("memberIds") or []))}}
+            )
+        self.group_cache.clear()
+        count = 0
+        for chat in self.group_chats.find({}, {"messages.timestamp": 1}).batch_size(50):
+            per_day: Dict[str, int] = {}
+            last_activity = None
+            for message in chat.get("messages", []):
+                day = self._message_day(message)
+                per_day[day] = per_day.get(day, 0) + 1
+                if isinstance(message.get("timestamp"), str):
+                    last_activity = max(last_activity or "", message["timestamp"])
+            self.group_chats.update_one({"_id": chat["_id"]}, {"$set": {
+                "messageCount": sum(per_day.values()),
+                "messagesPerDay": per_day,
+                "lastActivity": last_activity
+            }})
+            count += 1
+        print(f"[INFO] Rebuilt stats for {count} group chats in {time.perf_counter() - started:.2f}s")
+        return count
+    
+    # ========== MESSAGE SEARCH ==========
+    
+    _SEARCH_FIELDS = ("id", "sender", "senderName", "text", "timestamp")
+    
+    def ensure_search_index(self):
+        """Create the text index over message text; group_id is a suffix key so group filters stay in the index."""
+        self.group_messages.create_index(
+            [("text", "text"), ("group_id", 1)],
+            name="message_text",
+            default_language=os.getenv('SEARCH_LANGUAGE', 'english')
+        )
+    
+    def _search_entry(self, group_id: int, message: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "_id": f"{group_id}:{message['id']}",
+            "group_id": group_id,
+            **{field: message.get(field) for field in self._SEARCH_FIELDS}
+        }
+    
+    def index_group_messages(self, group_id: int, messages: Iterable[Dict[str, Any]]) -> int:
+        """Upsert new or edited messages of a group into the search collection."""
+        count = 0
+        for message in messages:
+            if message.get('id') is not None and message.get('text'):
+                entry = self._search_entry(group_id, message)
+                self.group_messages.replace_one({"_id": entry["_id"]}, entry, upsert=True)
+                count += 1
+        return count
+    
+    def rebuild_message_index(self, batch_size: Optional[int] = None) -> int:
+        """
+        Backfill the search collection from every group's chat document. Entries are
+        upserted in place and a group's stale entries deleted afterwards, so searches
+        keep finding the group's messages while it is rebuilt.
+        """
+        batch_size = batch_size or int(os.getenv('SEED_BATCH_SIZE', '1000'))
+        started = time.perf_counter()
+        count = 0
+        for chat in self.group_chats.find({}, {"messages": 1}).batch_size(50):
+            entries: Dict[str, Dict[str, Any]] = {}
+            for message in chat.get('messages', []):
+                if message.get('id') is not None and message.get('text'):
+                    # Messages sharing an id within a group are indexed once
+                    entry = self._search_entry(chat['_id'], message)
+                    entries.setdefault(entry["_id"], entry)
+            batch = list(entries.values())
+            for start in range(0, len(batch), batch_size):
+                self.group_messages.bulk_write(
+                    [ReplaceOne({"_id": entry["_id"]}, entry, upsert=True) for entry in batch[start:start + batch_size]],
+                    ordered=False
+                )
+            # Entries of messages appended after the chat was read are newer than its last message
+            stale: Dict[str, Any] = {"group_id": chat['_id'], "_id": {"$nin": list(entries)}}
+            latest = max((entry.get("timestamp") or "" for entry in batch), default="")
+            if latest:
+                stale["$or"] = [{"timestamp": {"$lte": latest}}, {"timestamp": None}]
+            self.group_messages.delete_many(stale)
+            count += len(batch)
+        print(f"[INFO] Indexed {count} messages for search in {time.perf_counter() - started:.2f}s")
+        return count
+    
+    def search_group_messages(self, query: str, group_ids: Optional[List[int]] = None,
+                              skip: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Rank messages matching `query` by text score (newest first on ties), optionally
+        limited to some groups. One text-index query; no chat documents are loaded.
+        """
+        criteria: Dict[str, Any] = {"$text": {"$search": query}}
+        if group_ids is not None:
+            criteria["group_id"] = group_ids[0] if len(group_ids) == 1 else {"$in": list(group_ids)}
+        cursor = self.group_messages.find(
+            criteria, {"_id": 0, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"}), ("timestamp", -1)]).skip(skip).limit(limit)
+        return list(cursor)
+    
+    # ========== USER FEEDS ==========
+    
+    _FEED_FIELDS = ("id", "sender", "senderName", "text", "timestamp")
+    
+    def ensure_feed_indexes(self):
+        """Index users by group so a message's fan-out finds the members without a scan."""
+        self.users.create_index("groups", name="user_groups")
+    
+    def _feed_item(self, group_id: int, group_name: str, message: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "group_id": group_id,
+            "group_name": group_name,
+            **{field: message.get(field) for field in self._FEED_FIELDS}
+        }
+    
+    def fan_out_to_feeds(self, group_id: int, message: Dict[str, Any]) -> int:
+        """
+        Push a new group message to the front of every member's feed (capped at
+        feed_max_items) and count it as unread for everyone but the sender.
+        """
+        member_ids = [user["_id"] for user in self.users.find({"groups": group_id}, {"_id": 1})]
+        if not member_ids:
+            return 0
+        item = self._feed_item(group_id, (self.get_group(group_id) or {}).get("name", ""), message)
+        if not item.get("senderName") and item.get("sender") is not None:
+            item["senderName"] = self.get_user_names([item["sender"]]).get(item["sender"])
+        push = {"items": {"$each": [item], "$position": 0, "$slice": self.feed_max_items}}
+        now = datetime.utcnow()
+        
+        readers = [member_id for member_id in member_ids if member_id != message.get("sender")]
+        matched = 0
+        if readers:
+            matched += self.user_feeds.update_many(
+                {"_id": {"$in": readers}},
+                {"$push": push, "$inc": {f"unread.{group_id}": 1}, "$set": {"updated_at": now}}
+            ).matched_count
+        if len(readers) != len(member_ids):
+            matched += self.user_feeds.update_many(
+                {"_id": message.get("sender")},
+                {"$push": push, "$set": {"updated_at": now}}
+            ).matched_count
+        if matched < len(member_ids):
+            # First item for some members: create their feed documents
+            existing = {feed["_id"] for feed in self.user_feeds.find({"_id": {"$in": member_ids}}, {"_id": 1})}
+            for member_id in member_ids:
+                if member_id not in existing:
+                    update: Dict[str, Any] = {"$push": push, "$set": {"updated_at": now}}
+                    if member_id != message.get("sender"):
+                        update["$inc"] = {f"unread.{group_id}": 1}
+                    self.user_feeds.update_one({"_id": member_id}, update, upsert=True)
+        return len(member_ids)
+    
+    def get_user_feed(self, user_id: int, limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Read a user's feed (newest first) and unread counts in one query by _id."""
+        projection: Dict[str, Any] = {"unread": 1, "updated_at": 1}
+        projection["items"] = {"$slice": limit} if limit else 1
+        return self.user_feeds.find_one({"_id": user_id}, projection)
+    
+    def mark_feed_read(self, user_id: int, group_id: Optional[int] = None):
+        """Reset the unread count of one group, or of all groups, in a user's feed."""
+        if group_id is None:
+            self.user_feeds.update_one({"_id": user_id}, {"$set": {"unread": {}}})
+        else:
+            self.user_feeds.update_one({"_id": user_id}, {"$unset": {f"unread.{group_id}": ""}})
+    
+    def rebuild_user_feeds(self, batch_size: Optional[int] = None) -> int:
+        """
+        Backfill every user's feed from the most recent messages of their groups,
+        keeping existing unread counts. The new feeds are written to a staging
+        collection and renamed over the live one; messages posted while the rebuild
+        runs may be missing from it.
+        """
+        batch_size = batch_size or int(os.getenv('SEED_BATCH_SIZE', '1000'))
+        started = time.perf_counter()
+        cap = self.feed_max_items
+        
+        group_names = {group["_id"]: group.get("name", "") for group in self.groups.find({}, {"name": 1})}
+        recent: Dict[Any, List[Dict[str, Any]]] = {}
+        for chat in self.group_chats.find({}, {"messages": {"$slice": -cap}}).batch_size(50):
+            messages = [message for message in chat.get("messages", []) if message.get("id") is not None]
+            recent[chat["_id"]] = [
+                self._feed_item(chat["_id"], group_names.get(chat["_id"], ""), message)
+                for message in reversed(messages)
+            ]
+        names = self.get_user_names([item["sender"] for items in recent.values() for item in items
+                                     if item.get("sender") is not None])
+        for items in recent.values():
+            for item in items:
+                item["senderName"] = item.get("senderName") or names.get(item.get("sender"))
+        
+        unread = {feed["_id"]: feed.get("unread", {}) for feed in self.user_feeds.find({}, {"unread": 1})}
+        now = datetime.utcnow()
+        
+        def feeds():
+            for user in self.users.find({}, {"groups": 1}).batch_size(batch_size):
+                streams = [recent.get(group_id, []) for group_id in user.get("groups") or []]
+                items = list(islice(heapq.merge(*streams, key=lambda item: item.get("timestamp") or "", reverse=True), cap))
+                yield {"_id": user["_id"], "items": items, "unread": unread.get(user["_id"], {}), "updated_at": now}
+        
+        count = self._swap_collection(self.user_feeds, feeds(), batch_size)
+        print(f"[INFO] Rebuilt {count} user feeds in {time.perf_counter() - started:.2f}s")
+        return count
+    
+    # ========== WELLBEING ==========
+    
+    _WELLBEING_INDEX = ([("user_id", 1), ("day", 1)], {"name": "user_day"})
+    
+    def replace_wellbeing_days(self, rows: Iterable[Dict[str, Any]], since: Optional[str] = None,
+                               batch_size: Optional[int] = None) -> int:
+        """
+        Store recomputed daily wellbeing aggregates. Without `since` the whole table is
+        swapped in; with it, days from `since` (YYYY-MM-DD) on are upserted row by row
+        and only then are rows of that range that were not recomputed deleted, so
+        readers never see the range empty.
+        """
+        if since is None:
+            return self._swap_collection(self.wellbeing_daily, rows, batch_size, indexes=[self._WELLBEING_INDEX])
+        batch_size = batch_size or int(os.getenv('SEED_BATCH_SIZE', '1000'))
+        self.wellbeing_daily.create_index(self._WELLBEING_INDEX[0], **self._WELLBEING_INDEX[1])
+        written = set()
+        batch: List[Dict[str, Any]] = []
+        
+        def flush():
+            if batch:
+                self.wellbeing_daily.bulk_write([ReplaceOne({"_id": row["_id"]}, row, upsert=True) for row in batch],
+                                                ordered=False)
+                batch.clear()
+        
+        for row in rows:
+            batch.append(row)
+            written.add(row["_id"])
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+        stale = [row["_id"] for row in self.wellbeing_daily.find({"day": {"$gte": since}}, {"_id": 1})
+                 if row["_id"] not in written]
+        for start in range(0, len(stale), batch_size):
+            self.wellbeing_daily.delete_many({"_id": {"$in": stale[start:start + batch_size]}})
+        return len(written)
+    
+    def get_wellbeing_days(self, user_id: int, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """A user's daily wellbeing aggregates, oldest first, optionally from `since` (YYYY-MM-DD) on."""
+        criteria: Dict[str, Any] = {"user_id": user_id}
+        if since:
+            criteria["day"] = {"$gte": since}
+        return list(self.wellbeing_daily.find(criteria, {"_id": 0, "user_id": 0}).sort("day", 1))
+    
+    # ========== RECOMMENDATIONS ==========
+    
+    def iter_user_profiles(self, fields: List[str], batch_size: int = 500) -> Iterable[Dict[str, Any]]:
+        """Stream all users with only the given fields."""
+        return self.users.find({}, {field: 1 for field in fields}).batch_size(batch_size)
+    
+    def replace_group_recommendations(self, rows: Iterable[Dict[str, Any]], batch_size: Optional[int] = None) -> int:
+        """Swap in a new recommendation table; readers never see a partial one."""
+        return self._swap_collection(self.group_recommendations, rows, batch_size)
+    
+    def get_group_recommendations(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get a user's precomputed recommendations."""
+        return self.group_recommendations.find_one({"_id": user_id})
+    
+    # ========== JOB LOCKS ==========
+    
+    def acquire_job_lock(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        Take or renew the lease on a job for `ttl` seconds. Fails while another
+        owner holds an unexpired lease; expired leases are taken over.
+        """
+        now = datetime.utcnow()
+        lease = {"owner": owner, "expires_at": now + timedelta(seconds=ttl)}
+        try:
+            self.job_locks.insert_one({"_id": name, **lease})
+            return True
+        except DuplicateKeyError:
+            pass
+        result = self.job_locks.update_one(
+            {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": lease}
+        )
+        return result.matched_count > 0
+    
+    def release_job_lock(self, name: str, owner: str):
+        """Give up a lease, if `owner` still holds it."""
+        self.job_locks.delete_one({"_id": name, "owner": owner})
+    
     def get_group_chat_by_id(self, chat_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific group chat message by its ID."""
         from bson import ObjectId
         return self.group_chats.find_one({"_id": ObjectId(chat_id)})
     
     def get_all_group_chats(self) -> List[Dict[str, Any]]:
-        """Get all group chat messages."""
-        return list(self.group_chats.find())
+        """Get all group chats (use iter_documents for large exports)."""
+        return list(self.iter_documents(self.group_chats.name))
     
-    def load_group_chats_from_json(self, json_file_path: str):
-        """Load initial group chats from JSON file if collection is empty."""
-        if self.group_chats.count_documents({}) > 0:
-            return
-        
-        import json
-        with open(json_file_path, 'r') as f:
-            chats_data = json.load(f)
+    def load_group_chats_from_json(self, json_file_path: str, batch_size: Optional[int] = None, upsert: bool = False) -> int:
+        """
+        Load initial group chats from a JSON (array or NDJSON) file.
+        Skipped if the collection is not empty, unless upsert is set.
+        """
+        if not upsert and self.group_chats.count_documents({}) > 0:
+            return 0
         
-        for chat in chats_data:
+        def with_id(idx, chat):
             if 'id' in chat:
                 chat['_id'] = int(chat['id'])
+            return chat
+        
+        return self._bulk_load(self.group_chats, iter_json_documents(json_file_path), with_id, batch_size, upsert)
+    
+    def _bulk_load(self, collection, documents: Iterable[Dict[str, Any]],
+                   prepare: Callable[[int, Dict[str, Any]], Dict[str, Any]],
+                   batch_size: Optional[int] = None, upsert: bool = False) -> int:
+        """
+        Write documents in unordered batches and report throughput.
+        Plain mode uses insert_many; upsert mode replaces documents by _id so
+        re-seeding works on a non-empty collection.
+        """
+        if batch_size is None:
+            batch_size = int(os.getenv('SEED_BATCH_SIZE', '1000'))
         
-        self.group_chats.insert_many(chats_data)
+        started = time.perf_counter()
+        count = 0
+        batch: List[Dict[str, Any]] = []
+        
+        def flush():
+            if not batch:
+                return
+            if upsert:
+                collection.bulk_write(
+                    [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) if "_id" in doc else InsertOne(doc)
+                     for doc in batch],
+                    ordered=False
+                )
+            else:
+                try:
+                    collection.insert_many(batch, ordered=False)
+                except BulkWriteError as e:
+                    # Duplicate keys are expected when a previous seed was interrupted
+                    errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+                    if errors:
+                        raise
+            batch.clear()
+        
+        for idx, document in enumerate(documents):
+            batch.append(prepare(idx, document))
+            count += 1
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+        
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed > 0 else 0.0
+        print(f"[INFO] Loaded {count} documents into {collection.name} in {elapsed:.2f}s ({rate:.0f} docs/s)")
+        return count
+    
+    def _swap_collection(self, collection, documents: Iterable[Dict[str, Any]], batch_size: Optional[int] = None,
+                         indexes: Optional[List[Tuple[Any, Dict[str, Any]]]] = None) -> int:
+        """
+        Replace a derived collection's contents: documents are written to a staging
+        collection in batches, which is then renamed over the live one in one step.
+        `indexes` ((keys, options) pairs) are built on the staging collection first.
+        Each run stages under its own name, so concurrent runs never write into each
+        other's staging data; the last rename wins.
+        """
+        batch_size = batch_size or int(os.getenv('SEED_BATCH_SIZE', '1000'))
+        staging = self.db[f"{collection.name}_staging_{uuid.uuid4().hex[:12]}"]
+        try:
+            for keys, options in indexes or []:
+                staging.create_index(keys, **options)
+            count = 0
+            batch: List[Dict[str, Any]] = []
+            for document in documents:
+                batch.append(document)
+                if len(batch) >= batch_size:
+                    staging.insert_many(batch, ordered=False)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                staging.insert_many(batch, ordered=False)
+                count += len(batch)
+            if count:
+                staging.rename(collection.name, dropTarget=True)
+            else:
+                collection.delete_many({})
+        except BaseException:
+            staging.drop()
+            raise
+        return count
     
-    def initialize_from_files(self, users_file: str = None, groups_file: str = None, chats_file: str = None):
-        """Initialize all collections from JSON files if they are empty."""
+    def initialize_from_files(self, users_file: str = None, groups_file: str = None, chats_file: str = None,
+                              batch_size: Optional[int] = None, upsert: bool = False):
+        """Initialize all collections from JSON files if they are empty (or always, in upsert mode)."""
         if users_file:
-            self.load_users_from_json(users_file)
+            self.load_users_from_json(users_file, batch_size, upsert)
         if groups_file:
-            self.load_groups_from_json(groups_file)
+            self.load_groups_from_json(groups_file, batch_size, upsert)
+        loaded_chats = 0
         if chats_file:
-            self.load_group_chats_from_json(chats_file)
+            loaded_chats = self.load_group_chats_from_json(chats_file, batch_size, upsert)
+        self.ensure_search_index()
+        if loaded_chats or self.group_messages.estimated_document_count() == 0:
+            self.rebuild_message_index(batch_size)
+        if loaded_chats or self.group_chats.find_one({"messageCount": {"$exists": False}}, {"_id": 1}):
+            self.rebuild_group_stats()
+        self.ensure_feed_indexes()
+        if loaded_chats or self.user_feeds.estimated_document_count() == 0:
+            self.rebuild_user_feeds(batch_size)
@@ -0,0 +1,135 @@
+from typing import Any, Callable, Dict, List, Optional
+
+
+def diff_personality(current: Dict[str, Any], new_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the entries of new_info that are missing from or differ in current."""
+    return {key: value for key, value in new_info.items() if key not in current or current[key] != value}
+
+
+def format_personality_summary(personality: Dict[str, Any]) -> str:
+    """Format personality traits as the bullet list used in the system prompt."""
+    if not personality:
+        return "No personality information recorded yet."
+    
+    summary_parts = []
+    for key, value in personality.items():
+        if isinstance(value, list):
+            summary_parts.append(f"- {key}: {', '.join(str(item) for item in value)}")
+        else:
+            summary_parts.append(f"- {key}: {value}")
+    
+    return "\n".join(summary_parts)
+
+
+def field_name(key: Any) -> str:
+    """Make a personality key safe to use as a MongoDB field name."""
+    return str(key).replace('.', '_').lstrip('$') or '_'
+
+
+def _sanitize(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {field_name(k): _sanitize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_sanitize(item) for item in value]
+    return value
+
+
+def merge_personality(current: Dict[str, Any], new_info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Merge new personality info into `current` in place, the way
+    build_personality_update applies it in MongoDB: nested objects are merged
+    leaf by leaf, lists that already exist gain only their new items, and
+    anything else is replaced.
+    """
+    for key, value in new_info.items():
+        name = field_name(key)
+        old = current.get(name)
+        if isinstance(value, dict) and isinstance(old, dict):
+            merge_personality(old, value)
+        elif isinstance(value, list) and isinstance(old, list):
+            old.extend(item for item in _sanitize(value) if item not in old)
+        else:
+            current[name] = _sanitize(value)
+    return current
+
+
+def build_personality_update(current: Dict[str, Any], changes: Dict[str, Any],
+                             prefix: str = "personality") -> Dict[str, Dict[str, Any]]:
+    """
+    Turn a personality diff into a field-level MongoDB update.
+    Nested objects are updated leaf by leaf with $set, lists that already exist
+    gain only their new items via $addToSet, and anything else is $set whole.
+    """
+    set_fields: Dict[str, Any] = {}
+    add_to_set: Dict[str, Any] = {}
+    
+    def walk(path: str, old: Any, new: Any):
+        if isinstance(new, dict) and isinstance(old, dict):
+            for key, value in new.items():
+                name = field_name(key)
+                if name not in old or old[name] != value:
+                    walk(f"{path}.{name}", old.get(name), value)
+        elif isinstance(new, list) and isinstance(old, list):
+            items = [item for item in _sanitize(new) if item not in old]
+            if items:
+                add_to_set[path] = {"$each": items}
+        else:
+            set_fields[path] = _sanitize(new)
+    
+    for key, value in changes.items():
+        name = field_name(key)
+        walk(f"{prefix}.{name}", current.get(name), value)
+    
+    update: Dict[str, Dict[str, Any]] = {}
+    if set_fields:
+        update["$set"] = set_fields
+    if add_to_set:
+        update["$addToSet"] = add_to_set
+    return update
+
+
+class MongoPersonalityStore:
+    """
+    Per-owner learned personality kept in a MongoDB document field.
+    Updates are written as field-level deltas and reads are projected to the
+    fields they need, so a new insight costs a few bytes rather than the whole profile.
+    """
+    
+    def __init__(self, collection, field: str = "personality", upsert: bool = False,
+                 on_change: Optional[Callable[[Any], None]] = None):
+        self.collection = collection
+        self.field = field
+        self.upsert = upsert
+        self.on_change = on_change
+    
+    def load(self, owner_id: Any, keys: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Load the personality, or only the given top-level keys of it."""
+        if keys:
+            projection = {f"{self.field}.{field_name(key)}": 1 for key in keys}
+        else:
+            projection = {self.field: 1}
+        document = self.collection.find_one({"_id": owner_id}, projection)
+        return (document or {}).get(self.field, {})
+    
+    def update(self, owner_id: Any, new_info: Dict[str, Any]) -> bool:
+        """Apply new personality info as a delta. Returns True if anything changed."""
+        if not new_info:
+            return False
+        current = self.load(owner_id, keys=list(new_info))
+        changes = diff_personality(current, {field_name(k): v for k, v in new_info.items()})
+        update = build_personality_update(current, changes, prefix=self.field)
+        if not update:
+            return False
+        result = self.collection.update_one({"_id": owner_id}, update, upsert=self.upsert)
+        if not self.upsert and result.matched_count == 0:
+            print(f"[WARN] Personality update for missing owner {owner_id!r} dropped: {list(changes)}")
+            return False
+        if self.on_change:
+            self.on_change(owner_id)
+        return True
+    
+    def clear(self, owner_id: Any):
+        """Remove the whole personality."""
+        self.collection.update_one({"_id": owner_id}, {"$unset": {self.field: ""}})
+        if self.on_change:
+            self.on_change(owner_id)
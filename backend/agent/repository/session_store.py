@@ -0,0 +1,287 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+import copy
+import hashlib
+import hmac
+import os
+import re
+import threading
+
+from pymongo.errors import DuplicateKeyError
+from repository.cache import TTLCache
+from repository.personality_store import MongoPersonalityStore, merge_personality
+from memory_tracker import deep_sizeof
+
+
+class ConcurrentUpdateError(Exception):
+    """Raised when a session was modified by another worker since it was loaded."""
+
+
+_USER_SESSION = re.compile(r"user-(\d+)\.([0-9a-f]{32})")
+
+
+def _user_session_signature(user_id: int, secret: str) -> str:
+    return hmac.new(secret.encode('utf-8'), f"user-{user_id}".encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+
+def sign_user_session(user_id: int, secret: str) -> str:
+    """
+    Session id bound to a user account (`user-<id>.<signature>`). Only issue it
+    after authenticating the user; anyone holding it acts as that user.
+    """
+    return f"user-{user_id}.{_user_session_signature(user_id, secret)}"
+
+
+def verified_user_id(session_id: str, secret: Optional[str]) -> Optional[int]:
+    """The user id of a session id made by sign_user_session with `secret`, else None."""
+    match = _USER_SESSION.fullmatch(session_id) if secret else None
+    if match is None:
+        return None
+    user_id = int(match.group(1))
+    if not hmac.compare_digest(match.group(2), _user_session_signature(user_id, secret)):
+        return None
+    return user_id
+
+
+class SessionState:
+    """Conversation history and personality of one session, with its version."""
+    
+    def __init__(self, session_id: str, history: Optional[List[Dict[str, str]]] = None,
+                 personality: Optional[Dict[str, Any]] = None, version: int = 0):
+        self.session_id = session_id
+        self.history = history or []
+        self.personality = personality or {}
+        self.version = version
+        # Personality changes made since load, written by the store as a delta
+        self.personality_updates: Dict[str, Any] = {}
+        self.personality_cleared = False
+    
+    def learn(self, insights: Dict[str, Any]):
+        """Merge new personality insights into the session, as the stores merge them."""
+        merge_personality(self.personality, insights)
+        self.personality_updates.update(insights)
+    
+    def clear_personality(self):
+        """Forget everything learned about the session's user."""
+        self.personality = {}
+        self.personality_updates = {}
+        self.personality_cleared = True
+    
+    def add_turn(self, user_message: str, ai_message: str, limit: Optional[int] = None):
+        """Append a user/assistant exchange, keeping at most `limit` messages."""
+        at = datetime.utcnow().isoformat(timespec='milliseconds') + 'Z'
+        self.history.append({"role": "human", "content": user_message, "at": at})
+        self.history.append({"role": "ai", "content": ai_message, "at": at})
+        if limit:
+            self.history = self.history[-limit:]
+
+
+class SessionStore(ABC):
+    """
+    Base class for pluggable session storage.
+    Saves use optimistic concurrency: a save only succeeds if the stored version
+    still matches the version that was loaded.
+    """
+    
+    history_limit = int(os.getenv('SESSION_HISTORY_LIMIT', '50'))
+    
+    @abstractmethod
+    def load(self, session_id: str) -> SessionState:
+        """Load a session, or a new empty one at version 0."""
+    
+    @abstractmethod
+    def save(self, state: SessionState) -> SessionState:
+        """Save a session, raising ConcurrentUpdateError if its version changed."""
+    
+    def update(self, session_id: str, mutate: Callable[[SessionState], None], retries: int = 5) -> SessionState:
+        """Load, mutate and save a session, reloading and re-applying on version conflicts."""
+        for attempt in range(retries):
+            state = self.load(session_id)
+            mutate(state)
+            try:
+                return self.save(state)
+            except ConcurrentUpdateError:
+                if attempt == retries - 1:
+                    raise
+        return state
+    
+    def reset(self, session_id: str, clear_personality: bool = False) -> SessionState:
+        """Clear the conversation history, and optionally the personality."""
+        def clear(state: SessionState):
+            state.history = []
+            if clear_personality:
+                state.clear_personality()
+        return self.update(session_id, clear)
+    
+    def session_count(self) -> Optional[int]:
+        """Sessions held in this process, or None when they live in an external store."""
+        return None
+    
+    def memory_footprint(self) -> Dict[str, int]:
+        """Approximate bytes held in this process per session (empty for external stores)."""
+        return {}
+
+
+class LocalSessionStore(SessionStore):
+    """
+    Development store for a single process.
+    History and personality are kept in memory per session, for at most
+    max_sessions sessions (least recently used are dropped first). The
+    cv_session (the agent's default session, as in single-user mode) keeps its
+    personality in the CV.json profile managed by CVManager instead.
+    """
+    
+    def __init__(self, cv_manager, cv_session: str = "default", max_sessions: Optional[int] = None):
+        self.cv_manager = cv_manager
+        self.cv_session = cv_session
+        self.max_sessions = max_sessions or int(os.getenv('SESSION_LOCAL_MAX_SESSIONS', '1000'))
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _empty(self) -> Dict[str, Any]:
+        return {"history": [], "personality": {}, "version": 0}
+    
+    def load(self, session_id: str) -> SessionState:
+        with self._lock:
+            session = self._sessions.get(session_id) or self._empty()
+            if session_id in self._sessions:
+                self._sessions.move_to_end(session_id)
+            if session_id == self.cv_session:
+                personality = self.cv_manager.load_personality()
+            else:
+                personality = session["personality"]
+            return SessionState(
+                session_id,
+                history=list(session["history"]),
+                personality=copy.deepcopy(personality),
+                version=session["version"]
+            )
+    
+    def save(self, state: SessionState) -> SessionState:
+        with self._lock:
+            current = self._sessions.get(state.session_id) or self._empty()
+            if current["version"] != state.version:
+                raise ConcurrentUpdateError(f"Session {state.session_id} changed since it was loaded")
+            state.version += 1
+            personality = {}
+            if state.session_id == self.cv_session:
+                if state.personality_cleared:
+                    self.cv_manager.update_personality({})
+                if state.personality_updates:
+                    self.cv_manager.update_personality(state.personality_updates)
+            else:
+                personality = copy.deepcopy(state.personality)
+            self._sessions[state.session_id] = {
+                "history": list(state.history),
+                "personality": personality,
+                "version": state.version
+            }
+            self._sessions.move_to_end(state.session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return state
+    
+    def session_count(self) -> Optional[int]:
+        with self._lock:
+            return len(self._sessions)
+    
+    def memory_footprint(self) -> Dict[str, int]:
+        with self._lock:
+            return {session_id: deep_sizeof(session) for session_id, session in self._sessions.items()}
+
+
+class MongoSessionStore(SessionStore):
+    """
+    Production store shared by all workers and nodes.
+    History is one versioned document per session. Personality is written as
+    field-level deltas: into the user's document when the session id was signed
+    for an existing user with `user_secret` (see sign_user_session), otherwise
+    into the session document itself. Client-chosen ids never reach a user record.
+    """
+    
+    def __init__(self, collection, user_personality: Optional[MongoPersonalityStore] = None,
+                 user_secret: Optional[str] = None):
+        self.collection = collection
+        self.user_personality = user_personality
+        self.user_secret = user_secret
+        self.session_personality = MongoPersonalityStore(collection, upsert=True)
+        # Signed session id -> whether its user document exists, checked once per session
+        self._user_exists = TTLCache(
+            maxsize=int(os.getenv('SESSION_USER_CACHE_SIZE', '10000')),
+            ttl=float(os.getenv('SESSION_USER_CACHE_TTL', '600'))
+        )
+    
+    def _personality_store(self, session_id: str):
+        """
+        Pick the personality store and owner id for a session. Signed ids of users
+        without a user document keep their personality in the session document.
+        """
+        user_id = verified_user_id(session_id, self.user_secret) if self.user_personality is not None else None
+        if user_id is not None:
+            exists = self._user_exists.get(session_id)
+            if exists is None:
+                exists = bool(self.user_personality.collection.count_documents({"_id": user_id}, limit=1))
+                self._user_exists.set(session_id, exists)
+            if exists:
+                return self.user_personality, user_id
+        return self.session_personality, session_id
+    
+    def load(self, session_id: str) -> SessionState:
+        document = self.collection.find_one({"_id": session_id}, {"history": 1, "version": 1}) or {}
+        store, owner_id = self._personality_store(session_id)
+        return SessionState(
+            session_id,
+            history=document.get("history", []),
+            personality=store.load(owner_id),
+            version=document.get("version", 0)
+        )
+    
+    def save(self, state: SessionState) -> SessionState:
+        fields = {
+            "history": state.history,
+            "updated_at": datetime.utcnow()
+        }
+        if state.version == 0:
+            try:
+                self.collection.insert_one({"_id": state.session_id, **fields, "version": 1})
+            except DuplicateKeyError:
+                raise ConcurrentUpdateError(f"Session {state.session_id} was created concurrently")
+        else:
+            result = self.collection.update_one(
+                {"_id": state.session_id, "version": state.version},
+                {"$set": fields, "$inc": {"version": 1}}
+            )
+            if result.matched_count == 0:
+                raise ConcurrentUpdateError(f"Session {state.session_id} changed since it was loaded")
+        state.version += 1
+        
+        # Personality deltas are idempotent ($set/$addToSet), so they are applied
+        # outside the version check
+        store, owner_id = self._personality_store(state.session_id)
+        if state.personality_cleared:
+            store.clear(owner_id)
+        if state.personality_updates:
+            store.update(owner_id, state.personality_updates)
+        return state
+
+
+def create_session_store(cv_manager=None, repo=None) -> SessionStore:
+    """
+    Build the session store selected by SESSION_STORE ('local' or 'mongo').
+    The Mongo store reuses the given repository's connection when provided.
+    """
+    backend = os.getenv('SESSION_STORE', 'local').lower()
+    if backend == 'mongo':
+        if repo is None:
+            from repository.mongo_repository import MongoRepository
+            repo = MongoRepository()
+        user_personality = MongoPersonalityStore(repo.users, on_change=lambda user_id: repo.invalidate_user(user_id, name_changed=False))
+        return MongoSessionStore(repo.db['agent_sessions'], user_personality=user_personality,
+                                 user_secret=os.getenv('SESSION_USER_SECRET') or None)
+    if backend in ('local', 'memory'):
+        if cv_manager is None:
+            raise ValueError("LocalSessionStore requires a CVManager")
+        return LocalSessionStore(cv_manager)
+    raise ValueError(f"Unsupported SESSION_STORE: {backend}")
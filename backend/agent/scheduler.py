@@ -0,0 +1,146 @@
+"""
+Priority scheduler for LLM calls.
+
+Every NarrioAgent LLM call takes a slot from a shared scheduler. Calls belong to a
+priority class (live voice > live text); each class has its own concurrency budget
+inside the global capacity, and waiting calls are granted in priority order, FIFO
+within a class, so voice turns never queue behind text turns. A released slot is
+handed straight to the next waiter that fits, waking only that thread.
+
+Callers run in threads (the agent's LLM client is synchronous), so this is a
+threading scheduler rather than an asyncio one.
+
+Environment:
+    LLM_MAX_CONCURRENT        LLM calls in flight per process (default 4)
+    LLM_BUDGET_VOICE          max concurrent live voice calls (default = capacity)
+    LLM_BUDGET_TEXT           max concurrent live text calls (default = capacity)
+    LLM_QUEUE_TIMEOUT         seconds a call may wait for a slot (default 60)
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Any, Callable, Deque, Dict, Optional
+import os
+import threading
+import time
+
+from metrics import LLM_ACTIVE, LLM_QUEUE_WAIT
+
+
+class Priority(IntEnum):
+    VOICE = 0
+    TEXT = 1
+
+
+class SchedulerTimeout(Exception):
+    """A call waited longer than its timeout for a slot."""
+
+
+class _Waiter:
+    __slots__ = ("cond", "granted")
+
+    def __init__(self, lock: threading.Lock):
+        self.cond = threading.Condition(lock)
+        self.granted = False
+
+
+class LLMScheduler:
+    """Grants LLM call slots by priority within per-class concurrency budgets."""
+
+    def __init__(self, capacity: int = 4, budgets: Optional[Dict[Priority, int]] = None,
+                 queue_timeout: Optional[float] = 60.0):
+        self.capacity = capacity
+        self.budgets = {priority: capacity for priority in Priority}
+        self.budgets.update(budgets or {})
+        self.queue_timeout = queue_timeout
+        self._active = {priority: 0 for priority in Priority}
+        self._running = 0
+        self._waiting: Dict[Priority, Deque[_Waiter]] = {priority: deque() for priority in Priority}
+        self._lock = threading.Lock()
+
+    def _fits(self, priority: Priority) -> bool:
+        return self._running < self.capacity and self._active[priority] < self.budgets[priority]
+
+    def _grant(self, priority: Priority):
+        self._active[priority] += 1
+        self._running += 1
+        LLM_ACTIVE.labels(priority.name.lower()).inc()
+
+    def _dispatch(self):
+        # Hand free slots to the oldest waiter of each class in priority order;
+        # a class held back by its own budget doesn't block the classes below it
+        for priority in Priority:
+            waiting = self._waiting[priority]
+            while waiting and self._fits(priority):
+                waiter = waiting.popleft()
+                self._grant(priority)
+                waiter.granted = True
+                waiter.cond.notify()
+
+    def acquire(self, priority: Priority, timeout: Optional[float] = None):
+        """Block until a slot for `priority` is free."""
+        priority = Priority(priority)
+        started = time.perf_counter()
+        if timeout is None:
+            timeout = self.queue_timeout
+        deadline = started + timeout if timeout is not None else None
+        with self._lock:
+            # Waiters of higher classes are only left queued when they can't fit
+            if not self._waiting[priority] and self._fits(priority):
+                self._grant(priority)
+            else:
+                waiter = _Waiter(self._lock)
+                self._waiting[priority].append(waiter)
+                while not waiter.granted:
+                    remaining = deadline - time.perf_counter() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        self._waiting[priority].remove(waiter)
+                        raise SchedulerTimeout(f"No LLM slot for {priority.name.lower()} call within {timeout:.0f}s")
+                    waiter.cond.wait(remaining)
+        LLM_QUEUE_WAIT.labels(priority.name.lower()).observe(time.perf_counter() - started)
+
+    def release(self, priority: Priority):
+        priority = Priority(priority)
+        with self._lock:
+            self._active[priority] -= 1
+            self._running -= 1
+            LLM_ACTIVE.labels(priority.name.lower()).dec()
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: Priority, timeout: Optional[float] = None):
+        """Hold an LLM slot of the given priority for the block."""
+        self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def run(self, priority: Priority, func: Callable[..., Any], *args, **kwargs) -> Any:
+        with self.slot(priority):
+            return func(*args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "budgets": {priority.name.lower(): budget for priority, budget in self.budgets.items()},
+                "active": {priority.name.lower(): count for priority, count in self._active.items()},
+                "queued": {priority.name.lower(): len(waiting) for priority, waiting in self._waiting.items()},
+            }
+
+
+def _budget(name: str, default: int) -> int:
+    return int(os.getenv(f'LLM_BUDGET_{name}', str(default)))
+
+
+_capacity = int(os.getenv('LLM_MAX_CONCURRENT', '4'))
+llm_scheduler = LLMScheduler(
+    capacity=_capacity,
+    budgets={
+        Priority.VOICE: _budget('VOICE', _capacity),
+        Priority.TEXT: _budget('TEXT', _capacity),
+    },
+    queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', '60')),
+)
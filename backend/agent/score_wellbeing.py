@@ -0,0 +1,83 @@
+"""
+Score wellbeing signals in what users write and store per-user daily aggregates.
+
+Reads circle messages (from the group_messages search collection) and the user
+side of agent conversations (sessions whose id is a numeric user id), scores them
+with the local lexicon in a process pool and writes the wellbeing_daily
+collection served by GET /user/{id}/wellbeing.
+
+Usage:
+    python score_wellbeing.py --workers 8
+    python score_wellbeing.py --days 7                   # rescore only the last week
+    python score_wellbeing.py --days 2 --interval 3600   # keep recent days fresh, hourly
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Iterator, Optional, Tuple
+
+from repository.mongo_repository import MongoRepository
+from services.wellbeing_scoring import aggregate_wellbeing, daily_rows
+
+
+def iter_texts(repo: MongoRepository, since: Optional[str] = None, batch_size: int = 1000) -> Iterator[Tuple[Any, str, str]]:
+    """(user_id, day, text) for every circle message and user conversation turn since `since`."""
+    criteria = {"timestamp": {"$gte": since}} if since else {}
+    cursor = repo.group_messages.find(criteria, {"_id": 0, "sender": 1, "timestamp": 1, "text": 1}).batch_size(batch_size)
+    for message in cursor:
+        timestamp = message.get("timestamp")
+        if message.get("sender") is not None and isinstance(timestamp, str) and message.get("text"):
+            yield message["sender"], timestamp[:10], message["text"]
+    
+    sessions = repo.db['agent_sessions'].find(
+        {"_id": {"$regex": r"^\d+$"}}, {"history": 1}
+    ).batch_size(max(1, batch_size // 10))
+    for session in sessions:
+        user_id = int(session["_id"])
+        for entry in session.get("history", []):
+            # Turns recorded before entries were timestamped cannot be placed on a day
+            at = entry.get("at")
+            if entry.get("role") == "human" and isinstance(at, str) and (not since or at >= since):
+                yield user_id, at[:10], entry.get("content", "")
+
+
+def run(workers: int, since: Optional[str], chunk_size: int, dry_run: bool) -> int:
+    repo = MongoRepository()
+    try:
+        started = time.perf_counter()
+        totals = aggregate_wellbeing(iter_texts(repo, since), workers=workers, chunk_size=chunk_size)
+        messages = int(sum(values[0] for values in totals.values()))
+        if dry_run:
+            count = len(totals)
+        else:
+            count = repo.replace_wellbeing_days(daily_rows(totals, datetime.utcnow()), since)
+        elapsed = time.perf_counter() - started
+        rate = messages / elapsed if elapsed > 0 else 0.0
+        print(f"[INFO] Scored {messages} messages into {count} user-days in {elapsed:.2f}s "
+              f"({rate:.0f} msgs/s){' (dry run)' if dry_run else ''}")
+        return count
+    finally:
+        repo.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute per-user daily wellbeing scores from messages and conversations")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Process pool size")
+    parser.add_argument('--days', type=int, default=0, help="Only rescore the last N days (0 rescores everything)")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="Texts scored per worker task")
+    parser.add_argument('--dry-run', action='store_true', help="Score without writing")
+    parser.add_argument('--interval', type=float, default=0, help="Repeat every N seconds (0 runs once)")
+    args = parser.parse_args()
+    
+    while True:
+        since = (datetime.utcnow() - timedelta(days=args.days - 1)).strftime('%Y-%m-%d') if args.days > 0 else None
+        run(args.workers, since, args.chunk_size, args.dry_run)
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
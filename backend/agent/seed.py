@@ -0,0 +1,55 @@
+"""
+Seed MongoDB from the JSON data files.
+
+Usage:
+    python seed.py --users ../users_data.json --groups ../groups_data.json --chats ../chats_data.json
+    python seed.py --users big_users.jsonl --batch-size 5000 --upsert
+    python seed.py --reindex-messages    # rebuild the message search collection only
+    python seed.py --rebuild-feeds       # backfill the per-user activity feeds only
+    python seed.py --rebuild-stats       # recompute group member and message counters only
+"""
+
+import argparse
+import os
+from repository.mongo_repository import MongoRepository
+
+
+def main():
+    data_dir = os.path.join(os.path.dirname(__file__), '..')
+    parser = argparse.ArgumentParser(description="Seed Narrio collections from JSON or NDJSON files")
+    parser.add_argument('--users', default=os.path.join(data_dir, 'users_data.json'), help="Users file")
+    parser.add_argument('--groups', default=os.path.join(data_dir, 'groups_data.json'), help="Groups file")
+    parser.add_argument('--chats', default=os.path.join(data_dir, 'chats_data.json'), help="Group chats file")
+    parser.add_argument('--batch-size', type=int, default=None, help="Documents per bulk write (default: SEED_BATCH_SIZE or 1000)")
+    parser.add_argument('--upsert', action='store_true', help="Replace existing documents by _id instead of requiring empty collections")
+    parser.add_argument('--reindex-messages', action='store_true', help="Only rebuild the group message search collection")
+    parser.add_argument('--rebuild-feeds', action='store_true', help="Only rebuild the per-user activity feeds")
+    parser.add_argument('--rebuild-stats', action='store_true', help="Only recompute group member and message counters")
+    args = parser.parse_args()
+    
+    repo = MongoRepository()
+    try:
+        if args.reindex_messages:
+            repo.ensure_search_index()
+            repo.rebuild_message_index(args.batch_size)
+            return
+        if args.rebuild_feeds:
+            repo.ensure_feed_indexes()
+            repo.rebuild_user_feeds(args.batch_size)
+            return
+        if args.rebuild_stats:
+            repo.rebuild_group_stats()
+            return
+        repo.initialize_from_files(
+            users_file=args.users,
+            groups_file=args.groups,
+            chats_file=args.chats,
+            batch_size=args.batch_size,
+            upsert=args.upsert
+        )
+    finally:
+        repo.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+from typing import Optional, Dict, Any
+from dotenv import load_dotenv
+import asyncio
+import os
+import time
+
+load_dotenv()
+
+
+class StartupState:
+    """Tracks background bootstrap progress for the readiness probe."""
+    
+    def __init__(self):
+        self.started_at = time.time()
+        self.ready = False
+        self.ready_at: Optional[float] = None
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'ready': self.ready,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'bootstrap_seconds': (self.ready_at - self.started_at) if self.ready_at else None
+        }
+
+
+startup_state = StartupState()
+
+
+async def bootstrap_database(repo, users_file: str = None, groups_file: str = None, chats_file: str = None,
+                             retries: Optional[int] = None, delay: Optional[float] = None) -> bool:
+    """
+    Wait for MongoDB and seed empty collections, retrying with exponential backoff.
+    Blocking driver calls run in a worker thread so the event loop keeps serving.
+    """
+    if retries is None:
+        retries = int(os.getenv('STARTUP_DB_RETRIES', '10'))
+    if delay is None:
+        delay = float(os.getenv('STARTUP_DB_RETRY_DELAY', '1.0'))
+    
+    for attempt in range(1, retries + 1):
+        startup_state.attempts = attempt
+        try:
+            await asyncio.to_thread(repo.client.admin.command, 'ping')
+            await asyncio.to_thread(repo.initialize_from_files, users_file, groups_file, chats_file)
+            startup_state.ready = True
+            startup_state.ready_at = time.time()
+            startup_state.last_error = None
+            print(f"[INFO] Database bootstrap completed after {attempt} attempt(s)")
+            return True
+        except Exception as e:
+            startup_state.last_error = str(e)
+            print(f"[WARN] Database bootstrap attempt {attempt}/{retries} failed: {e}")
+            if attempt < retries:
+                await asyncio.sleep(min(delay * 2 ** (attempt - 1), 30.0))
+    
+    print("[ERROR] Database bootstrap gave up; readiness will stay false")
+    return False
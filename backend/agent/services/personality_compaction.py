@@ -0,0 +1,188 @@
+"""
+Compaction of learned personality profiles.
+
+Profiles grow by key-by-key merges of the model's extraction JSON, so they collect
+differently spelled keys and near-identical descriptions. Compaction canonicalizes
+keys, merges list values as sets and drops near-duplicate entries using local
+string similarity, shrinking the personality section of every system prompt.
+Entries whose numbers or content words differ are never merged.
+"""
+
+from difflib import SequenceMatcher
+from itertools import islice
+from multiprocessing import Pool
+from typing import Any, Dict, Iterable, List, Tuple
+import re
+
+from repository.personality_store import format_personality_summary
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.85
+# Short texts differ in a letter or two while meaning something else ("cat"/"rat"),
+# so the character ratio is only used for longer ones
+CHAR_RATIO_MIN_WORDS = 4
+# Words whose presence or absence doesn't change the fact a text states
+_COMMON_WORDS = frozenset("""
+    a an the and or of in on at to for with from by about as is are was were be been being has have had
+    he she they his her their him them it its i me my we our you your also very really quite much
+    likes like loves love enjoys enjoy
+""".split())
+
+_WORD = re.compile(r"\w+")
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def canonical_key(key: Any) -> str:
+    """Normalize a key: lower case snake_case without surrounding separators."""
+    return re.sub(r"[^0-9a-z]+", "_", str(key).strip().lower()).strip("_") or "_"
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate prompt token count (words and punctuation marks)."""
+    return len(_TOKEN.findall(text))
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    Similarity of two texts in [0, 1]: word-set Jaccard, or the higher of that and
+    the character ratio when both texts have at least CHAR_RATIO_MIN_WORDS words.
+    """
+    a, b = a.strip().lower(), b.strip().lower()
+    if a == b:
+        return 1.0
+    words_a, words_b = _WORD.findall(a), _WORD.findall(b)
+    set_a, set_b = set(words_a), set(words_b)
+    jaccard = len(set_a & set_b) / len(set_a | set_b) if set_a | set_b else 0.0
+    if jaccard >= 0.999 or min(len(words_a), len(words_b)) < CHAR_RATIO_MIN_WORDS:
+        return jaccard
+    return max(jaccard, SequenceMatcher(None, a, b).ratio())
+
+
+def _spelling_variant(a: str, b: str) -> bool:
+    """Whether two different words are a plural or spelling variant of each other."""
+    if min(len(a), len(b)) < 5:
+        return a.rstrip("s") == b.rstrip("s")
+    return SequenceMatcher(None, a, b).ratio() >= 0.85
+
+
+def conflicting(a: str, b: str) -> bool:
+    """
+    Whether two texts state different facts: their numbers differ, or a content
+    word of one has no spelling variant in the other ("owns a cat" / "owns a rat").
+    """
+    words_a, words_b = set(_WORD.findall(a.lower())), set(_WORD.findall(b.lower()))
+    numbers_a = {word for word in words_a if any(ch.isdigit() for ch in word)}
+    numbers_b = {word for word in words_b if any(ch.isdigit() for ch in word)}
+    if numbers_a != numbers_b:
+        return True
+    only_a = words_a - words_b - numbers_a - _COMMON_WORDS
+    only_b = words_b - words_a - numbers_b - _COMMON_WORDS
+    return (any(not any(_spelling_variant(x, y) for y in only_b) for x in only_a)
+            or any(not any(_spelling_variant(y, x) for x in only_a) for y in only_b))
+
+
+def is_duplicate(a: str, b: str, threshold: float = DEFAULT_SIMILARITY_THRESHOLD) -> bool:
+    """Whether two texts are near-duplicates that can be collapsed into one."""
+    return not conflicting(a, b) and similarity(a, b) >= threshold
+
+
+def dedupe_values(values: Iterable[Any], threshold: float = DEFAULT_SIMILARITY_THRESHOLD) -> List[Any]:
+    """Set-union of values that also drops near-duplicate strings (keeping the longer one)."""
+    result: List[Any] = []
+    for value in values:
+        if not isinstance(value, str):
+            if value not in result:
+                result.append(value)
+            continue
+        for idx, existing in enumerate(result):
+            if isinstance(existing, str) and is_duplicate(existing, value, threshold):
+                if len(value) > len(existing):
+                    result[idx] = value
+                break
+        else:
+            result.append(value)
+    return result
+
+
+def merge_values(a: Any, b: Any, threshold: float = DEFAULT_SIMILARITY_THRESHOLD) -> Any:
+    """Merge two values stored under the same canonical key."""
+    if isinstance(a, dict) and isinstance(b, dict):
+        result = compact_personality(a, threshold)
+        for key, value in compact_personality(b, threshold).items():
+            result[key] = merge_values(result[key], value, threshold) if key in result else value
+        return result
+    if isinstance(a, list) or isinstance(b, list):
+        a_items = a if isinstance(a, list) else [a]
+        b_items = b if isinstance(b, list) else [b]
+        return dedupe_values(a_items + b_items, threshold)
+    if isinstance(a, str) and isinstance(b, str) and is_duplicate(a, b, threshold):
+        return a if len(a) >= len(b) else b
+    if a == b:
+        return a
+    return dedupe_values([a, b], threshold)
+
+
+def compact_personality(personality: Dict[str, Any], threshold: float = DEFAULT_SIMILARITY_THRESHOLD) -> Dict[str, Any]:
+    """
+    Return a compacted copy of a personality profile.
+
+    - keys that canonicalize to the same name are merged
+    - lists are deduplicated with set semantics and near-duplicate strings removed
+    - sibling text values that are near-duplicates of each other are collapsed
+    """
+    merged: Dict[str, Any] = {}
+    for key, value in personality.items():
+        name = canonical_key(key)
+        if isinstance(value, dict):
+            value = compact_personality(value, threshold)
+        elif isinstance(value, list):
+            value = dedupe_values(value, threshold)
+        merged[name] = merge_values(merged[name], value, threshold) if name in merged else value
+    
+    # Drop sibling text values that repeat an earlier sibling
+    compacted: Dict[str, Any] = {}
+    for key, value in merged.items():
+        if isinstance(value, str):
+            duplicate_of = next(
+                (other for other, kept in compacted.items()
+                 if isinstance(kept, str) and is_duplicate(kept, value, threshold)),
+                None
+            )
+            if duplicate_of is not None:
+                if len(value) > len(compacted[duplicate_of]):
+                    compacted[duplicate_of] = value
+                continue
+        compacted[key] = value
+    return compacted
+
+
+def compact_profile(item: Tuple[Any, Dict[str, Any], float]) -> Dict[str, Any]:
+    """Compact one (owner_id, personality, threshold) item and measure the prompt savings."""
+    owner_id, personality, threshold = item
+    compacted = compact_personality(personality, threshold)
+    return {
+        "owner_id": owner_id,
+        "personality": compacted,
+        "changed": compacted != personality,
+        "tokens_before": estimate_tokens(format_personality_summary(personality)),
+        "tokens_after": estimate_tokens(format_personality_summary(compacted)),
+    }
+
+
+def compact_profiles(profiles: Iterable[Tuple[Any, Dict[str, Any]]], workers: int = 1,
+                     threshold: float = DEFAULT_SIMILARITY_THRESHOLD, chunksize: int = 16) -> Iterable[Dict[str, Any]]:
+    """
+    Compact many profiles, in a process pool when workers > 1. Results come back
+    in completion order, and profiles are read from `profiles` a window at a time
+    so only a few chunks per worker are in flight.
+    """
+    items = ((owner_id, personality, threshold) for owner_id, personality in profiles)
+    if workers <= 1:
+        yield from map(compact_profile, items)
+        return
+    window = workers * chunksize * 4
+    with Pool(processes=workers) as pool:
+        while True:
+            batch = list(islice(items, window))
+            if not batch:
+                break
+            yield from pool.imap_unordered(compact_profile, batch, chunksize=chunksize)
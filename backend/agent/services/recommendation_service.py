@@ -0,0 +1,259 @@
+"""
+Circle (group) recommendations.
+
+Users and groups become bag-of-words vectors over the group vocabulary: groups
+from their tags, category, matchReason, name and description; users from their
+sport and food preferences, facts and, optionally, the keys and values of their
+learned personality. Vectors are TF-IDF weighted and L2-normalized, so a batch of
+users is scored against every group with a single matrix product (cosine
+similarity). A background job keeps the top-k groups per user in the
+group_recommendations collection; the API only reads that table.
+
+Environment:
+    RECOMMENDATION_TOP_K             groups kept per user (default 5)
+    RECOMMENDATION_BATCH_SIZE        users scored per matrix product (default 1024)
+    RECOMMENDATION_REFRESH_INTERVAL  seconds between recomputations (default 3600, 0 = once at startup)
+    RECOMMENDATION_USE_PERSONALITY   include learned personality in user vectors (default true)
+    RECOMMENDATION_LOCK_TTL          seconds a run's lease lasts without renewal (default 600)
+
+Every API worker runs the job, so a run first takes the `group_recommendations`
+lease in the job_locks collection; runs that find it held by a live owner are
+skipped. The lease is renewed after every scored batch.
+"""
+
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import asyncio
+import math
+import os
+import re
+import time
+import uuid
+
+import numpy as np
+
+from services.bootstrap_service import startup_state
+
+_WORD = re.compile(r"[a-z]+")
+STOPWORDS = frozenset("""
+    a about after age all also an and any are as at be been but by can could did do does for from had has have
+    he her here his how i if in into is it its just like love loves me more most my not of on once one or our
+    out over she so some still such than that the their them then there these they this those through to too
+    up very was we were what when where which while who will with would year years yet you your
+""".split())
+# Longest suffix first; stems shorter than three letters are left alone
+_SUFFIXES = (("ies", "y"), ("ing", ""), ("ers", ""), ("er", ""), ("ed", ""), ("s", ""))
+
+GROUP_FIELD_WEIGHTS = {'tags': 3.0, 'category': 2.0, 'matchReason': 1.0, 'name': 1.0, 'description': 1.0}
+USER_FIELD_WEIGHTS = {'sport_preference': 2.0, 'food_preference': 1.0, 'facts': 1.0, 'personality': 1.0}
+
+
+def stem(word: str) -> str:
+    """Crude suffix stripping so 'walks', 'walking' and 'walkers' share a term."""
+    for suffix, replacement in _SUFFIXES:
+        if word.endswith(suffix) and not word.endswith("ss") and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)] + replacement
+            if suffix in ("ing", "ed", "er", "ers") and len(word) > 3 and word[-1] == word[-2] and word[-1] not in "lsz":
+                word = word[:-1]
+            return word
+    return word
+
+
+def tokenize(text: str, labels: Optional[Dict[str, str]] = None) -> List[str]:
+    """Stemmed content words of a text; `labels` collects a readable word per stem."""
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        if len(word) < 3 or word in STOPWORDS:
+            continue
+        term = stem(word)
+        if labels is not None:
+            labels.setdefault(term, word)
+        terms.append(term)
+    return terms
+
+
+def _texts(value: Any, keys: bool = False) -> Iterator[str]:
+    """Every string in a (possibly nested) value; dict keys too when `keys` is set."""
+    if isinstance(value, str):
+        yield value.replace('_', ' ').replace('-', ' ')
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            if keys:
+                yield str(key).replace('_', ' ')
+            yield from _texts(item, keys)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _texts(item, keys)
+
+
+def group_terms(group: Dict[str, Any], labels: Optional[Dict[str, str]] = None) -> Counter:
+    """Weighted term counts of a group."""
+    terms: Counter = Counter()
+    for field, weight in GROUP_FIELD_WEIGHTS.items():
+        for text in _texts(group.get(field)):
+            for term in tokenize(text, labels):
+                terms[term] += weight
+    return terms
+
+
+def user_terms(user: Dict[str, Any], include_personality: bool = True) -> Counter:
+    """Weighted term counts of a user's preferences, facts and (optionally) personality."""
+    terms: Counter = Counter()
+    for field, weight in USER_FIELD_WEIGHTS.items():
+        if field == 'personality' and not include_personality:
+            continue
+        for text in _texts(user.get(field), keys=field == 'personality'):
+            for term in tokenize(text):
+                terms[term] += weight
+    return terms
+
+
+class TermSpace:
+    """TF-IDF vector space over the terms that appear in groups."""
+
+    def __init__(self, documents: List[Counter], labels: Optional[Dict[str, str]] = None):
+        self.terms = sorted({term for document in documents for term in document})
+        self.index = {term: col for col, term in enumerate(self.terms)}
+        self.labels = labels or {}
+        df = np.zeros(len(self.terms), dtype=np.float32)
+        for document in documents:
+            df[[self.index[term] for term in document]] += 1
+        self.idf = np.log((1 + len(documents)) / (1 + df)) + 1
+
+    def vectors(self, documents: List[Counter]) -> np.ndarray:
+        """One L2-normalized row per document; terms outside the space are ignored."""
+        rows, cols, weights = [], [], []
+        for row, document in enumerate(documents):
+            for term, count in document.items():
+                col = self.index.get(term)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+                    weights.append(1 + math.log(count) if count >= 1 else count)
+        matrix = np.zeros((len(documents), len(self.terms)), dtype=np.float32)
+        matrix[rows, cols] = weights
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    def shared_terms(self, a: np.ndarray, b: np.ndarray, limit: int = 3) -> List[str]:
+        """The terms contributing most to the similarity of two vectors."""
+        contributions = a * b
+        cols = np.argsort(contributions)[::-1][:limit]
+        return [self.labels.get(self.terms[col], self.terms[col]) for col in cols if contributions[col] > 0]
+
+
+def top_k(scores: np.ndarray, k: int):
+    """Column indices and scores of the k best entries per row, best first."""
+    k = min(k, scores.shape[1])
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1)
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def _batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+RECOMMENDATION_LOCK = 'group_recommendations'
+
+
+class RecommendationJobBusy(Exception):
+    """Another worker is recomputing recommendations."""
+
+
+def compute_recommendations(repo, k: Optional[int] = None, batch_size: Optional[int] = None,
+                            include_personality: Optional[bool] = None) -> int:
+    """
+    Score every user against every group and replace the top-k table. Returns the number of users.
+    Raises RecommendationJobBusy while another run holds the job lease.
+    """
+    ttl = float(os.getenv('RECOMMENDATION_LOCK_TTL', '600'))
+    owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+    if not repo.acquire_job_lock(RECOMMENDATION_LOCK, owner, ttl):
+        raise RecommendationJobBusy('Group recommendations are already being computed')
+    try:
+        return _compute_recommendations(repo, owner, ttl, k, batch_size, include_personality)
+    finally:
+        repo.release_job_lock(RECOMMENDATION_LOCK, owner)
+
+
+def _compute_recommendations(repo, owner: str, ttl: float, k: Optional[int], batch_size: Optional[int],
+                             include_personality: Optional[bool]) -> int:
+    if k is None:
+        k = int(os.getenv('RECOMMENDATION_TOP_K', '5'))
+    if batch_size is None:
+        batch_size = int(os.getenv('RECOMMENDATION_BATCH_SIZE', '1024'))
+    if include_personality is None:
+        include_personality = os.getenv('RECOMMENDATION_USE_PERSONALITY', 'true').lower() in ('1', 'true', 'yes')
+
+    started = time.perf_counter()
+    groups = [group for group in repo.get_all_groups() if '_id' in group]
+    labels: Dict[str, str] = {}
+    documents = [group_terms(group, labels) for group in groups]
+    space = TermSpace(documents, labels)
+    group_matrix = space.vectors(documents)
+    group_ids = [group['_id'] for group in groups]
+    column = {group_id: col for col, group_id in enumerate(group_ids)}
+    computed_at = datetime.utcnow()
+
+    fields = ['groups'] + [field for field in USER_FIELD_WEIGHTS if field != 'personality' or include_personality]
+
+    def rows() -> Iterator[Dict[str, Any]]:
+        for users in _batches(repo.iter_user_profiles(fields, batch_size), batch_size):
+            if not repo.acquire_job_lock(RECOMMENDATION_LOCK, owner, ttl):
+                raise RuntimeError('Lost the group recommendation lease to another worker')
+            user_matrix = space.vectors([user_terms(user, include_personality) for user in users])
+            scores = user_matrix @ group_matrix.T
+            # Groups a user already belongs to are never recommended
+            member_rows, member_cols = [], []
+            for row, user in enumerate(users):
+                for group_id in user.get('groups') or []:
+                    if group_id in column:
+                        member_rows.append(row)
+                        member_cols.append(column[group_id])
+            scores[member_rows, member_cols] = -np.inf
+            best, best_scores = top_k(scores, k) if group_ids else (None, None)
+            for row, user in enumerate(users):
+                recommended = []
+                if best is not None:
+                    for col, score in zip(best[row], best_scores[row]):
+                        if score > 0:
+                            recommended.append({
+                                'group_id': group_ids[col],
+                                'score': round(float(score), 4),
+                                'matched': space.shared_terms(user_matrix[row], group_matrix[col]),
+                            })
+                yield {'_id': user['_id'], 'groups': recommended, 'computed_at': computed_at}
+
+    count = repo.replace_group_recommendations(rows())
+    print(f"[INFO] Computed group recommendations for {count} users against {len(groups)} groups "
+          f"in {time.perf_counter() - started:.2f}s")
+    return count
+
+
+async def run_recommendation_job(repo, interval: Optional[float] = None):
+    """Recompute recommendations once the database is ready, then every `interval` seconds."""
+    if interval is None:
+        interval = float(os.getenv('RECOMMENDATION_REFRESH_INTERVAL', '3600'))
+    while not startup_state.ready:
+        await asyncio.sleep(1.0)
+    while True:
+        try:
+            await asyncio.to_thread(compute_recommendations, repo)
+        except RecommendationJobBusy:
+            print("[INFO] Group recommendations are being computed by another worker, skipping this run")
+        except Exception as e:
+            print(f"[WARN] Group recommendation job failed: {e}")
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
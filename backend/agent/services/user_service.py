@@ -1,13 +1,16 @@
 from repository.mongo_repository import MongoRepository
-from typing import List, Dict, Any
+from services.realtime_service import publish_group_message
+from services.wellbeing_scoring import summarize_days
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+import asyncio
+import hashlib
+import time
 
 mongo_repo = MongoRepository()
 
 def get_user_name_by_id(user_id: int) -> str:
-    user = mongo_repo.get_user(user_id)
-    if user:
-        return user.get('name', '')
-    return ''
+    return mongo_repo.get_user_names([user_id]).get(user_id, '')
 
 def get_user_groups(user_id: int) -> List[Dict[str, Any]]:
     """Get all groups that a user belongs to."""
@@ -24,12 +27,140 @@ def get_user_groups(user_id: int) -> List[Dict[str, Any]]:
     
     return groups
 
+def is_group_member(group_id: int, user_id: int) -> bool:
+    """Whether the group is in the user's groups, the membership list feeds and search use."""
+    user = mongo_repo.get_user(user_id)
+    return bool(user) and group_id in (user.get('groups') or [])
+
 def get_group_chats_with_names(group_id: int) -> List[Dict[str, Any]]:
-    """Get all chats for a group."""
+    """Get all chats for a group with sender names resolved server-side."""
     chats = mongo_repo.get_group_chat_messages(group_id)
     # print(f"Fetched {len(chats)} chats for group ID {group_id}")
+    return resolve_sender_names(chats)
+
+def resolve_sender_names(chats: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fill in each message's senderName from the user name cache."""
+    sender_ids = [message.get('sender') for chat in chats for message in chat.get('messages', [])]
+    names = mongo_repo.get_user_names([sender for sender in sender_ids if sender is not None])
+    for chat in chats:
+        for message in chat.get('messages', []):
+            name = names.get(message.get('sender'))
+            if name:
+                message['senderName'] = name
     return chats
 
-def add_message_to_group(group_id: int, message: Dict[str, Any]) -> bool:
-    """Add a new message to a group's chat."""
-    return mongo_repo.append_message_to_group(group_id, message)
+def get_group_chats_since(group_id: int, since_id: Optional[int] = None, since: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Get only the chat messages of a group newer than the given message id or timestamp."""
+    return resolve_sender_names(mongo_repo.get_group_chat_messages_since(group_id, since_id, since))
+
+def get_group_chats_etag(group_id: int, since_id: Optional[int] = None, since: Optional[str] = None) -> str:
+    """
+    Build an ETag for a group's chats from its version marker, the request cursor and
+    the name cache generation (sender names are resolved into the response). Renames
+    this worker does not hear about show up when the name cache TTL window turns over.
+    """
+    version = mongo_repo.get_group_chat_version(group_id) or {}
+    names = f"{mongo_repo.names_generation}.{int(time.time() // mongo_repo.name_cache.ttl)}"
+    key = f"{group_id}:{version.get('count', 0)}:{version.get('last_id')}:{version.get('last_timestamp')}:{since_id}:{since}:{names}"
+    return 'W/"' + hashlib.sha1(key.encode('utf-8')).hexdigest() + '"'
+
+_background_tasks = set()
+
+def _feed_fan_out_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[WARN] Feed fan-out failed: {task.exception()}")
+
+async def add_message_to_group(group_id: int, message: Dict[str, Any]) -> bool:
+    """
+    Add a new message to a group's chat and push it to the group's live subscribers.
+    Members' feeds are updated afterwards in the background, off the event loop.
+    """
+    success = await asyncio.to_thread(mongo_repo.append_message_to_group, group_id, message)
+    if success:
+        await publish_group_message(group_id, message)
+        task = asyncio.create_task(asyncio.to_thread(mongo_repo.fan_out_to_feeds, group_id, message))
+        _background_tasks.add(task)
+        task.add_done_callback(_feed_fan_out_done)
+    return success
+
+def _with_sender_names(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    names = mongo_repo.get_user_names([message['sender'] for message in messages if message.get('sender') is not None])
+    for message in messages:
+        name = names.get(message.get('sender'))
+        if name:
+            message['senderName'] = name
+    return messages
+
+def search_group_messages(group_id: int, query: str, page: int = 1, page_size: int = 20) -> Tuple[List[Dict[str, Any]], bool]:
+    """Relevance-ranked messages of one group matching the query, and whether more pages exist."""
+    hits = mongo_repo.search_group_messages(query, [group_id], skip=(page - 1) * page_size, limit=page_size + 1)
+    return _with_sender_names(hits[:page_size]), len(hits) > page_size
+
+def search_user_circles(user_id: int, query: str, page: int = 1, page_size: int = 20) -> Tuple[List[Dict[str, Any]], bool]:
+    """Like search_group_messages, across the groups the user belongs to."""
+    user = mongo_repo.get_user(user_id)
+    group_ids = user.get('groups', []) if user else []
+    if not group_ids:
+        return [], False
+    hits = mongo_repo.search_group_messages(query, group_ids, skip=(page - 1) * page_size, limit=page_size + 1)
+    return _with_sender_names(hits[:page_size]), len(hits) > page_size
+
+def get_recommended_groups(user_id: int, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[Any]]:
+    """
+    The user's precomputed group recommendations, best first, and when they were computed.
+    Groups the user joined since the last run are left out.
+    """
+    row = mongo_repo.get_group_recommendations(user_id)
+    if not row:
+        return [], None
+    user = mongo_repo.get_user(user_id) or {}
+    joined = set(user.get('groups') or [])
+    groups = []
+    for entry in row.get('groups', []):
+        if entry['group_id'] in joined:
+            continue
+        group = mongo_repo.get_group(entry['group_id'])
+        if group:
+            groups.append({**group, 'score': entry['score'], 'matched': entry.get('matched', [])})
+        if limit is not None and len(groups) >= limit:
+            break
+    return groups, row.get('computed_at')
+
+def get_user_feed(user_id: int, limit: int = 50) -> Dict[str, Any]:
+    """The user's newest circle messages across all groups, with unread counts per group."""
+    feed = mongo_repo.get_user_feed(user_id, limit) or {}
+    unread = {int(group_id): count for group_id, count in (feed.get('unread') or {}).items() if count > 0}
+    return {
+        'items': feed.get('items', []),
+        'unread': unread,
+        'unread_total': sum(unread.values()),
+        'updated_at': feed.get('updated_at')
+    }
+
+def mark_feed_read(user_id: int, group_id: Optional[int] = None):
+    """Clear unread counts for one group of the user's feed, or all of them."""
+    mongo_repo.mark_feed_read(user_id, group_id)
+
+def get_group_stats(group_id: int, days: int = 30) -> Optional[Dict[str, Any]]:
+    """A group's member and message counters, with per-day message counts for the most recent active days."""
+    stats = mongo_repo.get_group_stats(group_id)
+    if stats is None:
+        return None
+    recent_days = sorted(stats['messagesPerDay'])[-days:] if days > 0 else []
+    stats['messagesPerDay'] = {day: stats['messagesPerDay'][day] for day in recent_days}
+    return stats
+
+def get_user_wellbeing(user_id: int, days: int = 30) -> Dict[str, Any]:
+    """The user's daily wellbeing scores over the last `days` days and a summary of them."""
+    since = (datetime.utcnow() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    daily = mongo_repo.get_wellbeing_days(user_id, since)
+    return {
+        'since': since,
+        'daily': daily,
+        'summary': summarize_days(daily)
+    }
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit/miss metrics of the repository caches."""
+    return mongo_repo.cache_stats()
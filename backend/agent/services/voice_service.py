@@ -1,19 +1,27 @@
 from fastapi import WebSocket, WebSocketDisconnect
-from elevenlabs import VoiceSettings
-from elevenlabs.client import ElevenLabs
 from typing import Dict, Any
 from dotenv import load_dotenv
 import os
 import json
 from typing import IO
 from io import BytesIO
+from memory_tracker import memory_tracker
 
 load_dotenv()
 
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
-elevenlabs = ElevenLabs(
-    api_key=ELEVENLABS_API_KEY,
-)
+elevenlabs = None
+
+
+def get_elevenlabs():
+    """Create the ElevenLabs client on first use to keep imports fast."""
+    global elevenlabs
+    if elevenlabs is None:
+        from elevenlabs.client import ElevenLabs
+        elevenlabs = ElevenLabs(
+            api_key=ELEVENLABS_API_KEY,
+        )
+    return elevenlabs
 
 def yield_text():
     yield "Yo how are you"
@@ -33,8 +41,9 @@ class VoiceService:
     
     async def handle_audio_stream(self, websocket: WebSocket, client_id: str):
         """Handle incoming audio stream from client."""
+        from elevenlabs import VoiceSettings
 
-        response = elevenlabs.text_to_speech.stream(
+        response = get_elevenlabs().text_to_speech.stream(
         voice_id="pNInz6obpgDQGcFmaJgB", # Adam pre-made voice
         output_format="mp3_22050_32",
         text=yield_text(),
@@ -51,9 +60,11 @@ class VoiceService:
         # Create a BytesIO object to hold the audio data in memory
         audio_stream = BytesIO()
         # Write each chunk of audio data to the stream
-        for chunk in response:
-            if chunk:
-                audio_stream.write(chunk)
+        with memory_tracker.track_buffer('tts_stream') as buffer:
+            for chunk in response:
+                if chunk:
+                    audio_stream.write(chunk)
+                    buffer.resize(audio_stream.tell())
         # Reset stream position to the beginning
         audio_stream.seek(0)
         # Return the stream for further use
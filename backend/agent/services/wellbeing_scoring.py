@@ -0,0 +1,198 @@
+"""
+Offline wellbeing signal scoring.
+
+Scores what users write (circle messages and their side of agent conversations)
+against a small local lexicon, with no external service. Texts are tokenized,
+mapped to lexicon ids and scored for a whole chunk at once with NumPy: every
+token hit gathers its category weights from a (vocabulary x category) matrix,
+and scatter-adds them onto its (user, day) row. A negator up to three words
+back in the same clause ("not happy", "never lonely", but not "not bad, happy")
+flips positive and negative and mutes the other categories. Chunks are scored in a process pool and merged into per-user
+daily aggregates.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import chain, islice, repeat
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+import re
+
+import numpy as np
+
+CATEGORIES = ("positive", "negative", "lonely", "anxious", "grateful", "tired")
+
+LEXICON: Dict[str, Dict[str, float]] = {
+    "positive": dict.fromkeys("""
+        happy glad joy joyful wonderful lovely great good nice enjoy enjoyed enjoying fun delighted cheerful
+        calm peaceful relaxed content pleased proud excited hopeful laugh laughed laughing smile smiled
+        smiling love loved warm beautiful better fine well blessed comfortable""".split(), 1.0),
+    "negative": dict.fromkeys("""
+        sad unhappy miserable depressed down upset cry cried crying tears awful terrible bad worse worst
+        hurt hurts pain painful angry annoyed frustrated bored hopeless empty lost grief grieving miss
+        missed missing sorry struggle struggling difficult hard sick ill""".split(), 1.0),
+    "lonely": dict.fromkeys("""
+        lonely loneliness alone isolated isolation abandoned forgotten nobody unseen left""".split(), 1.0),
+    "anxious": dict.fromkeys("""
+        anxious anxiety worried worry worries worrying nervous scared afraid fear fearful panic stressed
+        stress restless uneasy""".split(), 1.0),
+    "grateful": dict.fromkeys("""
+        grateful thankful thanks thank appreciate appreciated gratitude lucky fortunate""".split(), 1.0),
+    "tired": dict.fromkeys("""
+        tired exhausted weary sleepy sleepless insomnia drained fatigue fatigued""".split(), 1.0),
+}
+# Weak or ambiguous words count less
+for _word in ("good", "nice", "fine", "well", "better", "down", "hard", "left", "lost", "miss", "missed", "missing", "bad"):
+    for _weights in LEXICON.values():
+        if _word in _weights:
+            _weights[_word] = 0.5
+
+NEGATORS = frozenset("""
+    not no never nothing nobody hardly barely without don't doesn't didn't isn't wasn't aren't weren't
+    can't cannot couldn't won't wouldn't haven't hasn't dont doesnt didnt isnt wasnt cant wont""".split())
+NEGATION_WINDOW = 3
+
+# Words, and the punctuation that ends a clause (negation does not reach past it)
+_TOKEN = re.compile(r"[a-z]+(?:'[a-z]+)?|[.,;:!?()\u2014]")
+
+
+def _build_matrices() -> Tuple[Dict[str, int], np.ndarray, np.ndarray]:
+    vocabulary: Dict[str, int] = {}
+    for weights in LEXICON.values():
+        for word in weights:
+            vocabulary.setdefault(word, len(vocabulary))
+    weights = np.zeros((len(vocabulary), len(CATEGORIES)), dtype=np.float32)
+    for col, category in enumerate(CATEGORIES):
+        for word, weight in LEXICON[category].items():
+            weights[vocabulary[word], col] = weight
+    # Under negation positive and negative swap; the other categories do not fire
+    negated = np.zeros_like(weights)
+    negated[:, CATEGORIES.index("positive")] = weights[:, CATEGORIES.index("negative")]
+    negated[:, CATEGORIES.index("negative")] = weights[:, CATEGORIES.index("positive")]
+    return vocabulary, weights, negated
+
+
+VOCABULARY, WEIGHTS, NEGATED_WEIGHTS = _build_matrices()
+
+
+_NEGATOR = -2
+_CLAUSE_BREAK = -3
+_LOOKUP: Dict[str, int] = {**dict.fromkeys(".,;:!?()\u2014", _CLAUSE_BREAK), **dict.fromkeys(NEGATORS, _NEGATOR), **VOCABULARY}
+
+
+def score_texts(texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-text category scores (texts x categories) and word counts."""
+    token_lists = [_TOKEN.findall(text.lower().replace("’", "'")) if text else [] for text in texts]
+    tokens = list(chain.from_iterable(token_lists))
+    codes = np.fromiter(map(_LOOKUP.get, tokens, repeat(-1)), dtype=np.int64, count=len(tokens))
+    owners = np.repeat(np.arange(len(texts)), [len(token_list) for token_list in token_lists])
+    is_break = codes == _CLAUSE_BREAK
+    lengths = np.bincount(owners[~is_break], minlength=len(texts)).astype(np.int64)
+    
+    # A hit is negated when a negator of the same text and clause precedes it within the window
+    clauses = np.cumsum(is_break)
+    is_negator = codes == _NEGATOR
+    negated = np.zeros(len(codes), dtype=bool)
+    for shift in range(1, NEGATION_WINDOW + 1):
+        negated[shift:] |= (is_negator[:-shift] & (owners[shift:] == owners[:-shift])
+                            & (clauses[shift:] == clauses[:-shift]))
+    
+    hits = codes >= 0
+    scores = np.zeros((len(texts), len(CATEGORIES)), dtype=np.float32)
+    if hits.any():
+        ids = codes[hits]
+        contributions = np.where(negated[hits][:, None], NEGATED_WEIGHTS[ids], WEIGHTS[ids])
+        np.add.at(scores, owners[hits], contributions)
+    return scores, lengths
+
+
+def score_chunk(items: List[Tuple[Any, str, str]]) -> List[Tuple[Any, str, List[float]]]:
+    """
+    Score (user_id, day, text) items and sum them per (user, day).
+    Each result row is [messages, tokens, *category scores].
+    """
+    scores, tokens = score_texts([text for _, _, text in items])
+    keys: Dict[Tuple[Any, str], int] = {}
+    rows = np.asarray([keys.setdefault((user_id, day), len(keys)) for user_id, day, _ in items], dtype=np.int64)
+    totals = np.zeros((len(keys), 2 + len(CATEGORIES)), dtype=np.float64)
+    np.add.at(totals[:, 0], rows, 1)
+    np.add.at(totals[:, 1], rows, tokens)
+    np.add.at(totals[:, 2:], rows, scores)
+    return [(user_id, day, totals[row].tolist()) for (user_id, day), row in keys.items()]
+
+
+def _chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def aggregate_wellbeing(items: Iterable[Tuple[Any, str, str]], workers: int = 1,
+                        chunk_size: int = 5000) -> Dict[Tuple[Any, str], np.ndarray]:
+    """
+    Per (user, day) totals over all items, scoring chunks in a process pool when
+    workers > 1. At most two chunks per worker are in flight, so memory stays
+    bounded however many items the source yields.
+    """
+    totals: Dict[Tuple[Any, str], np.ndarray] = {}
+
+    def merge(results: List[Tuple[Any, str, List[float]]]):
+        for user_id, day, values in results:
+            key = (user_id, day)
+            if key in totals:
+                totals[key] += values
+            else:
+                totals[key] = np.asarray(values, dtype=np.float64)
+
+    if workers <= 1:
+        for chunk in _chunks(items, chunk_size):
+            merge(score_chunk(chunk))
+        return totals
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for chunk in _chunks(items, chunk_size):
+            pending.add(pool.submit(score_chunk, chunk))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    merge(future.result())
+        for future in pending:
+            merge(future.result())
+    return totals
+
+
+def daily_rows(totals: Dict[Tuple[Any, str], np.ndarray], computed_at: Any = None) -> Iterator[Dict[str, Any]]:
+    """
+    Documents for the wellbeing_daily collection. `mood` is (positive - negative) /
+    (positive + negative) in [-1, 1], or None on days without any signal words.
+    """
+    for (user_id, day), values in totals.items():
+        scores = {category: round(float(value), 3) for category, value in zip(CATEGORIES, values[2:])}
+        polar = scores["positive"] + scores["negative"]
+        yield {
+            "_id": f"{user_id}:{day}",
+            "user_id": user_id,
+            "day": day,
+            "messages": int(values[0]),
+            "tokens": int(values[1]),
+            "scores": scores,
+            "mood": round((scores["positive"] - scores["negative"]) / polar, 3) if polar else None,
+            "computed_at": computed_at,
+        }
+
+
+def summarize_days(days: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Message-weighted mood over the given daily rows, and totals per category."""
+    weighted = [(day["mood"], day["messages"]) for day in days if day.get("mood") is not None]
+    weight = sum(messages for _, messages in weighted)
+    return {
+        "days": len(days),
+        "messages": sum(day.get("messages", 0) for day in days),
+        "mood": round(sum(mood * messages for mood, messages in weighted) / weight, 3) if weight else None,
+        "scores": {
+            category: round(sum(day.get("scores", {}).get(category, 0.0) for day in days), 3)
+            for category in CATEGORIES
+        },
+    }
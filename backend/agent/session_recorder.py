@@ -0,0 +1,129 @@
+"""
+Opt-in recorder of real conversation sessions for later replay.
+
+When SESSION_RECORDING_DIR is set, chat, greeting and voice endpoints append one
+JSON line per turn: an anonymized session id, arrival time, endpoint, audio size,
+server latency and the length of the user's text. bench/replay.py re-drives these
+files with the original timing.
+
+Text itself is only recorded with SESSION_RECORDING_TEXT=redacted, and then only
+words from a small allow-list of common words survive: everything else (names,
+places, numbers, contact details) becomes a placeholder.
+
+Environment:
+    SESSION_RECORDING_DIR   directory for recordings-YYYYMMDD.jsonl files (unset = disabled)
+    SESSION_RECORDING_SALT  salt for hashing session ids (set it to correlate across workers)
+    SESSION_RECORDING_TEXT  'length' (default), 'redacted' or 'none'
+"""
+
+from typing import Any, Optional
+import hashlib
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+
+_TOKEN = re.compile(
+    r"(?P<email>\b[\w.+-]+@[\w-]+\.[\w.-]+\b)"
+    r"|(?P<num>\d[\d\s\-/().:]*\d|\d)"
+    r"|(?P<word>[^\W\d_]+(?:'[^\W\d_]+)?)"
+)
+# Words kept by redact_text; any other word could be a name or a place
+ALLOWED_WORDS = frozenset("""
+    a about after again all also am an and any are as at away back bad be because been before being better
+    but by can can't could day days did didn't do does doesn't don't down each even every feel feeling felt
+    fine for from get getting go going good got had has have having he her here him his home how i i'm if
+    in into is isn't it it's its just know last like little lot make many me more morning most much my
+    never new nice night no not nothing now of off ok okay old on once one only or other our out over
+    people really right said same say see she sleep so some something still sure talk tell than thank
+    thanks that that's the their them then there these they thing things think this those time to today
+    told tomorrow too up us very want was wasn't we week well went were what when where which while who
+    why will with without won't would yes yesterday yet you your
+    afternoon evening happy sad tired lonely worried walk walked friend friends family daughter son
+    grandchildren doctor weather garden dinner lunch breakfast tea coffee call called visit visited
+""".split())
+
+
+def redact_text(text: str) -> str:
+    """
+    Keep only allow-listed words, each lower-cased; emails, numbers and every
+    other word are replaced by placeholders.
+    """
+    def replace(match: re.Match) -> str:
+        word = match.group("word")
+        if word is None:
+            return f"<{match.lastgroup}>"
+        return word.lower() if word.lower() in ALLOWED_WORDS else "<word>"
+    return _TOKEN.sub(replace, text)
+
+
+class SessionRecorder:
+    """Appends anonymized turn records to a JSONL file from a background thread."""
+    
+    def __init__(self, directory: Optional[str] = None, salt: Optional[str] = None, text_mode: str = "length"):
+        self.directory = directory
+        self.salt = salt or secrets.token_hex(16)
+        self.text_mode = text_mode
+        self._queue: Optional[queue.Queue] = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._queue = queue.Queue(maxsize=10000)
+            threading.Thread(target=self._write_loop, name="session-recorder", daemon=True).start()
+    
+    @property
+    def enabled(self) -> bool:
+        return self._queue is not None
+    
+    def pending(self) -> int:
+        """Records queued but not yet written."""
+        return self._queue.qsize() if self._queue is not None else 0
+    
+    def anonymize_session(self, session_id: str) -> str:
+        return hashlib.sha256(f"{self.salt}:{session_id}".encode('utf-8')).hexdigest()[:16]
+    
+    def _text_fields(self, text: Optional[str]) -> dict:
+        if text is None or self.text_mode == "none":
+            return {}
+        if self.text_mode == "length":
+            return {"text_chars": len(text)}
+        return {"text": redact_text(text), "text_chars": len(text)}
+    
+    def record(self, endpoint: str, session_id: str, started_at: float, latency: float,
+               text: Optional[str] = None, audio_bytes: Optional[int] = None, **fields: Any):
+        """Queue one turn record; does nothing when recording is disabled."""
+        if self._queue is None:
+            return
+        entry = {
+            "session": self.anonymize_session(session_id),
+            "endpoint": endpoint,
+            "t": started_at,
+            "latency": latency,
+            **self._text_fields(text),
+            **fields,
+        }
+        if audio_bytes is not None:
+            entry["audio_bytes"] = audio_bytes
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            pass
+    
+    def _write_loop(self):
+        while True:
+            entry = self._queue.get()
+            path = os.path.join(self.directory, time.strftime("recordings-%Y%m%d.jsonl", time.gmtime(entry["t"])))
+            try:
+                with open(path, 'a') as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                print(f"[WARN] Failed to write session recording: {e}")
+
+
+recorder = SessionRecorder(
+    directory=os.getenv('SESSION_RECORDING_DIR') or None,
+    salt=os.getenv('SESSION_RECORDING_SALT') or None,
+    text_mode=os.getenv('SESSION_RECORDING_TEXT', 'length'),
+)
@@ -0,0 +1,160 @@
+"""
+Span-based tracing of voice turns.
+
+Each turn (one utterance from the user through the last audio chunk sent back)
+gets a turn id and a list of spans with offsets from the moment the user's audio
+arrived. Finished turns feed a sliding window of time-to-first-audio and can be
+exported as JSON lines to a local file (TRACE_EXPORT_FILE) and/or posted to a
+collector (TRACE_COLLECTOR_URL).
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+import json
+import math
+import os
+import queue
+import threading
+import time
+import urllib.request
+import uuid
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class TurnTrace:
+    """Spans of a single conversational turn, timed relative to the turn start."""
+    
+    def __init__(self, kind: str, session_id: str, **attributes):
+        self.turn_id = uuid.uuid4().hex
+        self.kind = kind
+        self.session_id = session_id
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.events: Dict[str, float] = {}
+        self.status = "ok"
+    
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+    
+    def mark(self, name: str, **attributes):
+        """Record an instantaneous event (e.g. first audio chunk sent)."""
+        offset = self.elapsed()
+        self.events.setdefault(name, offset)
+        self.spans.append({"name": name, "start": offset, "end": offset, **attributes})
+    
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time a stage of the turn."""
+        start = self.elapsed()
+        try:
+            yield
+        except Exception as e:
+            attributes["error"] = str(e)
+            self.status = "error"
+            raise
+        finally:
+            self.spans.append({"name": name, "start": start, "end": self.elapsed(), **attributes})
+    
+    @property
+    def time_to_first_audio(self) -> Optional[float]:
+        return self.events.get("tts_first_chunk")
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "turn_id": self.turn_id,
+            "kind": self.kind,
+            "session_id": self.session_id,
+            "started_at": self.started_at,
+            "duration": self.elapsed(),
+            "status": self.status,
+            "time_to_first_audio": self.time_to_first_audio,
+            "attributes": self.attributes,
+            "spans": self.spans,
+        }
+
+
+class TurnTracer:
+    """Collects finished turns, keeps a sliding window of time-to-first-audio and exports traces."""
+    
+    def __init__(self, window_size: int = 1000, window_seconds: float = 900.0,
+                 export_file: Optional[str] = None, collector_url: Optional[str] = None):
+        self.window_seconds = window_seconds
+        self._window: deque = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+        self.export_file = export_file
+        self.collector_url = collector_url
+        self._export_queue: Optional[queue.Queue] = None
+        if export_file or collector_url:
+            self._export_queue = queue.Queue(maxsize=10000)
+            threading.Thread(target=self._export_loop, name="turn-trace-exporter", daemon=True).start()
+    
+    def start_turn(self, kind: str, session_id: str, **attributes) -> TurnTrace:
+        return TurnTrace(kind, session_id, **attributes)
+    
+    def finish(self, turn: TurnTrace):
+        """Record a finished turn in the window and queue it for export."""
+        ttfa = turn.time_to_first_audio
+        if ttfa is not None:
+            with self._lock:
+                self._window.append((time.time(), ttfa))
+        if self._export_queue is not None:
+            try:
+                self._export_queue.put_nowait(turn.to_dict())
+            except queue.Full:
+                pass
+    
+    def window_count(self) -> int:
+        """Turns currently held in the time-to-first-audio window."""
+        with self._lock:
+            return len(self._window)
+    
+    def summary(self) -> Dict[str, Any]:
+        """p50/p95/p99 time-to-first-audio over the sliding window."""
+        cutoff = time.time() - self.window_seconds
+        with self._lock:
+            values = sorted(ttfa for finished_at, ttfa in self._window if finished_at >= cutoff)
+        return {
+            "window_seconds": self.window_seconds,
+            "turns": len(values),
+            "time_to_first_audio": {
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": values[-1] if values else None,
+            }
+        }
+    
+    def _export_loop(self):
+        while True:
+            trace = self._export_queue.get()
+            line = json.dumps(trace, default=str)
+            try:
+                if self.export_file:
+                    with open(self.export_file, 'a') as f:
+                        f.write(line + "\n")
+                if self.collector_url:
+                    request = urllib.request.Request(
+                        self.collector_url, data=line.encode('utf-8'),
+                        headers={"Content-Type": "application/json"}, method="POST"
+                    )
+                    urllib.request.urlopen(request, timeout=2).close()
+            except Exception as e:
+                print(f"[WARN] Failed to export turn trace {trace['turn_id']}: {e}")
+
+
+tracer = TurnTracer(
+    window_size=int(os.getenv('TRACE_WINDOW_SIZE', '1000')),
+    window_seconds=float(os.getenv('TRACE_WINDOW_SECONDS', '900')),
+    export_file=os.getenv('TRACE_EXPORT_FILE') or None,
+    collector_url=os.getenv('TRACE_COLLECTOR_URL') or None,
+)
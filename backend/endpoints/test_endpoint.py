@@ -1,13 +1,18 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from repository.mongo_repository import MongoRepository
+from repository.json_stream import iter_ndjson_chunks, parse_document_id
 from typing import Optional
+import os
 
 router = APIRouter()
 
 # Initialize MongoDB repository
 mongo_repo = MongoRepository()
 
+EXPORT_TOKEN = os.getenv('EXPORT_TOKEN')
+
 class TestRecord(BaseModel):
     name: str
     message: str
@@ -65,3 +70,32 @@ async def read_all_test_records():
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@router.get("/test/export")
+@router.get("/export/{collection}")
+async def export_records(request: Request, collection: str = "test_records", after: Optional[str] = None,
+                         before: Optional[str] = None, fields: Optional[str] = None,
+                         batch_size: int = 500, limit: int = 0):
+    """
+    Stream a collection (test records by default) as NDJSON in _id order.
+    Resume an interrupted export by passing the last received _id as `after`.
+    Disabled unless EXPORT_TOKEN is set; send it in the X-Export-Token header.
+    """
+    if not EXPORT_TOKEN:
+        raise HTTPException(status_code=404, detail="Export is disabled (set EXPORT_TOKEN)")
+    if request.headers.get('x-export-token') != EXPORT_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid export token")
+    if collection not in mongo_repo.EXPORT_COLLECTIONS:
+        raise HTTPException(status_code=404, detail="Unknown collection")
+    batch_size = min(max(batch_size, 1), 10000)
+    projection = {field.strip(): 1 for field in fields.split(',') if field.strip()} if fields else None
+    documents = mongo_repo.iter_documents(
+        collection,
+        projection=projection,
+        batch_size=batch_size,
+        after=parse_document_id(after) if after else None,
+        before=parse_document_id(before) if before else None,
+        limit=max(limit, 0)
+    )
+    return StreamingResponse(iter_ndjson_chunks(documents, batch_size), media_type="application/x-ndjson")
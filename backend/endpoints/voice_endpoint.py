@@ -2,6 +2,7 @@ import socketio
 from elevenlabs.client import ElevenLabs
 import os
 from dotenv import load_dotenv
+from metrics import time_stage, IN_FLIGHT
 
 load_dotenv()
 
@@ -17,10 +18,12 @@ client = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
 
 @sio.event
 async def connect(sid, environ):
+    IN_FLIGHT.labels('socketio').inc()
     print(f"Client connected: {sid}")
 
 @sio.event
 async def disconnect(sid):
+    IN_FLIGHT.labels('socketio').dec()
     print(f"Client disconnected: {sid}")
 
 @sio.event
@@ -33,11 +36,12 @@ async def audio_chunk(sid, data):
         # Transcribe using ElevenLabs
         # transcription = client.audio_native.transcribe(audio=audio_bytes)
         print("Starting transcription...")
-        transcription = client.speech_to_text.convert(
-            file = data,
-            model_id = "scribe_v1",
-            language_code = "eng"
-        )
+        with time_stage('stt'):
+            transcription = client.speech_to_text.convert(
+                file = data,
+                model_id = "scribe_v1",
+                language_code = "eng"
+            )
         print(f"Transcription result: {transcription}")
         # Send transcription back to client
         await sio.emit('transcription', {'text': transcription}, room=sid)
@@ -1,19 +1,54 @@
-from fastapi import FastAPI
+import os
+import sys
+
+# Modules shared with the agent API (metrics, profiling, json_stream) live in agent/.
+# It goes last on the path so backend's own repository and endpoints modules win.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'agent'))
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from contextlib import asynccontextmanager
 from endpoints.test_endpoint import router as test_router
 from endpoints.voice_endpoint import sio_app
 from repository.mongo_repository import MongoRepository
-import os
+from metrics import render_metrics, HTTP_DURATION, IN_FLIGHT, ERRORS
+from profiling import profiler
+from typing import Optional
+import asyncio
+import time
 
-app = FastAPI(title="Narrio API")
-
-# Initialize database with data files
+# Initialize database repository (the client connects lazily)
 repo = MongoRepository()
-repo.initialize_from_files(
-    users_file=os.path.join(os.path.dirname(__file__), 'users_data.json'),
-    groups_file=None,  # Will provide path later
-    chats_file=None    # Will provide path later
-)
+db_ready = False
+
+async def bootstrap_database():
+    """Seed the database with data files, retrying until MongoDB is reachable."""
+    global db_ready
+    retries = int(os.getenv('STARTUP_DB_RETRIES', '10'))
+    delay = float(os.getenv('STARTUP_DB_RETRY_DELAY', '1.0'))
+    for attempt in range(1, retries + 1):
+        try:
+            await asyncio.to_thread(
+                repo.initialize_from_files,
+                users_file=os.path.join(os.path.dirname(__file__), 'users_data.json'),
+                groups_file=None,  # Will provide path later
+                chats_file=None    # Will provide path later
+            )
+            db_ready = True
+            return
+        except Exception as e:
+            print(f"Database bootstrap attempt {attempt}/{retries} failed: {e}")
+            if attempt < retries:
+                await asyncio.sleep(min(delay * 2 ** (attempt - 1), 30.0))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    bootstrap_task = asyncio.create_task(bootstrap_database())
+    yield
+    bootstrap_task.cancel()
+
+app = FastAPI(title="Narrio API", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -24,6 +59,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Track in-flight HTTP requests and their latency per route."""
+    started = time.perf_counter()
+    status = 500
+    IN_FLIGHT.labels('http').inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        IN_FLIGHT.labels('http').dec()
+        route = request.scope.get('route')
+        route_path = route.path if route is not None else 'unmatched'
+        HTTP_DURATION.labels(request.method, route_path, str(status)).observe(time.perf_counter() - started)
+        if status >= 500:
+            ERRORS.labels('http').inc()
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Stack-sample selected requests into flamegraph files (off unless configured)."""
+    if not profiler.active:
+        return await call_next(request)
+    return await profiler.profile_request(request, call_next)
+
 # Include routers
 app.include_router(test_router, prefix="/api", tags=["test"])
 
@@ -35,6 +95,37 @@ async def root():
 async def health():
     return {"status": "healthy", "voice_service": "ready"}
 
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/profiling")
+async def profiling_status():
+    return profiler.status()
+
+@app.post("/profiling")
+async def configure_profiling(request: Request, requests: int = 0, sample_rate: Optional[float] = None):
+    profiler.require_admin(request.headers)
+    if requests:
+        profiler.arm(requests)
+    profiler.configure(sample_rate)
+    return profiler.status()
+
+@app.post("/profiling/capture")
+async def capture_profile(request: Request, seconds: float = 10.0):
+    profiler.require_admin(request.headers)
+    entry = await profiler.capture(min(max(seconds, 0.1), 300.0))
+    if entry is None:
+        raise HTTPException(status_code=409, detail="A profile is already being captured")
+    return entry
+
+@app.get("/ready")
+async def ready():
+    if not db_ready:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
 # Mount Socket.IO app for voice communication
 app.mount("/", sio_app)
 
@@ -1,12 +1,20 @@
 from pymongo import MongoClient
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Iterable
 import os
 from dotenv import load_dotenv
+from metrics import instrument_methods
 
 load_dotenv()
 
+@instrument_methods
 class MongoRepository:
+    # Not timed as queries: no database work, lazy cursors, or long bulk jobs
+    _UNTIMED_METHODS = frozenset({
+        "close", "iter_documents", "initialize_from_files",
+        "load_users_from_json", "load_groups_from_json", "load_group_chats_from_json",
+    })
+    
     def __init__(self, connection_string: str = None):
         if connection_string is None:
             connection_string = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
@@ -70,7 +78,7 @@ class MongoRepository:
             List of all records
         """
         try:
-            records = list(self.collection.find())
+            records = list(self.iter_documents(self.collection.name))
             for record in records:
                 record["_id"] = str(record["_id"])
             return records
@@ -82,6 +90,32 @@ class MongoRepository:
         """Close the MongoDB connection"""
         self.client.close()
     
+    # ========== EXPORT ==========
+    
+    EXPORT_COLLECTIONS = ("test_records", "users", "groups", "group_chats")
+    
+    def iter_documents(self, collection_name: str, projection: Optional[Dict[str, Any]] = None,
+                       batch_size: Optional[int] = None, after: Any = None, before: Any = None,
+                       limit: int = 0) -> Iterable[Dict[str, Any]]:
+        """
+        Stream a collection in _id order through a server-side cursor, batch_size
+        documents per round trip. `after`/`before` bound the _id range (exclusive),
+        so an interrupted export resumes from the last _id it received.
+        """
+        if batch_size is None:
+            batch_size = int(os.getenv('EXPORT_BATCH_SIZE', '500'))
+        id_range: Dict[str, Any] = {}
+        if after is not None:
+            id_range["$gt"] = after
+        if before is not None:
+            id_range["$lt"] = before
+        cursor = self.db[collection_name].find(
+            {"_id": id_range} if id_range else {}, projection or None
+        ).sort("_id", 1).batch_size(batch_size)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor
+    
     # ========== USERS ==========
     
     def add_user(self, user_data: Dict[str, Any]) -> str:
@@ -120,8 +154,8 @@ class MongoRepository:
         return self.users.find_one({"_id": user_id})
     
     def get_all_users(self) -> List[Dict[str, Any]]:
-        """Get all users."""
-        return list(self.users.find())
+        """Get all users (use iter_documents for large exports)."""
+        return list(self.iter_documents(self.users.name))
     
     def load_users_from_json(self, json_file_path: str):
         """Load initial users from JSON file if collection is empty."""
@@ -162,8 +196,8 @@ class MongoRepository:
         return self.groups.find_one({"_id": group_id})
     
     def get_all_groups(self) -> List[Dict[str, Any]]:
-        """Get all groups."""
-        return list(self.groups.find())
+        """Get all groups (use iter_documents for large exports)."""
+        return list(self.iter_documents(self.groups.name))
     
     def load_groups_from_json(self, json_file_path: str):
         """Load initial groups from JSON file if collection is empty."""
@@ -195,8 +229,8 @@ class MongoRepository:
         return self.group_chats.find_one({"_id": ObjectId(chat_id)})
     
     def get_all_group_chats(self) -> List[Dict[str, Any]]:
-        """Get all group chat messages."""
-        return list(self.group_chats.find())
+        """Get all group chats (use iter_documents for large exports)."""
+        return list(self.iter_documents(self.group_chats.name))
     
     def load_group_chats_from_json(self, json_file_path: str):
         """Load initial group chats from JSON file if collection is empty."""